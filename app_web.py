@@ -1,21 +1,53 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, session
+from flask import Flask, render_template, request, jsonify, send_file, send_from_directory, redirect, url_for, flash, session
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
 from datetime import datetime
+import hmac
+import io
 import os
+import sqlite3
 import sys
 from config import config
 from db_manager import DBManager
 from maestras_manager import MaestrasManager
-from pdf_generator import PDFGenerator
+from pdf_generator import PDFGenerator, FORMATOS_LOTE, formato_lote_disponible
 from auth_manager import AuthManager, login_required
 import rendiciones_manager
 import backup_manager
+import db_pool
+import migraciones
+import estadisticas_dashboard
+from cache_maestras import cache_maestras
+import exportador_excel
+import exportador_datos
+from registro_queries import RegistroQueries
+from cola_trabajos import ColaTrabajos, limpiar_archivos_antiguos
+from escritor_db import escritor_db
+from metricas_http import metricas_http
+import atexit
+import multiprocessing
 
 app = Flask(__name__)
 app.secret_key = config.secret_key
+# Límite del cuerpo de cada request: Werkzeug responde 413 sin leer el resto de la subida
+app.config['MAX_CONTENT_LENGTH'] = int(config.upload_max_mb * 1024 * 1024)
+# Latencia, SQL, filas y bytes por ruta (expuestos en /metrics y /admin/metricas)
+metricas_http.instalar(app)
 db_manager = DBManager()
 maestras_manager = MaestrasManager()
 pdf_generator = PDFGenerator()
 auth_manager = AuthManager()
+# Queries de reportes (queries/*.sql) leídas una vez; se releen solo si cambia el archivo
+queries_reportes = RegistroQueries()
+
+# Aplicar migraciones de esquema pendientes (índices)
+migraciones.aplicar_migraciones()
+
+# Cerrar las conexiones del pool al apagar el servidor
+atexit.register(db_pool.cerrar_pools)
+# Confirmar las escrituras encoladas antes (atexit ejecuta en orden inverso)
+atexit.register(escritor_db.detener)
+# Y antes de eso, los aciertos de la caché de PDFs acumulados en memoria
+atexit.register(pdf_generator.cache.guardar_accesos)
 
 # ========== HELPER FUNCTIONS ==========
 
@@ -28,24 +60,218 @@ def convertir_a_cero(valor):
     except (ValueError, TypeError):
         return 0
 
+def normalizar_comidas(comidas):
+    """Comidas del formulario en el formato que se guarda (texto en mayúsculas, números en 0 si vienen vacíos)"""
+    return [{
+        'guia_comida': str(comida.get('guia_comida', '')).upper(),
+        'descripcion': str(comida.get('descripcion', '')).upper(),
+        'kilo': convertir_a_cero(comida.get('kilo')),
+        'bultos': convertir_a_cero(comida.get('bultos')),
+        'proveedor': str(comida.get('proveedor', '')).upper()
+    } for comida in comidas or []]
+
 def cargar_query(nombre_archivo):
-    """Cargar query SQL desde archivo en carpeta queries/"""
+    """Obtener query SQL de la carpeta queries/ desde el registro (sin comentarios)"""
     try:
-        ruta_query = os.path.join(os.path.dirname(__file__), 'queries', nombre_archivo)
-        with open(ruta_query, 'r', encoding='utf-8') as f:
-            # Leer todo el contenido
-            contenido = f.read()
-            # Eliminar comentarios SQL (líneas que empiezan con --)
-            lineas = [linea for linea in contenido.split('\n') 
-                     if not linea.strip().startswith('--')]
-            # Unir y limpiar espacios extras
-            query = '\n'.join(lineas).strip()
-            return query
-    except FileNotFoundError:
+        return queries_reportes.obtener(nombre_archivo).sql
+    except KeyError:
         raise FileNotFoundError(f"No se encontró el archivo de query: {nombre_archivo}")
     except Exception as e:
         raise Exception(f"Error al cargar query {nombre_archivo}: {str(e)}")
 
+def respuesta_excel(filas, encabezados, nombre_hoja, nombre_archivo, color_encabezado, anchos=None, al_terminar=None):
+    """Respuesta HTTP que transmite un XLSX a medida que se recorren las filas"""
+    def generar():
+        try:
+            yield from exportador_excel.generar_xlsx(filas, encabezados, nombre_hoja, color_encabezado, anchos)
+        finally:
+            if al_terminar:
+                al_terminar()
+
+    respuesta = app.response_class(generar(), mimetype=exportador_excel.MIME_XLSX)
+    respuesta.headers.set('Content-Disposition', 'attachment', filename=nombre_archivo)
+    return respuesta
+
+def abrir_cursor(query, params=()):
+    """Ejecutar una query en una conexión del pool; el llamador debe cerrar la conexión"""
+    conn = db_manager.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+    except Exception:
+        conn.close()
+        raise
+    return conn, cursor
+
+def respuesta_excel_query(query, params, encabezados, nombre_hoja, nombre_archivo, color_encabezado, anchos=None):
+    """Ejecutar una query y transmitir su resultado como XLSX (la conexión se libera al terminar)"""
+    conn, cursor = abrir_cursor(query, params)
+    return respuesta_excel(
+        exportador_excel.filas_cursor(cursor), encabezados, nombre_hoja, nombre_archivo,
+        color_encabezado, anchos, al_terminar=conn.close
+    )
+
+# ========== TRABAJOS EN SEGUNDO PLANO ==========
+
+# Reportes generados por la cola de trabajos (se borran a los DIAS_RETENCION días)
+CARPETA_REPORTES_GENERADOS = os.path.join(config.base_dir, 'reportes_generados')
+
+# Segundos que /api/generar-pdf y /pdf/viaje esperan el PDF antes de responder 202 con el trabajo
+ESPERA_PDF_API = 5
+
+def respuesta_trabajo_en_curso(id_trabajo, deduplicado, **extra):
+    """Respuesta 202 con las URLs para consultar el trabajo y descargar su resultado"""
+    respuesta = jsonify({
+        'success': True,
+        'job_id': id_trabajo,
+        'deduplicado': deduplicado,
+        'estado_url': url_for('estado_trabajo', id_trabajo=id_trabajo),
+        'resultado_url': url_for('resultado_trabajo', id_trabajo=id_trabajo),
+        **extra
+    })
+    respuesta.status_code = 202
+    respuesta.headers['Location'] = url_for('estado_trabajo', id_trabajo=id_trabajo)
+    return respuesta
+
+def trabajo_pdf_viaje(parametros, progreso):
+    """Trabajo 'pdf_viaje': PDF completo de un viaje (una hoja por centro de costo)"""
+    numero_viaje = parametros['numero_viaje']
+    
+    preparado = pdf_generator.preparar_pdf_completo(numero_viaje)
+    if not preparado:
+        raise ValueError('No se encontraron centros de costo para este viaje')
+    
+    num_centros = preparado['num_centros']
+    if not preparado['archivo']:
+        progreso(10, f'Generando PDF de {num_centros} centro(s) de costo')
+        pdf_generator.dibujar_pdf_completo(preparado)
+    pdf_path = preparado['archivo']
+    
+    return {
+        'archivo': pdf_path,
+        'nombre_descarga': os.path.basename(pdf_path),
+        'mimetype': 'application/pdf',
+        'pdf_filename': os.path.basename(pdf_path),
+        'num_centros': num_centros,
+        'huella': preparado['huella'],
+        'message': f'PDF generado con {num_centros} hoja(s) - una por centro de costo'
+    }
+
+def trabajo_pdf_lote(parametros, progreso):
+    """Trabajo 'pdf_lote': PDFs de varios viajes (lista o rango de fechas) en un ZIP o un PDF unido"""
+    resultado = pdf_generator.generar_pdf_lote(
+        numeros_viaje=parametros.get('numeros_viaje'),
+        fecha_inicio=parametros.get('fecha_inicio'),
+        fecha_fin=parametros.get('fecha_fin'),
+        formato=parametros.get('formato', 'zip'),
+        progreso=progreso
+    )
+    resultado['nombre_descarga'] = os.path.basename(resultado['archivo'])
+    resultado['mimetype'] = 'application/zip' if resultado['formato'] == 'zip' else 'application/pdf'
+    resultado['message'] = f"Lote generado con {resultado['generados']} viaje(s) en {resultado['total_segundos']}s"
+    return resultado
+
+def trabajo_reporte(parametros, progreso):
+    """Trabajo 'reporte': query de queries/ exportada a XLSX, CSV, NDJSON o Parquet"""
+    import uuid
+    
+    consulta = queries_reportes.obtener(parametros['reporte'])
+    formato = parametros.get('formato', 'xlsx')
+    valores = parametros.get('parametros', {})
+    
+    if formato == 'xlsx':
+        extension, mimetype = 'xlsx', exportador_excel.MIME_XLSX
+    else:
+        extension, mimetype = exportador_datos.FORMATOS[formato]
+    
+    os.makedirs(CARPETA_REPORTES_GENERADOS, exist_ok=True)
+    ruta = os.path.join(CARPETA_REPORTES_GENERADOS, f'{uuid.uuid4().hex}.{extension}')
+    
+    parametros_sql = [valores.get(p) for p in consulta.parametros]
+    conn, cursor = abrir_cursor(consulta.sql, parametros_sql)
+    try:
+        columnas = [d[0] for d in cursor.description]
+        contador = {'filas': 0}
+        
+        def filas():
+            for fila in exportador_excel.filas_cursor(cursor):
+                contador['filas'] += 1
+                if contador['filas'] % 5000 == 0:
+                    progreso(50, f"{contador['filas']} filas procesadas")
+                yield fila
+        
+        if formato == 'xlsx':
+            partes = exportador_excel.generar_xlsx(filas(), columnas, consulta.nombre_descarga[:31])
+        else:
+            tipos = None
+            if formato == 'parquet':
+                progreso(10, 'Calculando tipos de columnas')
+                tipos = exportador_datos.tipos_columnas(conn, consulta.sql, parametros_sql, len(columnas))
+            partes = exportador_datos.generar(formato, columnas, filas(), tipos)
+        
+        # Escribir a un temporal y renombrar: nunca queda un archivo a medias con el nombre final
+        with open(ruta + '.tmp', 'wb') as f:
+            for parte in partes:
+                f.write(parte)
+        os.replace(ruta + '.tmp', ruta)
+    finally:
+        conn.close()
+        if os.path.exists(ruta + '.tmp'):
+            os.remove(ruta + '.tmp')
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return {
+        'archivo': ruta,
+        'nombre_descarga': f'{consulta.nombre_descarga}_{timestamp}.{extension}',
+        'mimetype': mimetype,
+        'filas': contador['filas'],
+        'message': f"Reporte generado con {contador['filas']} filas"
+    }
+
+# Cola de trabajos: PDFs y reportes pesados se generan fuera de los hilos de Waitress
+cola_trabajos = ColaTrabajos()
+cola_trabajos.registrar_tipo('pdf_viaje', trabajo_pdf_viaje)
+cola_trabajos.registrar_tipo('pdf_lote', trabajo_pdf_lote)
+cola_trabajos.registrar_tipo('reporte', trabajo_reporte)
+cola_trabajos.iniciar()
+limpiar_archivos_antiguos(CARPETA_REPORTES_GENERADOS)
+atexit.register(cola_trabajos.detener)
+
+def validar_trabajo(tipo, parametros):
+    """Validar un pedido de trabajo antes de encolarlo. Retorna (mensaje de error, código) o None."""
+    if tipo == 'pdf_viaje':
+        if not parametros.get('numero_viaje'):
+            return 'Debe indicar numero_viaje', 400
+    elif tipo == 'pdf_lote':
+        numeros = parametros.get('numeros_viaje')
+        if numeros is not None and (not isinstance(numeros, list) or not numeros):
+            return 'numeros_viaje debe ser una lista no vacía', 400
+        if numeros is None and not (parametros.get('fecha_inicio') and parametros.get('fecha_fin')):
+            return 'Debe indicar numeros_viaje o fecha_inicio y fecha_fin', 400
+        formato = parametros.get('formato', 'zip')
+        if formato not in FORMATOS_LOTE:
+            return f'Formato de lote no soportado: {formato}', 400
+        if not formato_lote_disponible(formato):
+            return 'Formato pdf no disponible (instalar pypdf)', 501
+    elif tipo == 'reporte':
+        nombre = parametros.get('reporte') or ''
+        try:
+            consulta = queries_reportes.obtener(nombre)
+        except KeyError:
+            return f'Reporte no encontrado: {nombre}', 404
+        formato = parametros.get('formato', 'xlsx')
+        if formato != 'xlsx' and formato not in exportador_datos.FORMATOS:
+            return f'Formato no soportado: {formato}', 400
+        if formato != 'xlsx' and not exportador_datos.formato_disponible(formato):
+            return 'Formato parquet no disponible (instalar pyarrow)', 501
+        valores = parametros.get('parametros') or {}
+        faltantes = [p for p in consulta.parametros if not valores.get(p)]
+        if faltantes:
+            return f'Faltan parámetros: {", ".join(faltantes)}', 400
+    else:
+        return f'Tipo de trabajo desconocido: {tipo}', 400
+    return None
+
 # ========== RUTAS DE AUTENTICACIÓN ==========
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -165,6 +391,78 @@ def api_eliminar_usuario():
     else:
         return jsonify({'success': False, 'message': message})
 
+@app.route('/api/estado-pool')
+@login_required
+def api_estado_pool():
+    """Health check y métricas del pool de conexiones SQLite y del escritor único"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Sin permisos'}), 403
+    
+    pools = [db_pool.obtener_pool(config.get_db_path()).verificar_salud()]
+    return jsonify({'success': all(p['ok'] for p in pools), 'pools': pools, 'escritor': escritor_db.estadisticas()})
+
+# ========== MÉTRICAS DE RENDIMIENTO ==========
+
+def metricas_componentes():
+    """Estado del escritor, el pool, las cachés y la cola como (nombre, tipo, ayuda, valor) para /metrics"""
+    escritor = escritor_db.estadisticas()
+    pool = db_pool.obtener_pool(config.get_db_path()).estadisticas()
+    maestras = cache_maestras.estadisticas()
+    pdfs = pdf_generator.cache.estadisticas()
+    trabajos = cola_trabajos.estadisticas()
+    return [
+        ('aratrack_escritor_en_cola', 'gauge', 'Escrituras esperando al escritor único', escritor['en_cola']),
+        ('aratrack_escritor_escrituras_total', 'counter', 'Escrituras confirmadas', escritor['escrituras']),
+        ('aratrack_escritor_fallidas_total', 'counter', 'Escrituras fallidas', escritor['fallidas']),
+        ('aratrack_escritor_commits_total', 'counter', 'Transacciones confirmadas', escritor['commits']),
+        ('aratrack_db_pool_abiertas', 'gauge', 'Conexiones SQLite abiertas', pool['abiertas']),
+        ('aratrack_db_pool_en_uso', 'gauge', 'Conexiones SQLite prestadas', pool['en_uso']),
+        ('aratrack_db_pool_esperas_total', 'counter', 'Esperas por pool agotado', pool['esperas']),
+        ('aratrack_cache_maestras_aciertos_total', 'counter', 'Aciertos de la caché de maestras', maestras['aciertos']),
+        ('aratrack_cache_maestras_fallos_total', 'counter', 'Fallos de la caché de maestras', maestras['fallos']),
+        ('aratrack_cache_pdf_aciertos_total', 'counter', 'PDFs servidos desde la caché', pdfs['aciertos']),
+        ('aratrack_cache_pdf_fallos_total', 'counter', 'PDFs generados', pdfs['fallos']),
+        ('aratrack_cache_pdf_bytes', 'gauge', 'Tamaño de la carpeta pdfs/', pdfs['bytes']),
+        ('aratrack_trabajos_en_curso', 'gauge', 'Trabajos de la cola ejecutándose', trabajos['en_curso'])
+    ]
+
+def metricas_autorizadas():
+    """Admin con sesión, el mismo equipo (localhost) o un scraper con ARATRACK_METRICAS_TOKEN"""
+    if session.get('username') == 'admin' or request.remote_addr in ('127.0.0.1', '::1'):
+        return True
+    token = config.metricas_token
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+@app.route('/metrics')
+def metrics():
+    """Métricas en formato de exposición de Prometheus"""
+    if not metricas_autorizadas():
+        return app.response_class('Sin permisos\n', status=403, mimetype='text/plain')
+    return app.response_class(metricas_http.prometheus(metricas_componentes()),
+                              content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/admin/metricas')
+@login_required
+def admin_metricas():
+    """Página de métricas por ruta (qué ruta consume más tiempo y cuánto es SQL)"""
+    if session.get('username') != 'admin':
+        flash('No tienes permisos para acceder a esta sección', 'error')
+        return redirect(url_for('index'))
+    resumen = metricas_http.resumen()
+    return render_template('metricas.html', resumen=resumen, componentes=metricas_componentes(),
+                           desde=datetime.fromtimestamp(resumen['desde']).strftime('%d/%m/%Y %H:%M'))
+
+# ========== CACHÉ DE MAESTRAS ==========
+
+def respuesta_maestra_cacheada(clave, tablas, cargar):
+    """Respuesta JSON de una maestra servida desde la caché, con ETag e If-None-Match (304)"""
+    entrada = cache_maestras.obtener(clave, tablas, cargar)
+    respuesta = app.response_class(entrada.cuerpo, mimetype='application/json')
+    respuesta.set_etag(entrada.etag)
+    # El navegador conserva la respuesta pero revalida siempre (las maestras pueden cambiar)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta.make_conditional(request)
+
 # ========== RUTAS PRINCIPALES (PROTEGIDAS) ==========
 
 @app.route('/')
@@ -176,9 +474,13 @@ def index():
 @login_required
 def nuevo_viaje():
     casinos = maestras_manager.obtener_todos_casinos()
-    choferes_data = maestras_manager.obtener_todos_los_choferes()
+    choferes_data = cache_maestras.obtener(
+        'choferes', ('maestras_choferes',), maestras_manager.obtener_todos_los_choferes
+    ).valor
     choferes = [c['nombre'] for c in choferes_data]
-    centros_costo = maestras_manager.obtener_todos_centros_costo()
+    centros_costo = cache_maestras.obtener(
+        'centros_costo', ('maestras_casinos',), maestras_manager.obtener_todos_centros_costo
+    ).valor
     conn = db_manager.get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT DISTINCT patente_camion FROM viajes WHERE patente_camion IS NOT NULL ORDER BY patente_camion')
@@ -216,8 +518,9 @@ def buscar_centros_costo(numero_viaje):
 @login_required
 def obtener_centros_costo():
     """Endpoint para obtener todos los centros de costo"""
-    centros = maestras_manager.obtener_todos_centros_costo()
-    return jsonify(centros)
+    return respuesta_maestra_cacheada(
+        'centros_costo', ('maestras_casinos',), maestras_manager.obtener_todos_centros_costo
+    )
 
 @app.route('/api/centro-costo-detalles/<int:codigo>')
 @login_required
@@ -239,8 +542,9 @@ def centro_costo_detalles(codigo):
 @app.route('/api/obtener-choferes-completo')
 @login_required
 def obtener_choferes_completo():
-    choferes = maestras_manager.obtener_todos_los_choferes()
-    return jsonify(choferes)
+    return respuesta_maestra_cacheada(
+        'choferes', ('maestras_choferes',), maestras_manager.obtener_todos_los_choferes
+    )
 
 @app.route('/test-cargar')
 def test_cargar():
@@ -334,36 +638,32 @@ def casino_por_centro(centro_costo):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _actualizar_casino(cursor, data):
+    cursor.execute("""
+        UPDATE casinos 
+        SET nombre = ?, ruta = ?
+        WHERE codigo = ?
+    """, (data.get('nombre'), data.get('ruta'), data.get('codigo')))
+
 @app.route('/api/actualizar-casino', methods=['POST'])
 def actualizar_casino():
     try:
-        data = request.json
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE casinos 
-            SET nombre = ?, ruta = ?
-            WHERE codigo = ?
-        """, (data.get('nombre'), data.get('ruta'), data.get('codigo')))
-        conn.commit()
-        conn.close()
+        escritor_db.ejecutar(_actualizar_casino, request.json)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _actualizar_conductor(cursor, data):
+    cursor.execute("""
+        UPDATE choferes 
+        SET celular = ?, rut = ?
+        WHERE nombre = ?
+    """, (data.get('celular'), data.get('rut'), data.get('nombre')))
+
 @app.route('/api/actualizar-conductor', methods=['POST'])
 def actualizar_conductor():
     try:
-        data = request.json
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE choferes 
-            SET celular = ?, rut = ?
-            WHERE nombre = ?
-        """, (data.get('celular'), data.get('rut'), data.get('nombre')))
-        conn.commit()
-        conn.close()
+        escritor_db.ejecutar(_actualizar_conductor, request.json)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -449,45 +749,25 @@ def guardar_viaje():
             'administrativo_responsable': str(data.get('administrativo_responsable', '')).upper()
         }
         
-        # Insertar viaje
-        result = db_manager.insert_viaje(viaje_data)
-        
-        if result:
-            # Insertar comidas preparadas con el centro de costo del viaje
-            comidas = data.get('comidas', [])
-            if comidas:
-                conn = db_manager.get_connection()
-                cursor = conn.cursor()
-                
-                for comida in comidas:
-                    cursor.execute("""
-                        INSERT INTO comidas_preparadas (
-                            numero_viaje, numero_centro_costo, guia_comida, 
-                            descripcion, kilo, bultos, proveedor
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        data.get('numero_viaje'),
-                        data.get('centro_costo'),
-                        str(comida.get('guia_comida', '')).upper(),
-                        str(comida.get('descripcion', '')).upper(),
-                        convertir_a_cero(comida.get('kilo')),
-                        convertir_a_cero(comida.get('bultos')),
-                        str(comida.get('proveedor', '')).upper()
-                    ))
-                
-                conn.commit()
-                conn.close()
-            
-            mensaje = f'Viaje {data.get("numero_viaje")} creado exitosamente'
-            if comidas:
-                mensaje += f' con {len(comidas)} comida(s) preparada(s)'
-            
-            return jsonify({'success': True, 'message': mensaje})
-        else:
-            return jsonify({'success': False, 'message': 'Error al guardar el viaje'}), 500
+        # Insertar viaje y comidas preparadas (con el centro de costo del viaje) en una sola transacción
+        comidas = normalizar_comidas(data.get('comidas'))
+        try:
+            viaje_id, ids_comidas = db_manager.guardar_viaje_con_comidas(viaje_data, comidas)
+        except sqlite3.IntegrityError:
+            return jsonify({
+                'success': False,
+                'message': f'El viaje {data.get("numero_viaje")} ya existe para el centro de costo {data.get("centro_costo")}'
+            }), 409
+        
+        mensaje = f'Viaje {data.get("numero_viaje")} creado exitosamente'
+        if comidas:
+            mensaje += f' con {len(comidas)} comida(s) preparada(s)'
+        
+        return jsonify({'success': True, 'message': mensaje, 'viaje_id': viaje_id, 'comidas_ids': ids_comidas})
         
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+        print(f"Error guardando viaje: {e}")
+        return jsonify({'success': False, 'message': 'Error al guardar el viaje'}), 500
 
 @app.route('/editar-viaje')
 @login_required
@@ -628,37 +908,14 @@ def actualizar_viaje():
             'administrativo_responsable': str(data.get('administrativo_responsable', '')).upper()
         }
         
-        # Actualizar viaje
-        db_manager.update_viaje_by_numero_centro(data.get('numero_viaje'), data.get('centro_costo'), viaje_data)
-        
-        # Actualizar comidas - eliminar las existentes e insertar las nuevas
-        db_manager.delete_comidas_by_viaje_centro(data.get('numero_viaje'), data.get('centro_costo'))
-        
-        comidas = data.get('comidas', [])
-        if comidas:
-            conn = db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            for comida in comidas:
-                cursor.execute("""
-                    INSERT INTO comidas_preparadas (
-                        numero_viaje, numero_centro_costo, guia_comida, 
-                        descripcion, kilo, bultos, proveedor
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    data.get('numero_viaje'),
-                    data.get('centro_costo'),
-                    str(comida.get('guia_comida', '')).upper(),
-                    str(comida.get('descripcion', '')).upper(),
-                    convertir_a_cero(comida.get('kilo')),
-                    convertir_a_cero(comida.get('bultos')),
-                    str(comida.get('proveedor', '')).upper()
-                ))
-            
-            conn.commit()
-            conn.close()
+        # Actualizar viaje y reemplazar sus comidas (eliminar las existentes e insertar las nuevas) en una sola transacción
+        ids_comidas = db_manager.actualizar_viaje_con_comidas(
+            data.get('numero_viaje'), data.get('centro_costo'), viaje_data, normalizar_comidas(data.get('comidas'))
+        )
+        if ids_comidas is None:
+            return jsonify({'success': False, 'message': 'Viaje no encontrado'}), 404
         
-        return jsonify({'success': True, 'message': 'Viaje actualizado correctamente'})
+        return jsonify({'success': True, 'message': 'Viaje actualizado correctamente', 'comidas_ids': ids_comidas})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -740,198 +997,32 @@ def reportes():
 def get_administrativos():
     """API para obtener lista de administrativos"""
     try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT nombre FROM maestras_administrativos ORDER BY nombre')
-        administrativos = [{'nombre': row[0]} for row in cursor.fetchall()]
-        conn.close()
-        return jsonify(administrativos)
+        return respuesta_maestra_cacheada(
+            'administrativos', ('maestras_administrativos',),
+            lambda: [{'nombre': nombre} for nombre in maestras_manager.listar_administrativos_nombres()]
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/dashboard/estadisticas')
 @login_required
 def get_estadisticas_dashboard():
-    """API para obtener estadísticas del dashboard"""
+    """API para obtener estadísticas del dashboard (ver estadisticas_dashboard)"""
     try:
-        from datetime import datetime, timedelta
-        
         fecha_inicio = request.args.get('fecha_inicio')
         fecha_fin = request.args.get('fecha_fin')
         administrativo = request.args.get('administrativo', '')
         vista = request.args.get('vista', 'diaria')
         
         conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Query base
-        where_clause = "WHERE fecha BETWEEN ? AND ?"
-        params = [fecha_inicio, fecha_fin]
-        
-        if administrativo:
-            where_clause += " AND administrativo_responsable = ?"
-            params.append(administrativo)
-        
-        # Resumen general - Solo activos y validaciones requeridas
-        cursor.execute(f'''
-            SELECT 
-                COUNT(*) as total_bitacoras,
-                COUNT(DISTINCT numero_viaje) as viajes_unicos,
-                SUM(CASE WHEN check_congelado = 'X' THEN 1 ELSE 0 END) as check_congelado,
-                SUM(CASE WHEN check_refrigerado = 'X' THEN 1 ELSE 0 END) as check_refrigerado,
-                SUM(CASE WHEN check_abarrote = 'X' THEN 1 ELSE 0 END) as check_abarrote,
-                SUM(CASE WHEN check_implementos = 'X' THEN 1 ELSE 0 END) as check_implementos,
-                SUM(CASE WHEN check_aseo = 'X' THEN 1 ELSE 0 END) as check_aseo,
-                SUM(CASE WHEN check_trazabilidad = 'X' THEN 1 ELSE 0 END) as check_trazabilidad,
-                COALESCE(SUM(CAST(COALESCE(num_wencos, '0') AS INTEGER)), 0) as total_wencos,
-                COALESCE(SUM(CAST(COALESCE(bin, '0') AS INTEGER)), 0) as total_bin,
-                COALESCE(SUM(CAST(COALESCE(pallets, '0') AS INTEGER)), 0) as pallets_std,
-                COALESCE(SUM(CAST(COALESCE(pallets_chep, '0') AS INTEGER)), 0) as pallets_chep,
-                COALESCE(SUM(CAST(COALESCE(pallets_pl_negro_grueso, '0') AS INTEGER)), 0) as pallets_negro_grueso,
-                COALESCE(SUM(CAST(COALESCE(pallets_pl_negro_alternativo, '0') AS INTEGER)), 0) as pallets_negro_alternativo
-            FROM viajes
-            {where_clause}
-        ''', params)
-        
-        resumen = cursor.fetchone()
-        
-        # Calcular total de pallets (ajustado por nuevo índice)
-        total_pallets = (resumen[10] or 0) + (resumen[11] or 0) + (resumen[12] or 0) + (resumen[13] or 0)
-        
-        # Tendencia temporal según vista
-        if vista == 'diaria':
-            group_format = '%Y-%m-%d'
-        elif vista == 'semanal':
-            group_format = '%Y-W%W'
-        else:  # mensual
-            group_format = '%Y-%m'
-        
-        cursor.execute(f'''
-            SELECT 
-                strftime('{group_format}', fecha) as periodo,
-                COUNT(*) as total_bitacoras,
-                COUNT(DISTINCT numero_viaje) as viajes_unicos
-            FROM viajes
-            {where_clause}
-            GROUP BY periodo
-            ORDER BY periodo
-        ''', params)
-        
-        tendencia = [{'periodo': row[0], 'total_bitacoras': row[1], 'viajes_unicos': row[2]} for row in cursor.fetchall()]
-        
-        # Tendencia por tipos - incluir las 6 validaciones
-        cursor.execute(f'''
-            SELECT 
-                strftime('{group_format}', fecha) as periodo,
-                SUM(CASE WHEN check_congelado = 'X' THEN 1 ELSE 0 END) as congelado,
-                SUM(CASE WHEN check_refrigerado = 'X' THEN 1 ELSE 0 END) as refrigerado,
-                SUM(CASE WHEN check_abarrote = 'X' THEN 1 ELSE 0 END) as abarrote,
-                SUM(CASE WHEN check_implementos = 'X' THEN 1 ELSE 0 END) as implementos,
-                SUM(CASE WHEN check_aseo = 'X' THEN 1 ELSE 0 END) as aseo,
-                SUM(CASE WHEN check_trazabilidad = 'X' THEN 1 ELSE 0 END) as trazabilidad
-            FROM viajes
-            {where_clause}
-            GROUP BY periodo
-            ORDER BY periodo
-        ''', params)
-        
-        tendencia_tipos = [{'periodo': row[0], 'congelado': row[1], 'refrigerado': row[2], 'abarrote': row[3], 'implementos': row[4], 'aseo': row[5], 'trazabilidad': row[6]} for row in cursor.fetchall()]
-        
-        # Por administrativo
-        cursor.execute(f'''
-            SELECT 
-                COALESCE(administrativo_responsable, 'Sin asignar') as administrativo,
-                COUNT(*) as total_bitacoras,
-                COUNT(DISTINCT numero_viaje) as viajes_unicos
-            FROM viajes
-            {where_clause}
-            GROUP BY administrativo_responsable
-            ORDER BY total_bitacoras DESC
-        ''', params)
-        
-        por_administrativo = [{'administrativo': row[0], 'total_bitacoras': row[1], 'viajes_unicos': row[2]} for row in cursor.fetchall()]
-        
-        # Top 10 casinos
-        cursor.execute(f'''
-            SELECT 
-                COALESCE(casino, 'Sin especificar') as casino,
-                COUNT(*) as total
-            FROM viajes
-            {where_clause}
-            GROUP BY casino
-            ORDER BY total DESC
-            LIMIT 10
-        ''', params)
-        
-        top_casinos = [{'casino': row[0], 'total': row[1]} for row in cursor.fetchall()]
-        
-        # Detalle para tabla con pallets y wencos totales
-        cursor.execute(f'''
-            SELECT 
-                strftime('{group_format}', fecha) as periodo,
-                COALESCE(administrativo_responsable, 'Sin asignar') as administrativo,
-                COUNT(*) as total_bitacoras,
-                COUNT(DISTINCT numero_viaje) as viajes_unicos,
-                SUM(CASE WHEN check_congelado = 'X' THEN 1 ELSE 0 END) as congelado,
-                SUM(CASE WHEN check_refrigerado = 'X' THEN 1 ELSE 0 END) as refrigerado,
-                SUM(CASE WHEN check_abarrote = 'X' THEN 1 ELSE 0 END) as abarrote,
-                SUM(CASE WHEN check_implementos = 'X' THEN 1 ELSE 0 END) as implementos,
-                SUM(CASE WHEN check_aseo = 'X' THEN 1 ELSE 0 END) as aseo,
-                SUM(CASE WHEN check_trazabilidad = 'X' THEN 1 ELSE 0 END) as trazabilidad,
-                COALESCE(SUM(
-                    CAST(COALESCE(pallets, '0') AS INTEGER) +
-                    CAST(COALESCE(pallets_chep, '0') AS INTEGER) +
-                    CAST(COALESCE(pallets_pl_negro_grueso, '0') AS INTEGER) +
-                    CAST(COALESCE(pallets_pl_negro_alternativo, '0') AS INTEGER)
-                ), 0) as pallets,
-                COALESCE(SUM(CAST(COALESCE(num_wencos, '0') AS INTEGER)), 0) as wencos
-            FROM viajes
-            {where_clause}
-            GROUP BY periodo, administrativo_responsable
-            ORDER BY periodo DESC, total_bitacoras DESC
-        ''', params)
-        
-        detalle = [{
-            'periodo': row[0],
-            'administrativo': row[1],
-            'total_bitacoras': row[2],
-            'viajes_unicos': row[3],
-            'congelado': row[4],
-            'refrigerado': row[5],
-            'abarrote': row[6],
-            'implementos': row[7],
-            'aseo': row[8],
-            'trazabilidad': row[9],
-            'pallets': row[10],
-            'wencos': row[11]
-        } for row in cursor.fetchall()]
-        
-        conn.close()
+        try:
+            estadisticas = estadisticas_dashboard.calcular_estadisticas(
+                conn, fecha_inicio, fecha_fin, administrativo, vista
+            )
+        finally:
+            conn.close()
         
-        return jsonify({
-            'resumen': {
-                'total_bitacoras': resumen[0],
-                'viajes_unicos': resumen[1],
-                'check_congelado': resumen[2],
-                'check_refrigerado': resumen[3],
-                'check_abarrote': resumen[4],
-                'check_implementos': resumen[5],
-                'check_aseo': resumen[6],
-                'check_trazabilidad': resumen[7],
-                'total_wencos': resumen[8],
-                'total_bin': resumen[9],
-                'pallets_std': resumen[10],
-                'pallets_chep': resumen[11],
-                'pallets_negro_grueso': resumen[12],
-                'pallets_negro_alternativo': resumen[13],
-                'total_pallets': total_pallets
-            },
-            'tendencia': tendencia,
-            'tendencia_tipos': tendencia_tipos,
-            'por_administrativo': por_administrativo,
-            'top_casinos': top_casinos,
-            'detalle': detalle
-        })
+        return jsonify(estadisticas)
         
     except Exception as e:
         print(f"Error en dashboard: {str(e)}")
@@ -942,65 +1033,20 @@ def get_estadisticas_dashboard():
 def descargar_reporte_casinos():
     """Generar y descargar reporte Excel de la maestra de casinos"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
         from datetime import datetime
         
-        # Cargar query desde archivo
-        query = cargar_query('reporte_maestra_casinos.sql')
-        
-        # Ejecutar consulta
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(query)
-        casinos_data = cursor.fetchall()
-        conn.close()
-        
-        # Crear libro de Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Maestra Casinos"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
         # Encabezados
         headers = ['CÓDIGO CENTRO COSTO', 'CASINO', 'RUTA']
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Datos
-        for row_num, casino in enumerate(casinos_data, 2):
-            ws.cell(row=row_num, column=1, value=casino[0])  # codigo_costo
-            ws.cell(row=row_num, column=2, value=casino[1])  # casino
-            ws.cell(row=row_num, column=3, value=casino[2])  # ruta
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 25
-        ws.column_dimensions['B'].width = 40
-        ws.column_dimensions['C'].width = 30
-        
-        # Guardar en memoria
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
         
         # Nombre del archivo con fecha
         fecha = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'Maestra_Casinos_{fecha}.xlsx'
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+        # Las filas se leen del cursor mientras se transmite el archivo
+        return respuesta_excel_query(
+            cargar_query('reporte_maestra_casinos.sql'), (),
+            headers, "Maestra Casinos", filename, "4472C4",
+            anchos=[25, 40, 30]
         )
         
     except Exception as e:
@@ -1011,65 +1057,20 @@ def descargar_reporte_casinos():
 def descargar_reporte_choferes():
     """Generar y descargar reporte Excel de la maestra de choferes"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
         from datetime import datetime
         
-        # Cargar query desde archivo
-        query = cargar_query('reporte_maestra_choferes.sql')
-        
-        # Ejecutar consulta
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(query)
-        choferes_data = cursor.fetchall()
-        conn.close()
-        
-        # Crear libro de Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Maestra Choferes"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="70AD47", end_color="70AD47", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
         # Encabezados
         headers = ['NOMBRE', 'RUT', 'CELULAR']
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Datos
-        for row_num, chofer in enumerate(choferes_data, 2):
-            ws.cell(row=row_num, column=1, value=chofer[0])  # nombre
-            ws.cell(row=row_num, column=2, value=chofer[1])  # rut
-            ws.cell(row=row_num, column=3, value=chofer[2])  # celular
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 40
-        ws.column_dimensions['B'].width = 20
-        ws.column_dimensions['C'].width = 20
-        
-        # Guardar en memoria
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
         
         # Nombre del archivo con fecha
         fecha = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'Maestra_Choferes_{fecha}.xlsx'
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+        # Las filas se leen del cursor mientras se transmite el archivo
+        return respuesta_excel_query(
+            cargar_query('reporte_maestra_choferes.sql'), (),
+            headers, "Maestra Choferes", filename, "70AD47",
+            anchos=[40, 20, 20]
         )
         
     except Exception as e:
@@ -1080,9 +1081,6 @@ def descargar_reporte_choferes():
 def descargar_reporte_comidas():
     """Generar y descargar reporte Excel de comidas e implementos por rango de fechas"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
         from datetime import datetime
         
         # Obtener parámetros de fechas
@@ -1092,75 +1090,19 @@ def descargar_reporte_comidas():
         if not fecha_inicio or not fecha_fin:
             return jsonify({'success': False, 'message': 'Debe proporcionar fecha de inicio y fin'}), 400
         
-        # Cargar query desde archivo
-        query = cargar_query('reporte_comidas_implementos.sql')
-        
-        # Ejecutar consulta
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, (fecha_inicio, fecha_fin))
-        comidas = cursor.fetchall()
-        conn.close()
-        
-        # Crear libro de Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Comidas e Implementos"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="FF6B35", end_color="FF6B35", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
         # Encabezados
         headers = ['FECHA', 'NRO VIAJE', 'CASINO', 'CONDUCTOR', 'CENTRO COSTO', 
                    'GUÍA COMIDA', 'DESCRIPCIÓN', 'KILOS', 'BULTOS', 'PROVEEDOR']
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Datos
-        for row_num, comida in enumerate(comidas, 2):
-            ws.cell(row=row_num, column=1, value=comida[0])  # fecha
-            ws.cell(row=row_num, column=2, value=comida[1])  # numero_viaje
-            ws.cell(row=row_num, column=3, value=comida[2])  # casino
-            ws.cell(row=row_num, column=4, value=comida[3])  # conductor
-            ws.cell(row=row_num, column=5, value=comida[4])  # numero_centro_costo
-            ws.cell(row=row_num, column=6, value=comida[5])  # guia_comida
-            ws.cell(row=row_num, column=7, value=comida[6])  # descripcion
-            ws.cell(row=row_num, column=8, value=comida[7])  # kilo
-            ws.cell(row=row_num, column=9, value=comida[8])  # bultos
-            ws.cell(row=row_num, column=10, value=comida[9]) # proveedor
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 12  # Fecha
-        ws.column_dimensions['B'].width = 15  # Nro Viaje
-        ws.column_dimensions['C'].width = 30  # Casino
-        ws.column_dimensions['D'].width = 30  # Conductor
-        ws.column_dimensions['E'].width = 15  # Centro Costo
-        ws.column_dimensions['F'].width = 15  # Guía Comida
-        ws.column_dimensions['G'].width = 40  # Descripción
-        ws.column_dimensions['H'].width = 10  # Kilos
-        ws.column_dimensions['I'].width = 10  # Bultos
-        ws.column_dimensions['J'].width = 25  # Proveedor
-        
-        # Guardar en memoria
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
         
         # Nombre del archivo con fechas y timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'Comidas_Implementos_{fecha_inicio}_al_{fecha_fin}_{timestamp}.xlsx'
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+        # Las filas se leen del cursor mientras se transmite el archivo
+        return respuesta_excel_query(
+            cargar_query('reporte_comidas_implementos.sql'), (fecha_inicio, fecha_fin),
+            headers, "Comidas e Implementos", filename, "FF6B35",
+            anchos=[12, 15, 30, 30, 15, 15, 40, 10, 10, 25]
         )
         
     except Exception as e:
@@ -1171,9 +1113,6 @@ def descargar_reporte_comidas():
 def descargar_reporte_viajes():
     """Generar y descargar reporte Excel de viajes completos por rango de fechas"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
         from datetime import datetime
         
         # Obtener parámetros de fechas
@@ -1183,26 +1122,6 @@ def descargar_reporte_viajes():
         if not fecha_inicio or not fecha_fin:
             return jsonify({'success': False, 'message': 'Debe proporcionar fecha de inicio y fin'}), 400
         
-        # Cargar query desde archivo
-        query = cargar_query('reporte_viajes_completos.sql')
-        
-        # Ejecutar consulta
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, (fecha_inicio, fecha_fin))
-        viajes_data = cursor.fetchall()
-        conn.close()
-        
-        # Crear libro de Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Viajes Completos"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="9B59B6", end_color="9B59B6", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
         # Encabezados (todos los campos de viajes) - ORDEN CORRECTO SEGÚN TABLA DB
         headers = [
             'NRO VIAJE', 'CASINO', 'RUTA', 'TIPO CAMIÓN', 'PATENTE CAMIÓN', 'PATENTE SEMI',
@@ -1220,45 +1139,14 @@ def descargar_reporte_viajes():
             'SELLO RET 5P', 'CERT FUMIGACIÓN', 'REVISIÓN LIMPIEZA', 'ADMIN RESPONSABLE'
         ]
         
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Datos
-        for row_num, viaje in enumerate(viajes_data, 2):
-            for col_num, valor in enumerate(viaje, 1):
-                ws.cell(row=row_num, column=col_num, value=valor)
-        
-        # Ajustar anchos de columna (generales)
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column].width = adjusted_width
-        
-        # Guardar en memoria
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
         # Nombre del archivo con fechas y timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'Viajes_Completos_{fecha_inicio}_al_{fecha_fin}_{timestamp}.xlsx'
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+        # Las filas se leen del cursor mientras se transmite el archivo
+        return respuesta_excel_query(
+            cargar_query('reporte_viajes_completos.sql'), (fecha_inicio, fecha_fin),
+            headers, "Viajes Completos", filename, "9B59B6"
         )
         
     except Exception as e:
@@ -1269,9 +1157,6 @@ def descargar_reporte_viajes():
 def descargar_reporte_facturacion():
     """Generar y descargar reporte Excel de facturación por rango de fechas"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
         from datetime import datetime
         
         # Obtener parámetros de fechas
@@ -1281,26 +1166,6 @@ def descargar_reporte_facturacion():
         if not fecha_inicio or not fecha_fin:
             return jsonify({'success': False, 'message': 'Debe proporcionar fecha de inicio y fin'}), 400
         
-        # Cargar query desde archivo
-        query = cargar_query('reporte_facturacion.sql')
-        
-        # Ejecutar consulta
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, (fecha_inicio, fecha_fin))
-        facturacion_data = cursor.fetchall()
-        conn.close()
-        
-        # Crear libro de Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Facturación"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="16A085", end_color="16A085", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
         # Encabezados
         headers = [
             'NRO VIAJE', 'CASINO', 'CÓDIGO COSTO', 'FECHA', 'WENCOS', 'BIN',
@@ -1308,45 +1173,49 @@ def descargar_reporte_facturacion():
             'GUÍAS'
         ]
         
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Datos
-        for row_num, factura in enumerate(facturacion_data, 2):
-            for col_num, valor in enumerate(factura, 1):
-                ws.cell(row=row_num, column=col_num, value=valor)
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 15  # Nro Viaje
-        ws.column_dimensions['B'].width = 35  # Casino
-        ws.column_dimensions['C'].width = 15  # Código Costo
-        ws.column_dimensions['D'].width = 12  # Fecha
-        ws.column_dimensions['E'].width = 10  # Wencos
-        ws.column_dimensions['F'].width = 10  # Bin
-        ws.column_dimensions['G'].width = 10  # Pallets
-        ws.column_dimensions['H'].width = 15  # Pallets CHEP
-        ws.column_dimensions['I'].width = 20  # Pallets Negro Grueso
-        ws.column_dimensions['J'].width = 20  # Pallets Negro Alt
-        ws.column_dimensions['K'].width = 60  # Guías
-        
-        # Guardar en memoria
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
         # Nombre del archivo con fechas y timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'Facturacion_{fecha_inicio}_al_{fecha_fin}_{timestamp}.xlsx'
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+        # Las filas se leen del cursor mientras se transmite el archivo
+        return respuesta_excel_query(
+            cargar_query('reporte_facturacion.sql'), (fecha_inicio, fecha_fin),
+            headers, "Facturación", filename, "16A085",
+            anchos=[15, 35, 15, 12, 10, 10, 10, 15, 20, 20, 60]
+        )
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/descargar-reporte-facturacion-resumen')
+@login_required
+def descargar_reporte_facturacion_resumen():
+    """Generar y descargar resumen Excel de facturación por día y casino (desde el rollup diario)"""
+    try:
+        from datetime import datetime
+        
+        # Obtener parámetros de fechas
+        fecha_inicio = request.args.get('fecha_inicio')
+        fecha_fin = request.args.get('fecha_fin')
+
+        if not fecha_inicio or not fecha_fin:
+            return jsonify({'success': False, 'message': 'Debe proporcionar fecha de inicio y fin'}), 400
+
+        # Encabezados
+        headers = [
+            'FECHA', 'CASINO', 'BITÁCORAS', 'WENCOS', 'BIN',
+            'PALLETS', 'PALLETS CHEP', 'PALLETS NEGRO GRUESO', 'PALLETS NEGRO ALT'
+        ]
+        
+        # Nombre del archivo con fechas y timestamp
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f'Facturacion_Resumen_{fecha_inicio}_al_{fecha_fin}_{timestamp}.xlsx'
+        
+        # Las filas se leen del cursor mientras se transmite el archivo
+        return respuesta_excel_query(
+            cargar_query('reporte_facturacion_resumen.sql'), (fecha_inicio, fecha_fin),
+            headers, "Resumen Facturación", filename, "16A085",
+            anchos=[12, 35, 12, 10, 10, 10, 15, 20, 20]
         )
         
     except Exception as e:
@@ -1357,9 +1226,6 @@ def descargar_reporte_facturacion():
 def descargar_reporte_facturacion_diaria():
     """Generar y descargar reporte Excel de control de activos diario"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
         from datetime import datetime
         
         # Obtener parámetro de fecha
@@ -1368,85 +1234,98 @@ def descargar_reporte_facturacion_diaria():
         if not fecha:
             return jsonify({'success': False, 'message': 'Debe proporcionar la fecha'}), 400
         
-        # Cargar query desde archivo
-        query = cargar_query('reporte_control_activos_diario.sql')
-        
-        # Ejecutar consulta
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, (fecha,))
-        facturacion_data = cursor.fetchall()
-        conn.close()
-        
-        # Crear libro de Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Control Activos Diario"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="E74C3C", end_color="E74C3C", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
         # Encabezados
         headers = [
             'NRO VIAJE', 'CASINO', 'CÓDIGO COSTO', 'FECHA', 'WENCOS', 'BIN',
             'PALLETS', 'PALLETS CHEP', 'PALLETS NEGRO GRUESO', 'PALLETS NEGRO ALT'
         ]
         
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Datos
-        for row_num, factura in enumerate(facturacion_data, 2):
-            for col_num, valor in enumerate(factura, 1):
-                ws.cell(row=row_num, column=col_num, value=valor)
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 15  # Nro Viaje
-        ws.column_dimensions['B'].width = 35  # Casino
-        ws.column_dimensions['C'].width = 15  # Código Costo
-        ws.column_dimensions['D'].width = 12  # Fecha
-        ws.column_dimensions['E'].width = 10  # Wencos
-        ws.column_dimensions['F'].width = 10  # Bin
-        ws.column_dimensions['G'].width = 10  # Pallets
-        ws.column_dimensions['H'].width = 15  # Pallets CHEP
-        ws.column_dimensions['I'].width = 20  # Pallets Negro Grueso
-        ws.column_dimensions['J'].width = 20  # Pallets Negro Alt
-        
-        # Guardar en memoria
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
         # Nombre del archivo con fecha y timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'Control_Activos_Diario_{fecha}_{timestamp}.xlsx'
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+        # Las filas se leen del cursor mientras se transmite el archivo
+        return respuesta_excel_query(
+            cargar_query('reporte_control_activos_diario.sql'), (fecha,),
+            headers, "Control Activos Diario", filename, "E74C3C",
+            anchos=[15, 35, 15, 12, 10, 10, 10, 15, 20, 20]
         )
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/reportes')
+@login_required
+def listar_reportes():
+    """Listar las queries de reportes con sus parámetros y columnas de salida"""
+    try:
+        queries_reportes.recargar()
+        conn = db_manager.get_connection()
+        try:
+            reportes = [consulta.metadatos(conn) for consulta in queries_reportes.listar()]
+        finally:
+            conn.close()
+        return jsonify({
+            'success': True,
+            'formatos': [f for f in exportador_datos.FORMATOS if exportador_datos.formato_disponible(f)],
+            'reportes': reportes
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/reportes/<nombre>')
+@login_required
+def exportar_reporte(nombre):
+    """Exportar un reporte de queries/ como CSV, NDJSON o Parquet (?format=csv|ndjson|parquet)"""
+    try:
+        from datetime import datetime
+        
+        try:
+            consulta = queries_reportes.obtener(nombre)
+        except KeyError:
+            return jsonify({'success': False, 'message': f'Reporte no encontrado: {nombre}'}), 404
+        
+        formato = request.args.get('format', 'csv').lower()
+        if formato not in exportador_datos.FORMATOS:
+            return jsonify({'success': False, 'message': f'Formato no soportado: {formato}'}), 400
+        if not exportador_datos.formato_disponible(formato):
+            return jsonify({'success': False, 'message': 'Formato parquet no disponible (instalar pyarrow)'}), 501
+        
+        faltantes = [p for p in consulta.parametros if not request.args.get(p)]
+        if faltantes:
+            return jsonify({'success': False, 'message': f'Faltan parámetros: {", ".join(faltantes)}'}), 400
+        
+        parametros_sql = [request.args.get(p) for p in consulta.parametros]
+        conn, cursor = abrir_cursor(consulta.sql, parametros_sql)
+        columnas = [d[0] for d in cursor.description]
+        try:
+            # Parquet: esquema según la consulta completa (antes de enviar el primer byte)
+            tipos = (exportador_datos.tipos_columnas(conn, consulta.sql, parametros_sql, len(columnas))
+                     if formato == 'parquet' else None)
+        except Exception:
+            conn.close()
+            raise
+        
+        def generar():
+            try:
+                yield from exportador_datos.generar(formato, columnas, exportador_excel.filas_cursor(cursor), tipos)
+            finally:
+                conn.close()
+        
+        extension, mimetype = exportador_datos.FORMATOS[formato]
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        respuesta = app.response_class(generar(), mimetype=mimetype)
+        respuesta.headers.set('Content-Disposition', 'attachment', filename=f'{consulta.nombre_descarga}_{timestamp}.{extension}')
+        return respuesta
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/descargar-reporte-rendiciones')
 @login_required
 def descargar_reporte_rendiciones():
     """Generar y descargar reporte Excel de rendiciones por rango de fechas"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
-        from datetime import datetime
-        
         # Obtener parámetros
         fecha_inicio = request.args.get('fecha_inicio')
         fecha_fin = request.args.get('fecha_fin')
@@ -1457,71 +1336,31 @@ def descargar_reporte_rendiciones():
         # Obtener datos
         rendiciones = rendiciones_manager.obtener_rendiciones_por_fecha(fecha_inicio, fecha_fin)
         
-        # Crear libro de Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Rendiciones"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="6366F1", end_color="6366F1", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
         # Encabezados
         headers = [
             'N° VIAJE', 'PDT', 'RUTA',
             'FECHA CREACIÓN', 'FECHA MODIFICACIÓN', 'ESTADO RENDICIÓN'
         ]
         
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Datos
-        for row_num, rendicion in enumerate(rendiciones, 2):
-            ws.cell(row=row_num, column=1, value=rendicion['nro_viaje'])
-            ws.cell(row=row_num, column=2, value=rendicion['pdt'])
-            ws.cell(row=row_num, column=3, value=rendicion['ruta'])
-            ws.cell(row=row_num, column=4, value=rendicion['fecha_creacion'])
-            ws.cell(row=row_num, column=5, value=rendicion['fecha_modificacion'])
-            ws.cell(row=row_num, column=6, value=rendicion['estado_rendicion'])
-        
-        # Ajustar anchos de columna
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[column].width = adjusted_width
-        
-        # Guardar en memoria
-        excel_file = BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
-        
-        # Crear respuesta
-        response = send_file(
-            excel_file,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'Rendiciones_{fecha_inicio}_a_{fecha_fin}.xlsx'
+        filas = (
+            (r['nro_viaje'], r['pdt'], r['ruta'], r['fecha_creacion'], r['fecha_modificacion'], r['estado_rendicion'])
+            for r in rendiciones
         )
         
-        return response
+        return respuesta_excel(
+            filas, headers, "Rendiciones", f'Rendiciones_{fecha_inicio}_a_{fecha_fin}.xlsx', "6366F1"
+        )
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/generar-pdf', methods=['POST'])
 def generar_pdf_api():
+    """
+    Generar el PDF de un viaje (pasa por la cola de trabajos).
+    Si termina dentro de ESPERA_PDF_API segundos responde con el archivo; si no,
+    202 con el trabajo para consultar su estado sin ocupar un hilo de Waitress.
+    """
     try:
         numero_viaje = request.json.get('numero_viaje')
         
@@ -1530,23 +1369,130 @@ def generar_pdf_api():
         if not centros:
             return jsonify({'success': False, 'message': 'No se encontraron centros de costo para este viaje'}), 404
         
-        # Generar PDF completo usando la nueva función
-        pdf_path = pdf_generator.generar_pdf_completo(numero_viaje)
+        # La cola limita cuántos PDFs se generan a la vez y une pedidos repetidos del mismo viaje
+        id_trabajo, deduplicado = cola_trabajos.enviar('pdf_viaje', {'numero_viaje': numero_viaje},
+                                                       session.get('username'))
+        trabajo = cola_trabajos.esperar(id_trabajo, timeout=ESPERA_PDF_API)
         
-        if pdf_path and os.path.exists(pdf_path):
-            num_centros = len(centros)
+        if trabajo['estado'] == 'completado':
+            resultado = trabajo['resultado']
             return jsonify({
                 'success': True, 
-                'pdf_filename': os.path.basename(pdf_path),
-                'message': f'PDF generado con {num_centros} hoja(s) - una por centro de costo'
+                'pdf_filename': resultado['pdf_filename'],
+                'message': resultado['message']
             })
-        return jsonify({'success': False, 'message': 'Error al generar el PDF'}), 500
+        if trabajo['estado'] == 'error':
+            return jsonify({'success': False, 'message': trabajo['error']}), 500
+        # Sigue en curso: el cliente consulta estado_url y descarga desde resultado_url
+        return respuesta_trabajo_en_curso(id_trabajo, deduplicado, message='El PDF sigue generándose')
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/trabajos', methods=['POST'])
+@login_required
+def enviar_trabajo():
+    """Encolar un trabajo en segundo plano: {"tipo": "pdf_viaje"|"reporte", "parametros": {...}}"""
+    try:
+        datos = request.get_json(silent=True) or {}
+        tipo = datos.get('tipo')
+        parametros = datos.get('parametros') or {}
+        if not isinstance(parametros, dict):
+            return jsonify({'success': False, 'message': 'parametros debe ser un objeto'}), 400
+        if tipo == 'reporte':
+            parametros.setdefault('formato', 'xlsx')
+        
+        error = validar_trabajo(tipo, parametros)
+        if error:
+            mensaje, codigo = error
+            return jsonify({'success': False, 'message': mensaje}), codigo
+        
+        id_trabajo, deduplicado = cola_trabajos.enviar(tipo, parametros, session.get('username'))
+        return respuesta_trabajo_en_curso(id_trabajo, deduplicado)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/trabajos/<id_trabajo>')
+@login_required
+def estado_trabajo(id_trabajo):
+    """Estado y progreso de un trabajo (para polling desde el navegador)"""
+    trabajo = cola_trabajos.estado(id_trabajo)
+    if not trabajo:
+        return jsonify({'success': False, 'message': 'Trabajo no encontrado'}), 404
+    
+    resultado = trabajo.pop('resultado') or {}
+    resultado.pop('archivo', None)  # La ruta en disco no se expone
+    trabajo['resultado'] = resultado or None
+    return jsonify({'success': True, 'trabajo': trabajo})
+
+@app.route('/api/trabajos/<id_trabajo>/resultado')
+@login_required
+def resultado_trabajo(id_trabajo):
+    """Descargar el archivo generado por un trabajo completado"""
+    trabajo = cola_trabajos.estado(id_trabajo)
+    if not trabajo:
+        return jsonify({'success': False, 'message': 'Trabajo no encontrado'}), 404
+    if trabajo['estado'] != 'completado':
+        return jsonify({'success': False, 'estado': trabajo['estado'], 'message': trabajo['error'] or 'El trabajo aún no terminó'}), 409
+    
+    resultado = trabajo['resultado'] or {}
+    archivo = resultado.get('archivo')
+    if not archivo or not os.path.exists(archivo):
+        return jsonify({'success': False, 'message': 'El archivo generado ya no existe'}), 410
+    return send_file(archivo, as_attachment=True, download_name=resultado.get('nombre_descarga'),
+                     mimetype=resultado.get('mimetype'))
+
+@app.route('/pdf/viaje/<numero_viaje>')
+@login_required
+def ver_pdf_viaje(numero_viaje):
+    """
+    PDF completo del viaje en la misma respuesta (sin escribir y redirigir).
+    ?descargar=1 lo entrega como adjunto.
+    Soporta If-None-Match (ETag = huella de los datos) y pedidos por rango.
+    
+    Si hay que dibujarlo se hace en la cola de trabajos (mismo límite de PDFs
+    simultáneos y mismo trabajo para pedidos repetidos del viaje). Si no termina
+    dentro de ESPERA_PDF_API segundos responde 202 con el trabajo: al terminar,
+    repetir el pedido entrega el PDF desde la caché.
+    """
+    try:
+        descargar = request.args.get('descargar') == '1'
+        
+        preparado = pdf_generator.preparar_pdf_completo(numero_viaje)
+        if not preparado:
+            return jsonify({'success': False, 'message': 'No se encontraron centros de costo para este viaje'}), 404
+        
+        # El navegador ya tiene este mismo PDF: no hace falta dibujarlo
+        if preparado['huella'] in request.if_none_match:
+            respuesta = app.response_class(status=304)
+            respuesta.set_etag(preparado['huella'])
+            respuesta.headers['Cache-Control'] = 'private, no-cache'
+            return respuesta
+        
+        archivo, huella = preparado['archivo'], preparado['huella']
+        if not archivo:
+            id_trabajo, deduplicado = cola_trabajos.enviar('pdf_viaje', {'numero_viaje': numero_viaje},
+                                                           session.get('username'))
+            trabajo = cola_trabajos.esperar(id_trabajo, timeout=ESPERA_PDF_API)
+            if trabajo['estado'] == 'error':
+                return jsonify({'success': False, 'message': trabajo['error']}), 500
+            if trabajo['estado'] != 'completado':
+                return respuesta_trabajo_en_curso(id_trabajo, deduplicado, message='El PDF sigue generándose')
+            archivo, huella = trabajo['resultado']['archivo'], trabajo['resultado']['huella']
+        
+        respuesta = send_file(
+            archivo, mimetype='application/pdf', as_attachment=descargar,
+            download_name=preparado['nombre'], etag=huella, conditional=True
+        )
+        respuesta.headers['Cache-Control'] = 'private, no-cache'
+        respuesta.headers['X-Centros-Costo'] = str(preparado['num_centros'])
+        return respuesta
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/descargar-pdf/<path:filename>')
 @login_required
 def descargar_pdf(filename):
+    """PDF de la carpeta pdfs/ (con ETag, Last-Modified y pedidos por rango). ?inline=1 lo muestra en el navegador."""
     # Determinar el directorio base correcto
     if getattr(sys, 'frozen', False):
         # Corriendo como ejecutable empaquetado
@@ -1555,11 +1501,12 @@ def descargar_pdf(filename):
         # Corriendo como script normal
         base_dir = os.path.dirname(os.path.abspath(__file__))
     
-    filepath = os.path.join(base_dir, 'pdfs', filename)
+    pdfs_dir = os.path.join(base_dir, 'pdfs')
     
-    if os.path.exists(filepath):
-        return send_file(filepath, as_attachment=True)
-    else:
+    try:
+        # send_from_directory rechaza rutas fuera de pdfs/ y responde 304/206 según los encabezados
+        return send_from_directory(pdfs_dir, filename, as_attachment=request.args.get('inline') != '1')
+    except NotFound:
         flash(f'El archivo PDF no existe: {filename}', 'error')
         return redirect(url_for('generar_pdf_page'))
 
@@ -1630,8 +1577,10 @@ def crear_administrativo():
 def listar_administrativos():
     """Listar todos los nombres de administrativos"""
     try:
-        nombres = maestras_manager.listar_administrativos_nombres()
-        return jsonify({'success': True, 'administrativos': nombres})
+        return respuesta_maestra_cacheada(
+            'listar_administrativos', ('maestras_administrativos',),
+            lambda: {'success': True, 'administrativos': maestras_manager.listar_administrativos_nombres()}
+        )
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -1640,16 +1589,38 @@ def listar_administrativos():
 @app.route('/api/listar-proveedores')
 def listar_proveedores():
     """Listar todos los proveedores activos"""
-    try:
+    def cargar():
         conn = db_manager.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT id, nombre FROM proveedores WHERE activo = 1 ORDER BY nombre')
         proveedores = [{'id': row[0], 'nombre': row[1]} for row in cursor.fetchall()]
         conn.close()
-        return jsonify({'success': True, 'proveedores': proveedores})
+        return {'success': True, 'proveedores': proveedores}
+
+    try:
+        return respuesta_maestra_cacheada('proveedores', ('proveedores',), cargar)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# Las escrituras de proveedores y transportes pasan por el escritor único
+# (escritor_db.py): la verificación de duplicados y la escritura van en la misma transacción
+
+def _agregar_proveedor(cursor, nombre):
+    """Retorna (estado, id) con estado 'activo' (ya existía), 'reactivado' o 'nuevo'"""
+    cursor.execute('SELECT id, activo FROM proveedores WHERE UPPER(nombre) = ?', (nombre,))
+    existente = cursor.fetchone()
+    
+    if existente:
+        if existente[1] == 1:  # Si está activo
+            return 'activo', existente[0]
+        # Si está inactivo, reactivar
+        cursor.execute('UPDATE proveedores SET activo = 1 WHERE id = ?', (existente[0],))
+        return 'reactivado', existente[0]
+    
+    # Insertar nuevo proveedor
+    cursor.execute('INSERT INTO proveedores (nombre, activo) VALUES (?, 1)', (nombre,))
+    return 'nuevo', cursor.lastrowid
+
 @app.route('/api/agregar-proveedor', methods=['POST'])
 def agregar_proveedor():
     """Agregar un nuevo proveedor (o reactivar si existe inactivo)"""
@@ -1660,33 +1631,30 @@ def agregar_proveedor():
         if not nombre:
             return jsonify({'success': False, 'message': 'El nombre del proveedor es obligatorio'}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si ya existe
-        cursor.execute('SELECT id, activo FROM proveedores WHERE UPPER(nombre) = ?', (nombre,))
-        existente = cursor.fetchone()
-        
-        if existente:
-            if existente[1] == 1:  # Si está activo
-                conn.close()
-                return jsonify({'success': False, 'message': 'El proveedor ya existe y está activo'}), 400
-            else:  # Si está inactivo, reactivar
-                cursor.execute('UPDATE proveedores SET activo = 1 WHERE id = ?', (existente[0],))
-                conn.commit()
-                conn.close()
-                return jsonify({'success': True, 'message': 'Proveedor reactivado exitosamente', 'id': existente[0]})
-        
-        # Insertar nuevo proveedor
-        cursor.execute('INSERT INTO proveedores (nombre, activo) VALUES (?, 1)', (nombre,))
-        conn.commit()
-        nuevo_id = cursor.lastrowid
-        conn.close()
+        estado, proveedor_id = escritor_db.ejecutar(_agregar_proveedor, nombre)
+        if estado == 'activo':
+            return jsonify({'success': False, 'message': 'El proveedor ya existe y está activo'}), 400
         
-        return jsonify({'success': True, 'message': 'Proveedor agregado exitosamente', 'id': nuevo_id})
+        cache_maestras.invalidar('proveedores')
+        if estado == 'reactivado':
+            return jsonify({'success': True, 'message': 'Proveedor reactivado exitosamente', 'id': proveedor_id})
+        return jsonify({'success': True, 'message': 'Proveedor agregado exitosamente', 'id': proveedor_id})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _editar_proveedor(cursor, proveedor_id, nombre):
+    """Retorna False (sin escribir) si el nuevo nombre ya existe en otro proveedor"""
+    cursor.execute('SELECT id FROM proveedores WHERE UPPER(nombre) = ? AND id != ?', (nombre, proveedor_id))
+    if cursor.fetchone():
+        return False
+    
+    cursor.execute('''
+        UPDATE proveedores 
+        SET nombre = ?
+        WHERE id = ?
+    ''', (nombre, proveedor_id))
+    return True
+
 @app.route('/api/editar-proveedor', methods=['POST'])
 def editar_proveedor():
     """Editar un proveedor existente"""
@@ -1698,29 +1666,18 @@ def editar_proveedor():
         if not proveedor_id or not nombre:
             return jsonify({'success': False, 'message': 'ID y nombre son obligatorios'}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si el nuevo nombre ya existe en otro proveedor
-        cursor.execute('SELECT id FROM proveedores WHERE UPPER(nombre) = ? AND id != ?', (nombre, proveedor_id))
-        if cursor.fetchone():
-            conn.close()
+        if not escritor_db.ejecutar(_editar_proveedor, proveedor_id, nombre):
             return jsonify({'success': False, 'message': 'Ya existe otro proveedor con ese nombre'}), 400
         
-        # Actualizar proveedor
-        cursor.execute('''
-            UPDATE proveedores 
-            SET nombre = ?
-            WHERE id = ?
-        ''', (nombre, proveedor_id))
-        
-        conn.commit()
-        conn.close()
-        
+        cache_maestras.invalidar('proveedores')
         return jsonify({'success': True, 'message': 'Proveedor actualizado exitosamente'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _desactivar(cursor, tabla, id_registro):
+    """Soft delete de un proveedor o transporte"""
+    cursor.execute(f'UPDATE {tabla} SET activo = 0 WHERE id = ?', (id_registro,))
+
 @app.route('/api/eliminar-proveedor', methods=['POST'])
 def eliminar_proveedor():
     """Desactivar un proveedor (soft delete)"""
@@ -1731,18 +1688,8 @@ def eliminar_proveedor():
         if not proveedor_id:
             return jsonify({'success': False, 'message': 'ID del proveedor es obligatorio'}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Desactivar proveedor
-        cursor.execute('''
-            UPDATE proveedores 
-            SET activo = 0
-            WHERE id = ?
-        ''', (proveedor_id,))
-        
-        conn.commit()
-        conn.close()
+        escritor_db.ejecutar(_desactivar, 'proveedores', proveedor_id)
+        cache_maestras.invalidar('proveedores')
         
         return jsonify({'success': True, 'message': 'Proveedor desactivado exitosamente'})
     except Exception as e:
@@ -1753,7 +1700,7 @@ def eliminar_proveedor():
 @app.route('/api/listar-transportes')
 def listar_transportes():
     """Listar todos los transportes activos"""
-    try:
+    def cargar():
         conn = db_manager.get_connection()
         cursor = conn.cursor()
         
@@ -1774,7 +1721,10 @@ def listar_transportes():
             })
         
         conn.close()
-        return jsonify({'success': True, 'transportes': transportes})
+        return {'success': True, 'transportes': transportes}
+
+    try:
+        return respuesta_maestra_cacheada('transportes', ('transportes',), cargar)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -1809,6 +1759,29 @@ def obtener_transporte(patente):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _agregar_transporte(cursor, patente, transporte, tipo_camion):
+    """Retorna 'activo' (ya existía), 'reactivado' o 'nuevo'"""
+    cursor.execute('SELECT id, activo FROM transportes WHERE patente = ?', (patente,))
+    existente = cursor.fetchone()
+    
+    if existente:
+        if existente[1] == 1:  # Si está activo
+            return 'activo'
+        # Si está inactivo, reactivar
+        cursor.execute('''
+            UPDATE transportes 
+            SET transporte = ?, tipo_camion = ?, activo = 1, fecha_creacion = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (transporte, tipo_camion, existente[0]))
+        return 'reactivado'
+    
+    # Insertar nueva
+    cursor.execute('''
+        INSERT INTO transportes (patente, transporte, tipo_camion, activo, fecha_creacion)
+        VALUES (?, ?, ?, 1, CURRENT_TIMESTAMP)
+    ''', (patente, transporte, tipo_camion))
+    return 'nuevo'
+
 @app.route('/api/agregar-transporte', methods=['POST'])
 def agregar_transporte():
     """Agregar una nueva patente con su transporte y tipo de camión (o reactivar si existe inactiva)"""
@@ -1821,40 +1794,30 @@ def agregar_transporte():
         if not patente or not transporte or not tipo_camion:
             return jsonify({'success': False, 'message': 'Todos los campos son obligatorios'}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si ya existe
-        cursor.execute('SELECT id, activo FROM transportes WHERE patente = ?', (patente,))
-        existente = cursor.fetchone()
-        
-        if existente:
-            if existente[1] == 1:  # Si está activo
-                conn.close()
-                return jsonify({'success': False, 'message': 'La patente ya existe y está activa'}), 400
-            else:  # Si está inactivo, reactivar
-                cursor.execute('''
-                    UPDATE transportes 
-                    SET transporte = ?, tipo_camion = ?, activo = 1, fecha_creacion = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (transporte, tipo_camion, existente[0]))
-                conn.commit()
-                conn.close()
-                return jsonify({'success': True, 'message': 'Patente reactivada exitosamente'})
-        
-        # Insertar nueva
-        cursor.execute('''
-            INSERT INTO transportes (patente, transporte, tipo_camion, activo, fecha_creacion)
-            VALUES (?, ?, ?, 1, CURRENT_TIMESTAMP)
-        ''', (patente, transporte, tipo_camion))
-        
-        conn.commit()
-        conn.close()
+        estado = escritor_db.ejecutar(_agregar_transporte, patente, transporte, tipo_camion)
+        if estado == 'activo':
+            return jsonify({'success': False, 'message': 'La patente ya existe y está activa'}), 400
         
+        cache_maestras.invalidar('transportes')
+        if estado == 'reactivado':
+            return jsonify({'success': True, 'message': 'Patente reactivada exitosamente'})
         return jsonify({'success': True, 'message': 'Patente agregada exitosamente'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _editar_transporte(cursor, id_transporte, patente, transporte, tipo_camion):
+    """Retorna False (sin escribir) si la patente ya existe en otro registro"""
+    cursor.execute('SELECT id FROM transportes WHERE patente = ? AND id != ?', (patente, id_transporte))
+    if cursor.fetchone():
+        return False
+    
+    cursor.execute('''
+        UPDATE transportes 
+        SET patente = ?, transporte = ?, tipo_camion = ?
+        WHERE id = ?
+    ''', (patente, transporte, tipo_camion, id_transporte))
+    return True
+
 @app.route('/api/editar-transporte', methods=['PUT'])
 def editar_transporte():
     """Editar información de un transporte existente"""
@@ -1868,24 +1831,10 @@ def editar_transporte():
         if not id_transporte or not patente or not transporte or not tipo_camion:
             return jsonify({'success': False, 'message': 'Todos los campos son obligatorios'}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si la patente ya existe en otro registro
-        cursor.execute('SELECT id FROM transportes WHERE patente = ? AND id != ?', (patente, id_transporte))
-        if cursor.fetchone():
-            conn.close()
+        if not escritor_db.ejecutar(_editar_transporte, id_transporte, patente, transporte, tipo_camion):
             return jsonify({'success': False, 'message': 'La patente ya existe en otro registro'}), 400
         
-        # Actualizar
-        cursor.execute('''
-            UPDATE transportes 
-            SET patente = ?, transporte = ?, tipo_camion = ?
-            WHERE id = ?
-        ''', (patente, transporte, tipo_camion, id_transporte))
-        
-        conn.commit()
-        conn.close()
+        cache_maestras.invalidar('transportes')
         
         return jsonify({'success': True, 'message': 'Transporte actualizado exitosamente'})
     except Exception as e:
@@ -1901,14 +1850,8 @@ def eliminar_transporte():
         if not id_transporte:
             return jsonify({'success': False, 'message': 'ID es obligatorio'}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Soft delete
-        cursor.execute('UPDATE transportes SET activo = 0 WHERE id = ?', (id_transporte,))
-        
-        conn.commit()
-        conn.close()
+        escritor_db.ejecutar(_desactivar, 'transportes', id_transporte)
+        cache_maestras.invalidar('transportes')
         
         return jsonify({'success': True, 'message': 'Transporte eliminado exitosamente'})
     except Exception as e:
@@ -2021,18 +1964,9 @@ def cargar_rendiciones():
         if not archivo.filename.lower().endswith(('.xlsx', '.xls')):
             return jsonify({'success': False, 'message': 'Solo se permiten archivos Excel (.xlsx, .xls)'}), 400
         
-        # Guardar temporalmente
-        temp_path = os.path.join(os.path.dirname(__file__), 'temp_rendiciones.xlsx')
-        archivo.save(temp_path)
-        
-        # Procesar
-        resultado = rendiciones_manager.cargar_rendiciones_desde_excel(temp_path)
-        
-        # Eliminar archivo temporal
-        try:
-            os.remove(temp_path)
-        except:
-            pass
+        # Procesar directo desde la subida (cada request tiene su propio stream:
+        # en memoria o en un temporal anónimo que Werkzeug borra al terminar)
+        resultado = rendiciones_manager.cargar_rendiciones_desde_excel(archivo.stream)
         
         if resultado['success']:
             mensaje = f"✓ {resultado['registros_cargados']} registros cargados"
@@ -2051,9 +1985,19 @@ def cargar_rendiciones():
         else:
             return jsonify({'success': False, 'message': resultado.get('error', 'Error desconocido')}), 500
             
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+@app.errorhandler(413)
+def archivo_demasiado_grande(e):
+    """Subida que supera MAX_CONTENT_LENGTH"""
+    mensaje = f'El archivo supera el máximo permitido ({config.upload_max_mb:g} MB)'
+    if request.path.startswith('/api/'):
+        return jsonify({'success': False, 'message': mensaje}), 413
+    return mensaje, 413
+
 @app.route('/api/obtener-rendiciones')
 @login_required
 def obtener_rendiciones_api():
@@ -2111,6 +2055,9 @@ def eliminar_rendicion_api():
 # ========== SERVIDOR ==========
 
 if __name__ == '__main__':
+    # Necesario para el pool de procesos de PDFs en lote cuando corre como ejecutable
+    multiprocessing.freeze_support()
+    
     # Determinar el directorio base correcto
     if getattr(sys, 'frozen', False):
         # Corriendo como ejecutable empaquetado
@@ -2155,6 +2102,9 @@ if __name__ == '__main__':
     # Iniciar backup automático a OneDrive
     backup_manager.iniciar()
 
+    # Mantenimiento periódico de estadísticas del planificador (PRAGMA optimize)
+    migraciones.iniciar_mantenimiento()
+
     # Intentar Waitress primero (producción)
     try:
         from waitress import serve
@@ -4,32 +4,74 @@ Gestión de usuarios con SQLite
 """
 import sqlite3
 import hashlib
-import os
-import sys
 from functools import wraps
 from flask import session, redirect, url_for, flash, jsonify, request
+from config import config
+from db_pool import obtener_conexion
+from escritor_db import escritor_db
+
+# Las escrituras de usuarios pasan por el escritor único (escritor_db.py): cada
+# _funcion recibe el cursor de la transacción del escritor (filas como tuplas)
+
+def _crear_usuario(cursor, username, password_hash, nombre_completo, email):
+    cursor.execute('''
+        INSERT INTO usuarios (username, password_hash, nombre_completo, email)
+        VALUES (?, ?, ?, ?)
+    ''', (username, password_hash, nombre_completo, email))
+    return cursor.lastrowid
+
+def _crear_usuario_por_defecto(cursor, password_hash):
+    cursor.execute('SELECT COUNT(*) FROM usuarios')
+    if cursor.fetchone()[0] > 0:
+        return False
+    _crear_usuario(cursor, 'admin', password_hash, 'Administrador', 'admin@aratrack.com')
+    return True
+
+def _actualizar_password(cursor, user_id, password_hash):
+    cursor.execute('''
+        UPDATE usuarios
+        SET password_hash = ?
+        WHERE id = ?
+    ''', (password_hash, user_id))
+
+def _alternar_estado(cursor, user_id):
+    """Retorna False si el usuario no existe"""
+    cursor.execute('SELECT activo FROM usuarios WHERE id = ?', (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return False
+    
+    nuevo_estado = 0 if row[0] else 1
+    cursor.execute('''
+        UPDATE usuarios
+        SET activo = ?
+        WHERE id = ?
+    ''', (nuevo_estado, user_id))
+    return True
+
+def _eliminar_usuario(cursor, user_id):
+    """Retorna (éxito, mensaje)"""
+    # Verificar que no sea el usuario admin
+    cursor.execute('SELECT username FROM usuarios WHERE id = ?', (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return False, "Usuario no encontrado"
+    
+    if row[0] == 'admin':
+        return False, "No se puede eliminar el usuario admin"
+    
+    cursor.execute('DELETE FROM usuarios WHERE id = ?', (user_id,))
+    return True, "Usuario eliminado"
 
 class AuthManager:
     def __init__(self):
-        # Si se ejecuta empaquetado, usar directorio del ejecutable
-        if getattr(sys, 'frozen', False):
-            base_dir = os.path.dirname(sys.executable)
-        else:
-            base_dir = os.path.dirname(__file__)
-        
-        self.db_path = os.path.join(base_dir, 'viajes.db')
+        self.db_path = config.get_db_path()
         self.init_users_table()
         self.create_default_user()
     
     def get_connection(self):
-        """Obtener conexión a la base de datos"""
-        conn = sqlite3.connect(
-            self.db_path,
-            timeout=30.0,
-            check_same_thread=False
-        )
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Obtener conexión del pool compartido (transaccional, filas como sqlite3.Row)"""
+        return obtener_conexion(self.db_path, row_factory=sqlite3.Row, isolation_level='')
     
     def init_users_table(self):
         """Crear tabla de usuarios si no existe"""
@@ -58,21 +100,9 @@ class AuthManager:
     
     def create_default_user(self):
         """Crear usuario por defecto si no existe"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) as count FROM usuarios')
-        if cursor.fetchone()['count'] == 0:
-            # Usuario por defecto: admin / admin123
-            cursor.execute('''
-                INSERT INTO usuarios (username, password_hash, nombre_completo, email)
-                VALUES (?, ?, ?, ?)
-            ''', ('admin', self.hash_password('admin123'), 'Administrador', 'admin@aratrack.com'))
-            
-            conn.commit()
+        # Usuario por defecto: admin / admin123
+        if escritor_db.ejecutar(_crear_usuario_por_defecto, self.hash_password('admin123')):
             print("Usuario por defecto creado: admin / admin123")
-        
-        conn.close()
     
     def verify_user(self, username, password):
         """Verificar credenciales de usuario"""
@@ -114,22 +144,12 @@ class AuthManager:
     
     def create_user(self, username, password, nombre_completo, email=None):
         """Crear nuevo usuario"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            password_hash = self.hash_password(password)
-            cursor.execute('''
-                INSERT INTO usuarios (username, password_hash, nombre_completo, email)
-                VALUES (?, ?, ?, ?)
-            ''', (username, password_hash, nombre_completo, email))
-            
-            conn.commit()
-            user_id = cursor.lastrowid
-            conn.close()
+            user_id = escritor_db.ejecutar(
+                _crear_usuario, username, self.hash_password(password), nombre_completo, email
+            )
             return True, user_id
         except sqlite3.IntegrityError:
-            conn.close()
             return False, "El usuario ya existe"
     
     def get_all_users(self):
@@ -149,96 +169,32 @@ class AuthManager:
     
     def update_password(self, user_id, new_password):
         """Actualizar contraseña de usuario"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        password_hash = self.hash_password(new_password)
-        cursor.execute('''
-            UPDATE usuarios
-            SET password_hash = ?
-            WHERE id = ?
-        ''', (password_hash, user_id))
-        
-        conn.commit()
-        conn.close()
+        escritor_db.ejecutar(_actualizar_password, user_id, self.hash_password(new_password))
         return True
     
     def change_user_password(self, user_id, nueva_password):
         """Cambiar contraseña de un usuario (por admin)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            password_hash = self.hash_password(nueva_password)
-            cursor.execute('''
-                UPDATE usuarios
-                SET password_hash = ?
-                WHERE id = ?
-            ''', (password_hash, user_id))
-            
-            conn.commit()
-            conn.close()
+            escritor_db.ejecutar(_actualizar_password, user_id, self.hash_password(nueva_password))
             return True, "Contraseña actualizada"
         except Exception as e:
             print(f"Error al cambiar contraseña: {e}")
-            conn.close()
             return False, str(e)
     
     def toggle_user_status(self, user_id):
         """Activar/desactivar usuario"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Obtener estado actual
-            cursor.execute('SELECT activo FROM usuarios WHERE id = ?', (user_id,))
-            row = cursor.fetchone()
-            if not row:
-                conn.close()
-                return False
-            
-            nuevo_estado = 0 if row['activo'] else 1
-            
-            cursor.execute('''
-                UPDATE usuarios
-                SET activo = ?
-                WHERE id = ?
-            ''', (nuevo_estado, user_id))
-            
-            conn.commit()
-            conn.close()
-            return True
+            return escritor_db.ejecutar(_alternar_estado, user_id)
         except Exception as e:
             print(f"Error toggle status: {e}")
-            conn.close()
             return False
     
     def delete_user(self, user_id):
         """Eliminar usuario de la base de datos"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Verificar que no sea el usuario admin
-            cursor.execute('SELECT username FROM usuarios WHERE id = ?', (user_id,))
-            row = cursor.fetchone()
-            if not row:
-                conn.close()
-                return False, "Usuario no encontrado"
-            
-            if row['username'] == 'admin':
-                conn.close()
-                return False, "No se puede eliminar el usuario admin"
-            
-            # Eliminar usuario
-            cursor.execute('DELETE FROM usuarios WHERE id = ?', (user_id,))
-            
-            conn.commit()
-            conn.close()
-            return True, "Usuario eliminado"
+            return escritor_db.ejecutar(_eliminar_usuario, user_id)
         except Exception as e:
             print(f"Error al eliminar usuario: {e}")
-            conn.close()
             return False, str(e)
 
 def login_required(f):
@@ -1,16 +1,38 @@
 """
-Backup automático de viajes.db a OneDrive cada 2 horas.
+Backup automático de viajes.db a OneDrive cada hora, como snapshots incrementales.
 Se ejecuta en un hilo en segundo plano mientras el servidor está activo.
+
+La copia se hace con la API de backup de SQLite (incluye lo que todavía está
+en viajes.db-wal y nunca queda a medias) y se verifica con PRAGMA
+integrity_check. Después se parte en chunks de TAMANO_CHUNK bytes: cada chunk
+se guarda comprimido con su SHA-256 como nombre, una sola vez, y cada snapshot
+es un manifiesto JSON con la lista de chunks. Así lo que se escribe en
+OneDrive es proporcional a lo que cambió, no al tamaño de la base.
+
+Si PRAGMA data_version no cambió desde el último snapshot, no se copia nada.
+Los snapshots se podan según RETENCION (horarios, diarios y semanales).
+
+Uso manual:
+    python backup_manager.py snapshot                  # snapshot ahora
+    python backup_manager.py listar                    # snapshots disponibles
+    python backup_manager.py restaurar destino.db [--snapshot ID]
+    python backup_manager.py copia destino.db          # copia completa verificada
 """
 
-import shutil
+import argparse
+import hashlib
+import json
+import sqlite3
+import tempfile
 import threading
 import time
 import os
+import zlib
 from datetime import datetime
+from config import config
 
 # Ruta origen de la base de datos
-DB_ORIGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "viajes.db")
+DB_ORIGEN = config.get_db_path()
 
 # Ruta destino en OneDrive
 DB_DESTINO_DIR = os.path.join(
@@ -20,30 +42,316 @@ DB_DESTINO_DIR = os.path.join(
     "DHL_Viajes_DB"
 )
 DB_DESTINO = os.path.join(DB_DESTINO_DIR, "viajes.db")
+SNAPSHOTS_DIR = os.path.join(DB_DESTINO_DIR, "snapshots")
+
+# Copia local consistente a partir de la cual se arma cada snapshot
+COPIA_LOCAL = os.path.join(tempfile.gettempdir(), "aratrack_snapshot.db")
+
+# Intervalo en segundos (1 hora; si la base no cambió el ciclo no copia nada)
+INTERVALO = 60 * 60
+
+# Tamaño de chunk: múltiplo del tamaño de página de SQLite (4096)
+TAMANO_CHUNK = 64 * 1024
 
-# Intervalo en segundos (2 horas)
-INTERVALO = 2 * 60 * 60
+# Generaciones que se conservan: el snapshot más reciente de cada hora, día y semana
+RETENCION = {'horarios': 24, 'diarios': 14, 'semanales': 8}
+_PERIODOS = {'horarios': '%Y%m%d%H', 'diarios': '%Y%m%d', 'semanales': '%G%V'}
+
+# Copia por pasos: páginas por paso y pausa entre pasos para no acaparar el disco
+PAGINAS_POR_PASO = 1024
+PAUSA_ENTRE_PASOS = 0.01
+
+# Si otra conexión escribe durante la copia, SQLite la reinicia desde cero.
+# Después de estos reinicios se copia en un solo paso (en WAL no bloquea a los escritores).
+MAX_REINICIOS = 3
 
 _hilo_backup = None
 _detener = threading.Event()
 
 
+class _CopiaReiniciada(Exception):
+    """La copia por pasos se reinició demasiadas veces por escrituras concurrentes"""
+
+
+def _copiar_por_pasos(origen, copia, paginas, pausa):
+    """Backup en pasos de `paginas` con una pausa entre pasos. Retorna los reinicios."""
+    estado = {'restantes': None, 'reinicios': 0}
+
+    def progreso(status, restantes, total):
+        if estado['restantes'] is not None and restantes > estado['restantes']:
+            estado['reinicios'] += 1
+            if estado['reinicios'] > MAX_REINICIOS:
+                raise _CopiaReiniciada()
+        estado['restantes'] = restantes
+        if restantes:
+            time.sleep(pausa)
+
+    origen.backup(copia, pages=paginas, progress=progreso)
+    return estado['reinicios']
+
+
+def copiar_base(origen=DB_ORIGEN, destino=DB_DESTINO, paginas=PAGINAS_POR_PASO, pausa=PAUSA_ENTRE_PASOS):
+    """
+    Copia consistente de una base SQLite en uso:
+    1. API de backup hacia un temporal en la carpeta destino (por pasos)
+    2. PRAGMA integrity_check sobre el temporal
+    3. os.replace del temporal sobre el destino (atómico: el backup anterior
+       sigue intacto hasta que el nuevo está completo y verificado)
+    Retorna dict con bytes, segundos y reinicios. Lanza excepción si falla.
+    """
+    inicio = time.monotonic()
+    temporal = f"{destino}.{os.getpid()}.tmp"
+    conn_origen = sqlite3.connect(origen, timeout=30)
+    try:
+        conn_copia = sqlite3.connect(temporal)
+        try:
+            try:
+                reinicios = _copiar_por_pasos(conn_origen, conn_copia, paginas, pausa)
+            except _CopiaReiniciada:
+                # Un solo paso: toma un snapshot de lectura y copia todo de una vez
+                reinicios = MAX_REINICIOS + 1
+                conn_origen.backup(conn_copia)
+
+            # Archivo único y autocontenido en el destino (sin -wal ni -shm)
+            conn_copia.execute('PRAGMA journal_mode=DELETE')
+            resultado = [fila[0] for fila in conn_copia.execute('PRAGMA integrity_check')]
+            if resultado != ['ok']:
+                raise sqlite3.DatabaseError(f"integrity_check del backup: {'; '.join(resultado[:5])}")
+        finally:
+            conn_copia.close()
+
+        with open(temporal, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(temporal, destino)
+    except BaseException:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
+    finally:
+        conn_origen.close()
+
+    return {
+        'bytes': os.path.getsize(destino),
+        'segundos': round(time.monotonic() - inicio, 2),
+        'reinicios': reinicios
+    }
+
+
+# ========== SNAPSHOTS INCREMENTALES ==========
+
+def _escribir_atomico(ruta, datos):
+    """Escribir a un temporal y renombrar: un chunk o manifiesto nunca queda a medias"""
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+def _ruta_chunk(directorio, digest):
+    return os.path.join(directorio, 'chunks', digest[:2], f"{digest}.z")
+
+
+def listar_snapshots(directorio=SNAPSHOTS_DIR):
+    """Manifiestos disponibles, del más antiguo al más reciente"""
+    carpeta = os.path.join(directorio, 'manifiestos')
+    if not os.path.isdir(carpeta):
+        return []
+    manifiestos = []
+    for nombre in sorted(os.listdir(carpeta)):
+        if nombre.endswith('.json'):
+            with open(os.path.join(carpeta, nombre), encoding='utf-8') as f:
+                manifiestos.append(json.load(f))
+    return manifiestos
+
+
+def crear_snapshot(origen=DB_ORIGEN, directorio=SNAPSHOTS_DIR):
+    """
+    Copia consistente local de la base y snapshot deduplicado en `directorio`.
+    Solo se escriben los chunks que no existen todavía. Si el contenido es
+    idéntico al último snapshot no se crea manifiesto nuevo.
+    """
+    inicio = time.monotonic()
+    copia = copiar_base(origen, COPIA_LOCAL)
+    try:
+        chunks = []
+        nuevos = 0
+        bytes_escritos = 0
+        total = hashlib.sha256()
+        with open(COPIA_LOCAL, 'rb') as f:
+            while True:
+                bloque = f.read(TAMANO_CHUNK)
+                if not bloque:
+                    break
+                total.update(bloque)
+                digest = hashlib.sha256(bloque).hexdigest()
+                chunks.append(digest)
+                ruta = _ruta_chunk(directorio, digest)
+                if not os.path.exists(ruta):
+                    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                    comprimido = zlib.compress(bloque, 6)
+                    _escribir_atomico(ruta, comprimido)
+                    nuevos += 1
+                    bytes_escritos += len(comprimido)
+    finally:
+        try:
+            os.remove(COPIA_LOCAL)
+        except OSError:
+            pass
+
+    anteriores = listar_snapshots(directorio)
+    if anteriores and anteriores[-1]['sha256'] == total.hexdigest():
+        return {'id': anteriores[-1]['id'], 'sin_cambios': True, 'chunks': len(chunks),
+                'nuevos': 0, 'bytes_escritos': 0, 'segundos': round(time.monotonic() - inicio, 2)}
+
+    ahora = datetime.now()
+    manifiesto = {
+        'id': ahora.strftime('%Y%m%d-%H%M%S'),
+        'fecha': ahora.isoformat(timespec='seconds'),
+        'bytes': copia['bytes'],
+        'sha256': total.hexdigest(),
+        'tamano_chunk': TAMANO_CHUNK,
+        'chunks': chunks
+    }
+    carpeta = os.path.join(directorio, 'manifiestos')
+    os.makedirs(carpeta, exist_ok=True)
+    _escribir_atomico(os.path.join(carpeta, f"{manifiesto['id']}.json"),
+                      json.dumps(manifiesto).encode('utf-8'))
+    bytes_escritos += os.path.getsize(os.path.join(carpeta, f"{manifiesto['id']}.json"))
+
+    borrados = podar_snapshots(directorio)
+    return {'id': manifiesto['id'], 'sin_cambios': False, 'chunks': len(chunks), 'nuevos': nuevos,
+            'bytes_escritos': bytes_escritos, 'podados': borrados,
+            'segundos': round(time.monotonic() - inicio, 2)}
+
+
+def podar_snapshots(directorio=SNAPSHOTS_DIR, retencion=None):
+    """
+    Conservar el snapshot más reciente de cada una de las últimas N horas,
+    días y semanas (según RETENCION), borrar el resto de los manifiestos y
+    luego los chunks que ya no usa ningún manifiesto. Retorna (manifiestos, chunks) borrados.
+    """
+    retencion = retencion or RETENCION
+    manifiestos = listar_snapshots(directorio)
+    conservar = set()
+    for nivel, cantidad in retencion.items():
+        periodos = set()
+        for manifiesto in reversed(manifiestos):
+            periodo = datetime.fromisoformat(manifiesto['fecha']).strftime(_PERIODOS[nivel])
+            if periodo in periodos:
+                continue
+            if len(periodos) >= cantidad:
+                break
+            periodos.add(periodo)
+            conservar.add(manifiesto['id'])
+    if manifiestos:
+        conservar.add(manifiestos[-1]['id'])
+
+    manifiestos_borrados = 0
+    usados = set()
+    for manifiesto in manifiestos:
+        if manifiesto['id'] in conservar:
+            usados.update(manifiesto['chunks'])
+        else:
+            os.remove(os.path.join(directorio, 'manifiestos', f"{manifiesto['id']}.json"))
+            manifiestos_borrados += 1
+
+    chunks_borrados = 0
+    if manifiestos_borrados:
+        raiz = os.path.join(directorio, 'chunks')
+        for subcarpeta in os.listdir(raiz):
+            for nombre in os.listdir(os.path.join(raiz, subcarpeta)):
+                if nombre.endswith('.z') and nombre[:-2] not in usados:
+                    os.remove(os.path.join(raiz, subcarpeta, nombre))
+                    chunks_borrados += 1
+    return manifiestos_borrados, chunks_borrados
+
+
+def restaurar_snapshot(destino, snapshot_id=None, directorio=SNAPSHOTS_DIR):
+    """
+    Reconstruir un snapshot (por defecto el más reciente) en `destino`.
+    Verifica el SHA-256 de cada chunk y del archivo completo, y PRAGMA
+    integrity_check, antes de reemplazar el destino.
+    """
+    manifiestos = listar_snapshots(directorio)
+    if snapshot_id:
+        manifiestos = [m for m in manifiestos if m['id'] == snapshot_id]
+    if not manifiestos:
+        raise FileNotFoundError(f"No hay snapshot {snapshot_id or 'disponible'} en {directorio}")
+    manifiesto = manifiestos[-1]
+
+    temporal = f"{destino}.{os.getpid()}.tmp"
+    try:
+        total = hashlib.sha256()
+        with open(temporal, 'wb') as f:
+            for digest in manifiesto['chunks']:
+                with open(_ruta_chunk(directorio, digest), 'rb') as chunk:
+                    bloque = zlib.decompress(chunk.read())
+                if hashlib.sha256(bloque).hexdigest() != digest:
+                    raise ValueError(f"Chunk dañado: {digest}")
+                total.update(bloque)
+                f.write(bloque)
+            f.flush()
+            os.fsync(f.fileno())
+        if total.hexdigest() != manifiesto['sha256']:
+            raise ValueError(f"El snapshot {manifiesto['id']} no coincide con su SHA-256")
+
+        conn = sqlite3.connect(temporal)
+        try:
+            resultado = [fila[0] for fila in conn.execute('PRAGMA integrity_check')]
+        finally:
+            conn.close()
+        if resultado != ['ok']:
+            raise sqlite3.DatabaseError(f"integrity_check del snapshot: {'; '.join(resultado[:5])}")
+        os.replace(temporal, destino)
+    except BaseException:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
+    return manifiesto
+
+
+# ========== HILO DE BACKUP ==========
+
 def _realizar_backup():
-    """Copia viajes.db al destino en OneDrive."""
+    """Snapshot incremental de viajes.db en OneDrive. Retorna True si quedó respaldada."""
     try:
-        os.makedirs(DB_DESTINO_DIR, exist_ok=True)
-        shutil.copy2(DB_ORIGEN, DB_DESTINO)
+        resultado = crear_snapshot(DB_ORIGEN, SNAPSHOTS_DIR)
         ahora = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        print(f"[Backup] Copia a OneDrive realizada: {ahora}")
+        if resultado['sin_cambios']:
+            print(f"[Backup] {ahora}: contenido igual al snapshot {resultado['id']}, no se escribió nada")
+        else:
+            print(f"[Backup] Snapshot {resultado['id']} en OneDrive: {ahora} "
+                  f"({resultado['nuevos']}/{resultado['chunks']} chunks nuevos, "
+                  f"{resultado['bytes_escritos'] / 1024:.0f} KB escritos en {resultado['segundos']}s, integridad OK)")
+        return True
     except Exception as e:
-        print(f"[Backup] Error al copiar base de datos: {e}")
+        print(f"[Backup] Error al respaldar base de datos: {e}")
+        return False
 
 
 def _loop_backup():
-    """Bucle del hilo: realiza backup inmediato al iniciar y luego cada 2 horas."""
-    _realizar_backup()
-    while not _detener.wait(timeout=INTERVALO):
-        _realizar_backup()
+    """
+    Bucle del hilo: snapshot inmediato al iniciar y luego cada hora, solo si
+    PRAGMA data_version indica que otra conexión escribió desde el último.
+    """
+    conn = sqlite3.connect(DB_ORIGEN, check_same_thread=False)
+    try:
+        version = None
+        while True:
+            # Se lee antes del snapshot: lo que se escriba durante la copia dispara el siguiente
+            actual = conn.execute('PRAGMA data_version').fetchone()[0]
+            if actual != version and _realizar_backup():
+                version = actual
+            if _detener.wait(timeout=INTERVALO):
+                return
+    finally:
+        conn.close()
 
 
 def iniciar():
@@ -61,9 +369,39 @@ def iniciar():
     _detener.clear()
     _hilo_backup = threading.Thread(target=_loop_backup, daemon=True, name="BackupOneDrive")
     _hilo_backup.start()
-    print(f"[Backup] Backup automático iniciado. Destino: {DB_DESTINO_DIR}")
+    print(f"[Backup] Backup automático iniciado. Destino: {SNAPSHOTS_DIR}")
 
 
 def detener():
     """Detiene el hilo de backup."""
     _detener.set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backups de viajes.db')
+    parser.add_argument('--directorio', default=SNAPSHOTS_DIR, help='Carpeta de snapshots')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    comandos.add_parser('snapshot', help='Crear un snapshot incremental ahora')
+    comandos.add_parser('listar', help='Listar snapshots disponibles')
+    restaurar = comandos.add_parser('restaurar', help='Reconstruir un snapshot en un archivo')
+    restaurar.add_argument('destino', help='Archivo .db a crear (no usar la base en uso)')
+    restaurar.add_argument('--snapshot', help='ID del snapshot (por defecto el más reciente)')
+    copia = comandos.add_parser('copia', help='Copia completa verificada de la base')
+    copia.add_argument('destino', nargs='?', default=DB_DESTINO)
+    args = parser.parse_args()
+
+    if args.comando == 'snapshot':
+        print(crear_snapshot(DB_ORIGEN, args.directorio))
+    elif args.comando == 'listar':
+        for manifiesto in listar_snapshots(args.directorio):
+            print(f"{manifiesto['id']}  {manifiesto['bytes'] / 1024 / 1024:8.1f} MB  {len(manifiesto['chunks'])} chunks")
+    elif args.comando == 'restaurar':
+        if os.path.abspath(args.destino) == os.path.abspath(DB_ORIGEN):
+            parser.error('No se puede restaurar sobre la base en uso: detener el servidor y copiar a mano')
+        manifiesto = restaurar_snapshot(args.destino, args.snapshot, args.directorio)
+        print(f"[Backup] Snapshot {manifiesto['id']} restaurado en {args.destino}, integridad OK")
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.destino)), exist_ok=True)
+        resultado = copiar_base(DB_ORIGEN, args.destino)
+        print(f"[Backup] {DB_ORIGEN} -> {args.destino}: {resultado['bytes']} bytes en {resultado['segundos']}s "
+              f"({resultado['reinicios']} reinicios), integridad OK")
@@ -0,0 +1,139 @@
+"""
+Microbenchmark del renderizador de planillas (pdf_generator.py)
+Mide páginas por segundo en dos etapas:
+  - armado: _crear_pagina_planilla (tablas y estilos de una página)
+  - completo: armado + doc.build (PDF final en memoria)
+
+Uso:
+    python benchmark_pdf.py                       # datos de ejemplo, 8 centros por viaje
+    python benchmark_pdf.py --viaje 100           # datos reales de la base
+    python benchmark_pdf.py --comparar antes.py   # comparar con otra versión del módulo
+
+Para medir antes/después de un cambio:
+    git show HEAD~1:pdf_generator.py > antes.py
+    python benchmark_pdf.py --comparar antes.py
+"""
+import argparse
+import importlib.util
+import time
+from reportlab import rl_config, rl_settings
+
+# PDFs reproducibles (sin fecha ni ID aleatorio) para poder comparar bytes
+rl_config.invariant = 1
+
+import pdf_generator
+
+
+def hojas_de_ejemplo(num_centros=8, num_comidas=6):
+    """Datos sintéticos con todos los campos de la planilla completos"""
+    hojas = []
+    for c in range(num_centros):
+        viaje = {
+            'numero_viaje': '288822', 'casino': f'CASINO EJEMPLO {c}', 'costo_codigo': f'CC{c:03d}',
+            'ruta': 'RUTA NORTE', 'patente_camion': 'ABCD12', 'fecha': '2026-02-05', 'patente_semi': 'WXYZ98',
+            'transporte': 'TRANSPORTES EJEMPLO', 'tipo_camion': 'SEMI', 'termografos_gps': 'T-123',
+            'numero_rampa': '4', 'conductor': 'JUAN PEREZ', 'numero_camion': '17', 'rut': '12.345.678-9',
+            'fecha_hora_llegada_dhl': '2026-02-05 06:00', 'celular': '+56 9 1234 5678',
+            'fecha_hora_salida_dhl': '2026-02-05 07:30', 'num_wencos': 3, 'bin': 2, 'pallets_refrigerado': 4,
+            'pallets': 10, 'pallets_pl_negro_grueso': 1, 'pallets_congelado': 2, 'pallets_chep': 5,
+            'pallets_pl_negro_alternativo': 0, 'pallets_abarrote': 3, 'administrativo_responsable': 'MARIA SOTO',
+            'wencos_congelado': 1, 'revision_limpieza_camion_acciones': 'OK', 'wencos_refrigerado': 2,
+            'check_congelado': 'X', 'check_refrigerado': 'X', 'check_abarrote': '', 'check_implementos': 'X',
+            'check_aseo': 'X', 'check_trazabilidad': '', 'check_plataforma_wtck': 'X',
+            'check_env_correo_wtck': '', 'check_revision_planilla_despacho': 'X',
+        }
+        for i in range(1, 22):
+            viaje[f'guia_{i}'] = f'G{i:05d}' if i % 3 else ''
+        for i in range(1, 6):
+            viaje[f'sello_salida_{i}p'] = f'S{i}{c}'
+            viaje[f'sello_retorno_{i}p'] = f'R{i}{c}'
+        comidas = [
+            {'guia_comida': f'GC{j}', 'proveedor': 'PROVEEDOR EJEMPLO LTDA', 'descripcion': 'COLACION FRIA ENVASADA',
+             'kilo': 12.5 * j, 'bultos': j}
+            for j in range(num_comidas)
+        ]
+        hojas.append((viaje, comidas))
+    return hojas
+
+
+def medir(modulo, hojas, segundos, a85):
+    """Páginas por segundo (armado y completo) y bytes del PDF de una pasada"""
+    generador = modulo.PDFGenerator()
+    rl_config.useA85 = a85
+
+    paginas = 0
+    inicio = time.process_time()
+    while time.process_time() - inicio < segundos:
+        for viaje, comidas in hojas:
+            generador._crear_pagina_planilla(viaje, comidas)
+        paginas += len(hojas)
+    armado = paginas / (time.process_time() - inicio)
+
+    paginas = 0
+    inicio = time.process_time()
+    while time.process_time() - inicio < segundos:
+        contenido = generador._dibujar_hojas(hojas)
+        paginas += len(hojas)
+    completo = paginas / (time.process_time() - inicio)
+
+    return armado, completo, contenido
+
+
+def cargar_modulo(ruta):
+    spec = importlib.util.spec_from_file_location('pdf_generator_comparado', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    if not hasattr(modulo.PDFGenerator, '_dibujar_hojas'):
+        # Versiones anteriores a _dibujar_hojas: mismo documento que generar_pdf_completo
+        modulo.PDFGenerator._dibujar_hojas = pdf_generator.PDFGenerator._dibujar_hojas
+    return modulo
+
+
+def a85_de(modulo):
+    """
+    Codificación ASCII85 con la que dibuja cada versión: rl_config es global,
+    así que una versión que no lo configura se mide con el valor por defecto de ReportLab.
+    """
+    return rl_config.useA85 if hasattr(modulo, 'rl_config') else rl_settings.useA85
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Páginas por segundo del renderizador de planillas')
+    parser.add_argument('--viaje', help='Número de viaje de la base (por defecto: datos de ejemplo)')
+    parser.add_argument('--centros', type=int, default=8, help='Centros por viaje en los datos de ejemplo')
+    parser.add_argument('--segundos', type=float, default=3.0, help='Duración de cada medición')
+    parser.add_argument('--comparar', help='Otra versión de pdf_generator.py para comparar (antes/después)')
+    parser.add_argument('--rondas', type=int, default=3, help='Rondas alternando versiones (se toma la mejor)')
+    args = parser.parse_args()
+
+    if args.viaje:
+        _, hojas = pdf_generator.PDFGenerator()._leer_hojas(args.viaje)
+        if not hojas:
+            parser.error(f'El viaje {args.viaje} no tiene centros de costo')
+    else:
+        hojas = hojas_de_ejemplo(args.centros)
+
+    print(f"Páginas por pasada: {len(hojas)} | {args.rondas} rondas de {args.segundos}s por medición\n")
+
+    versiones = [('actual', pdf_generator, a85_de(pdf_generator))]
+    if args.comparar:
+        modulo = cargar_modulo(args.comparar)
+        versiones.insert(0, (args.comparar, modulo, a85_de(modulo)))
+
+    # Las versiones se alternan en cada ronda para que el ruido de la máquina afecte a ambas por igual
+    resultados = [(0, 0, b'')] * len(versiones)
+    for _ in range(args.rondas):
+        for i, (_, modulo, a85) in enumerate(versiones):
+            armado, completo, contenido = medir(modulo, hojas, args.segundos, a85)
+            resultados[i] = (max(armado, resultados[i][0]), max(completo, resultados[i][1]), contenido)
+    
+    for (nombre, _, _), (armado, completo, contenido) in zip(versiones, resultados):
+        print(f"{nombre:<30} armado: {armado:8.1f} pág/s   completo: {completo:7.1f} pág/s   ({len(contenido)} bytes)")
+
+    if len(resultados) == 2:
+        (armado_0, completo_0, pdf_0), (armado_1, completo_1, pdf_1) = resultados
+        print(f"\nMejora armado: {armado_1 / armado_0:.2f}x | completo: {completo_1 / completo_0:.2f}x")
+        if versiones[0][2] == versiones[1][2]:
+            print(f"PDF idéntico byte a byte: {'SI' if pdf_0 == pdf_1 else 'NO'}")
+        else:
+            print("PDF idéntico byte a byte: no comparable (distinta codificación de streams)")
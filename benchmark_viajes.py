@@ -0,0 +1,458 @@
+"""
+Benchmark de las rutas calientes de viajes sobre datos sintéticos
+Genera una base con el esquema que crea la aplicación (DBManager.init_database,
+maestras de cargar_datos_excel.py y migraciones: índices, triggers y rollup) y
+datos realistas a 10k / 100k / 1M filas de viajes, y mide:
+  - dashboard: calcular_estadisticas (vista diaria sobre viajes, semanal y
+    mensual sobre el rollup), sin y con filtro de administrativo
+  - cada reporte de queries/*.sql (último mes, leyendo todas las filas)
+  - guardar_viaje_con_comidas (a través del escritor único)
+  - buscar_viajes_con_centros_costo (listado y búsqueda)
+  - PDF de un viaje completo (preparar + dibujar, sin guardarlo en pdfs/)
+
+Las bases sintéticas quedan en DIRECTORIO (carpeta temporal del sistema) y se
+reutilizan entre corridas; generar 1m tarda unos minutos. Los resultados
+(mediana, p95, mín. y máx. en ms) se guardan en JSON para comparar versiones.
+
+Uso:
+    python benchmark_viajes.py --escala 10k                  # genera la base si no existe y mide
+    python benchmark_viajes.py --escala 1m --solo dashboard reportes
+    python benchmark_viajes.py --escala 100k --regenerar     # volver a crear la base sintética
+    python benchmark_viajes.py --comparar antes.json despues.json
+
+Para medir antes/después de un cambio:
+    python benchmark_viajes.py --escala 100k --salida antes.json
+    (aplicar el cambio)
+    python benchmark_viajes.py --escala 100k --salida despues.json
+    python benchmark_viajes.py --comparar antes.json despues.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from config import config
+
+ESCALAS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Forma de los datos sintéticos
+CENTROS_POR_VIAJE = 4          # filas de viajes (centros de costo) por número de viaje
+COMIDAS_POR_CENTRO = (0, 6)    # rango de comidas por centro (promedio 3)
+DIAS_HISTORIA = 730
+FILAS_POR_LOTE = 10_000
+
+# Tablas que se llenan; el resto del esquema queda vacío
+TABLAS_DATOS = ('viajes', 'comidas_preparadas', 'rendiciones',
+                'maestras_casinos', 'maestras_choferes', 'maestras_administrativos')
+
+GRUPOS = ('dashboard', 'reportes', 'guardar', 'buscar', 'pdf')
+
+# Una mediana más lenta que esto (proporción) se marca como regresión al comparar
+UMBRAL_REGRESION = 0.10
+
+DIRECTORIO = os.path.join(tempfile.gettempdir(), 'aratrack_benchmark')
+
+TIPOS_CAMION = ['3/4', '12 TONELADAS', 'SEMI', 'RAMPLA', 'CAMION 3/4 REFRIGERADO']
+TRANSPORTES = ['TRANSPORTES EJEMPLO', 'SO.TRANS.BRUNO SAN MARTIN Y CO LTDA', 'LOGISTICA NORTE', 'TRANSPORTES SUR']
+DESCRIPCIONES = ['COLACION FRIA ENVASADA', 'ALMUERZO CALIENTE', 'DESAYUNO', 'CENA', 'IMPLEMENTOS DE ASEO',
+                 'PAN', 'FRUTA', 'LACTEOS', 'CONGELADOS', 'ABARROTES']
+PROVEEDORES = ['PROVEEDOR EJEMPLO LTDA', 'ALIMENTOS DEL NORTE', 'DISTRIBUIDORA CENTRAL', None]
+ESTADOS_RENDICION = ['SIN REVISAR', 'SI', 'NO']
+
+
+def filas_de_escala(escala):
+    """'10k', '100k', '1m' o un número de filas de viajes"""
+    escala = str(escala).lower()
+    return ESCALAS[escala] if escala in ESCALAS else int(escala)
+
+
+# ========== GENERACIÓN DE DATOS ==========
+
+def _rut(rnd, numero):
+    return f"{numero:,}".replace(',', '.') + '-' + rnd.choice('0123456789k')
+
+
+def _crear_esquema(ruta):
+    """
+    Tablas vacías como las crea la aplicación: DBManager.init_database() y las
+    maestras de cargar_datos_excel.py. Los índices, triggers y el rollup los
+    crean las migraciones después de la carga masiva (mucho más rápido que
+    mantenerlos fila a fila).
+    """
+    from cargar_datos_excel import SQL_CREAR_TABLAS
+    from db_manager import DBManager
+    from db_pool import obtener_pool
+
+    DBManager(ruta).init_database()
+    conn = sqlite3.connect(ruta)
+    try:
+        for sql in SQL_CREAR_TABLAS:
+            conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+    # La carga masiva cambia el journal_mode: no puede quedar ninguna conexión abierta
+    obtener_pool(ruta).cerrar()
+
+
+def _insertar(conn, tabla, columnas, filas):
+    sql = f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})"
+    lote = []
+    total = 0
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= FILAS_POR_LOTE:
+            conn.executemany(sql, lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        conn.executemany(sql, lote)
+        total += len(lote)
+    return total
+
+
+def generar_base(ruta, num_viajes, semilla=42):
+    """
+    Crear `ruta` con el esquema de la aplicación y num_viajes filas de viajes
+    con sus comidas, rendiciones y maestras. Retorna el conteo de filas por tabla.
+    """
+    import migraciones
+
+    rnd = random.Random(semilla)
+    inicio = time.perf_counter()
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    for sufijo in ('-wal', '-shm'):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+
+    _crear_esquema(ruta)
+    conn = sqlite3.connect(ruta, isolation_level=None)
+    # Carga masiva: sin journal ni fsync (si se corta, se regenera)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('BEGIN')
+
+    # Maestras: crecen poco con el volumen de viajes
+    num_casinos = max(700, num_viajes // 50)
+    casinos = [(1000 + i, f'CASINO {i:05d}', f'RUTA {i % 40:02d}') for i in range(num_casinos)]
+    # rut es UNIQUE en maestras_choferes: números sin repetir
+    num_choferes = max(600, num_viajes // 50)
+    choferes = [(f'CHOFER {i:05d}', _rut(rnd, numero), f'+569{rnd.randint(10_000_000, 99_999_999)}')
+                for i, numero in enumerate(rnd.sample(range(5_000_000, 25_000_000), num_choferes))]
+    administrativos = [f'ADMINISTRATIVO {i:02d}' for i in range(max(8, num_viajes // 20_000))]
+    patentes = [f'{"".join(rnd.choices("BCDFGHJKLPRSTVWXYZ", k=4))}{rnd.randint(10, 99)}' for _ in range(300)]
+
+    _insertar(conn, 'maestras_casinos', ('codigo_costo', 'casino', 'ruta'), casinos)
+    _insertar(conn, 'maestras_choferes', ('nombre', 'rut', 'celular'), choferes)
+    _insertar(conn, 'maestras_administrativos', ('nombre',), ((a,) for a in administrativos))
+
+    num_numeros = -(-num_viajes // CENTROS_POR_VIAJE)
+    hoy = date.today()
+    columnas_viaje = [fila[1] for fila in conn.execute('PRAGMA table_info(viajes)') if fila[1] != 'id']
+    comidas = []
+
+    def viajes():
+        generadas = 0
+        for n in range(num_numeros):
+            # Números de viaje crecientes en el tiempo, como en producción
+            dia = hoy - timedelta(days=DIAS_HISTORIA - 1 - n * DIAS_HISTORIA // num_numeros)
+            numero_viaje = str(200_000 + n)
+            chofer = rnd.choice(choferes)
+            admin = rnd.choice(administrativos)
+            patente = rnd.choice(patentes)
+            centros = min(CENTROS_POR_VIAJE, num_viajes - generadas)
+            for codigo, casino, ruta_casino in rnd.sample(casinos, centros):
+                llegada = datetime.combine(dia, datetime.min.time()) + timedelta(minutes=rnd.randint(300, 900))
+                num_guias = rnd.randint(1, 21)
+                valores = {
+                    'numero_viaje': numero_viaje, 'casino': casino, 'ruta': ruta_casino,
+                    'tipo_camion': rnd.choice(TIPOS_CAMION), 'patente_camion': patente,
+                    'patente_semi': rnd.choice(patentes), 'numero_rampa': f'R-{rnd.randint(1, 20)}',
+                    'transporte': rnd.choice(TRANSPORTES), 'costo_codigo': str(codigo),
+                    'termografos_gps': 'GPS', 'fecha': dia.isoformat(),
+                    'fecha_hora_llegada_dhl': llegada.strftime('%Y-%m-%dT%H:%M'),
+                    'fecha_hora_salida_dhl': (llegada + timedelta(minutes=rnd.randint(30, 180))).strftime('%Y-%m-%dT%H:%M'),
+                    'conductor': chofer[0], 'rut': chofer[1], 'celular': chofer[2],
+                    'numero_camion': str(rnd.randint(1, 99_999)),
+                    'numero_certificado_fumigacion': f'CF{rnd.randint(1000, 99_999)}',
+                    'revision_limpieza_camion_acciones': 'SI CUMPLE',
+                    'administrativo_responsable': admin
+                }
+                for columna in columnas_viaje:
+                    if columna in valores:
+                        continue
+                    if columna.startswith('check_'):
+                        valores[columna] = 'X' if rnd.random() < 0.8 else ''
+                    elif columna.startswith('guia_'):
+                        indice = int(columna[5:])
+                        valores[columna] = f'G{rnd.randint(1, 999_999)}' if indice <= num_guias else ''
+                    elif columna.startswith('sello_'):
+                        valores[columna] = f'S{rnd.randint(1, 99_999)}'
+                    elif columna.startswith(('pallets', 'wencos', 'num_wencos', 'bin')):
+                        valores[columna] = str(rnd.randint(0, 12))
+                    else:
+                        valores[columna] = None
+                for _ in range(rnd.randint(*COMIDAS_POR_CENTRO)):
+                    comidas.append((numero_viaje, str(codigo), f'GC{rnd.randint(1, 999_999)}',
+                                    rnd.choice(DESCRIPCIONES), round(rnd.uniform(0.5, 80), 1),
+                                    rnd.randint(1, 40), rnd.choice(PROVEEDORES)))
+                generadas += 1
+                yield tuple(valores[c] for c in columnas_viaje)
+            if generadas >= num_viajes:
+                return
+
+    def comidas_pendientes():
+        # Las comidas se generan junto con los viajes: vaciar la lista a medida que se insertan
+        while comidas:
+            lote = comidas[:]
+            comidas.clear()
+            yield from lote
+
+    filas_viajes = 0
+    filas_comidas = 0
+    generador = viajes()
+    while True:
+        bloque = [fila for _, fila in zip(range(FILAS_POR_LOTE), generador)]
+        if not bloque:
+            break
+        filas_viajes += _insertar(conn, 'viajes', columnas_viaje, bloque)
+        filas_comidas += _insertar(
+            conn, 'comidas_preparadas',
+            ('numero_viaje', 'numero_centro_costo', 'guia_comida', 'descripcion', 'kilo', 'bultos', 'proveedor'),
+            comidas_pendientes()
+        )
+
+    _insertar(conn, 'rendiciones', ('nro_viaje', 'pdt', 'ruta', 'fecha_creacion', 'estado_rendicion'), (
+        (200_000 + n, rnd.choice(TRANSPORTES), str(rnd.randint(1, 40)),
+         (hoy - timedelta(days=DIAS_HISTORIA - 1 - n * DIAS_HISTORIA // num_numeros)).isoformat() + ' 12:00:00',
+         rnd.choice(ESTADOS_RENDICION))
+        for n in range(num_numeros)
+    ))
+
+    conn.execute('COMMIT')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+
+    # Índices, triggers y rollup (una sola reconstrucción, la de la migración) y ANALYZE
+    migraciones.aplicar_migraciones(ruta)
+    conn = sqlite3.connect(ruta)
+    conteos = {tabla: conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0] for tabla in TABLAS_DATOS}
+    conn.close()
+    print(f"[Benchmark] Base sintética {ruta} generada en {time.perf_counter() - inicio:.1f}s: "
+          + ', '.join(f'{tabla}={n}' for tabla, n in conteos.items()))
+    return conteos
+
+
+# ========== MEDICIONES ==========
+
+def medir(funcion, repeticiones, calentamiento=1):
+    """Tiempos (ms) de `repeticiones` llamadas después de `calentamiento` llamadas descartadas"""
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        'mediana_ms': round(statistics.median(tiempos), 3),
+        'p95_ms': round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+        'min_ms': round(tiempos[0], 3),
+        'max_ms': round(tiempos[-1], 3),
+        'repeticiones': repeticiones
+    }
+
+
+def casos(ruta, grupos):
+    """(grupo, nombre, función) de cada medición; los módulos se importan con config apuntando a `ruta`"""
+    config.db_path = ruta
+    import estadisticas_dashboard
+    from db_pool import obtener_conexion
+    from db_manager import DBManager
+    from escritor_db import escritor_db
+    from maestras_manager import MaestrasManager
+    from pdf_generator import PDFGenerator
+    from registro_queries import RegistroQueries
+
+    conn = sqlite3.connect(ruta)
+    fecha_min, fecha_max = conn.execute('SELECT MIN(fecha), MAX(fecha) FROM viajes').fetchone()
+    admin = conn.execute('SELECT nombre FROM maestras_administrativos LIMIT 1').fetchone()[0]
+    numero_pdf = conn.execute(
+        'SELECT numero_viaje FROM viajes GROUP BY numero_viaje ORDER BY COUNT(*) DESC, numero_viaje DESC LIMIT 1'
+    ).fetchone()[0]
+    conn.close()
+    mes_inicio = (date.fromisoformat(fecha_max) - timedelta(days=30)).isoformat()
+
+    def dashboard(fecha_inicio, fecha_fin, administrativo, vista):
+        def ejecutar():
+            c = obtener_conexion(ruta)
+            try:
+                estadisticas_dashboard.calcular_estadisticas(c, fecha_inicio, fecha_fin, administrativo, vista)
+            finally:
+                c.close()
+        return ejecutar
+
+    if 'dashboard' in grupos:
+        for vista in ('diaria', 'semanal', 'mensual'):
+            yield 'dashboard', f'dashboard_{vista}_mes', dashboard(mes_inicio, fecha_max, '', vista)
+            yield 'dashboard', f'dashboard_{vista}_todo', dashboard(fecha_min, fecha_max, '', vista)
+        yield 'dashboard', 'dashboard_diaria_todo_administrativo', dashboard(fecha_min, fecha_max, admin, 'diaria')
+
+    if 'reportes' in grupos:
+        valores = {'fecha_inicio': mes_inicio, 'fecha_fin': fecha_max, 'fecha': fecha_max}
+        for consulta in RegistroQueries().listar():
+            if any(p not in valores for p in consulta.parametros):
+                print(f"[Benchmark] Reporte {consulta.nombre} omitido: parámetros {consulta.parametros}")
+                continue
+
+            def reporte(consulta=consulta):
+                c = obtener_conexion(ruta)
+                try:
+                    cursor = c.execute(consulta.sql, [valores[p] for p in consulta.parametros])
+                    while cursor.fetchmany(1000):
+                        pass
+                finally:
+                    c.close()
+            yield 'reportes', f'reporte_{consulta.nombre}', reporte
+
+    if 'guardar' in grupos:
+        # El escritor único se crea al importar: apuntarlo a la base sintética aunque ya existiera
+        escritor_db.db_path = ruta
+        db_manager = DBManager()
+        contador = iter(range(10**9))
+        viaje_base = {'casino': 'CASINO BENCHMARK', 'ruta': 'RUTA 00', 'fecha': fecha_max,
+                      'administrativo_responsable': admin, 'conductor': 'CHOFER 00000', 'patente_camion': 'BNCH01'}
+        comidas = [{'guia_comida': f'GC{i}', 'descripcion': 'ALMUERZO CALIENTE', 'kilo': 10.5, 'bultos': 3,
+                    'proveedor': 'PROVEEDOR EJEMPLO LTDA'} for i in range(4)]
+
+        def guardar():
+            viaje = dict(viaje_base, numero_viaje=f'BENCH{next(contador)}', costo_codigo='1000')
+            db_manager.guardar_viaje_con_comidas(viaje, comidas)
+        yield 'guardar', 'guardar_viaje_con_comidas', guardar
+
+    if 'buscar' in grupos:
+        maestras = MaestrasManager(ruta)
+        yield 'buscar', 'buscar_viajes_listado', lambda: maestras.buscar_viajes_con_centros_costo()
+        yield 'buscar', 'buscar_viajes_termino', lambda: maestras.buscar_viajes_con_centros_costo(numero_pdf[:4])
+
+    if 'pdf' in grupos:
+        generador = PDFGenerator()
+
+        def pdf():
+            # Como /pdf/viaje ante un fallo de caché, pero sin escribir en pdfs/ ni en el manifiesto
+            generador.dibujar_pdf_completo(generador.preparar_pdf_completo(numero_pdf), persistir=False)
+        yield 'pdf', f'pdf_viaje_{CENTROS_POR_VIAJE}_centros', pdf
+
+
+def limpiar(ruta):
+    """Borrar los viajes que insertó la medición de guardar (la base queda igual para la próxima corrida)"""
+    conn = sqlite3.connect(ruta, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute("DELETE FROM comidas_preparadas WHERE numero_viaje LIKE 'BENCH%'")
+        conn.execute("DELETE FROM viajes WHERE numero_viaje LIKE 'BENCH%'")
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+
+def _version_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def ejecutar(ruta, escala, grupos, repeticiones):
+    resultados = {}
+    try:
+        for grupo, nombre, funcion in casos(ruta, grupos):
+            resultado = medir(funcion, repeticiones)
+            resultado['grupo'] = grupo
+            resultados[nombre] = resultado
+            print(f"{nombre:<45} mediana {resultado['mediana_ms']:10.2f} ms   p95 {resultado['p95_ms']:10.2f} ms")
+    finally:
+        limpiar(ruta)
+        from escritor_db import escritor_db
+        escritor_db.detener()
+
+    conn = sqlite3.connect(ruta)
+    conteos = {tabla: conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0] for tabla in TABLAS_DATOS}
+    conn.close()
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'version': _version_git(),
+        'escala': escala,
+        'filas': conteos,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'repeticiones': repeticiones,
+        'resultados': resultados
+    }
+
+
+def comparar(antes, despues):
+    """Tabla antes/después por caso. Retorna la cantidad de regresiones"""
+    print(f"{'caso':<45} {'antes ms':>10} {'después ms':>11} {'cambio':>8}")
+    regresiones = 0
+    for nombre, resultado in despues['resultados'].items():
+        anterior = antes['resultados'].get(nombre)
+        if anterior is None:
+            print(f"{nombre:<45} {'-':>10} {resultado['mediana_ms']:>11.2f}      nuevo")
+            continue
+        proporcion = resultado['mediana_ms'] / anterior['mediana_ms'] if anterior['mediana_ms'] else 1.0
+        marca = ''
+        if proporcion > 1 + UMBRAL_REGRESION:
+            marca = '  REGRESIÓN'
+            regresiones += 1
+        print(f"{nombre:<45} {anterior['mediana_ms']:>10.2f} {resultado['mediana_ms']:>11.2f} "
+              f"{proporcion:>7.2f}x{marca}")
+    if antes.get('filas') != despues.get('filas'):
+        print("\nAtención: las corridas usan distinta cantidad de filas, no son comparables")
+    return regresiones
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de rutas calientes sobre datos sintéticos')
+    parser.add_argument('--escala', default='10k', help='10k, 100k, 1m o cantidad de filas de viajes')
+    parser.add_argument('--solo', nargs='+', choices=GRUPOS, default=list(GRUPOS), help='Grupos a medir')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--directorio', default=DIRECTORIO, help='Carpeta de las bases sintéticas')
+    parser.add_argument('--regenerar', action='store_true', help='Volver a generar la base sintética')
+    parser.add_argument('--salida', help='Archivo JSON de resultados')
+    parser.add_argument('--comparar', nargs=2, metavar=('ANTES', 'DESPUES'), help='Comparar dos JSON de resultados')
+    args = parser.parse_args()
+
+    if args.comparar:
+        with open(args.comparar[0], encoding='utf-8') as f:
+            antes = json.load(f)
+        with open(args.comparar[1], encoding='utf-8') as f:
+            despues = json.load(f)
+        sys.exit(1 if comparar(antes, despues) else 0)
+
+    num_viajes = filas_de_escala(args.escala)
+    os.makedirs(args.directorio, exist_ok=True)
+    ruta = os.path.join(args.directorio, f'viajes_{args.escala.lower()}.db')
+    if args.regenerar or not os.path.exists(ruta):
+        generar_base(ruta, num_viajes)
+
+    print(f"\nBase: {ruta} | {args.repeticiones} repeticiones por caso\n")
+    resultado = ejecutar(ruta, args.escala.lower(), args.solo, args.repeticiones)
+
+    salida = args.salida or os.path.join(
+        args.directorio, f"resultado_{args.escala.lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados: {salida}")
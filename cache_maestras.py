@@ -0,0 +1,169 @@
+"""
+Caché en memoria de las tablas maestras (casinos, choferes, administrativos,
+proveedores y transportes).
+
+Cada entrada guarda la respuesta ya serializada, su ETag y la versión de las
+tablas de las que depende. Las escrituras hechas por la aplicación llaman a
+invalidar(tabla), que incrementa el contador de versión de esa tabla y deja
+obsoletas todas las entradas que dependen de ella.
+
+Los procesos externos (cargar_datos_excel.py) no ven esos contadores: en su
+misma transacción llaman a incrementar_version(), que sube la fila de cada
+tabla en maestras_version (migración v9). obtener() suma esas versiones a la
+de la entrada; la tabla se consulta como máximo una vez cada
+INTERVALO_VERSIONES_EXTERNAS (los aciertos no van a SQLite), así un cambio
+externo se ve en alrededor de un segundo. El TTL queda para los scripts que
+no la actualizan.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from config import config
+from db_pool import obtener_conexion
+
+# Tablas maestras con contador de versión
+TABLAS_MAESTRAS = (
+    'maestras_casinos',
+    'maestras_choferes',
+    'maestras_administrativos',
+    'proveedores',
+    'transportes',
+)
+
+# Segundos durante los que se reutiliza la última lectura de maestras_version
+INTERVALO_VERSIONES_EXTERNAS = 1.0
+
+# Versión compartida entre procesos (una fila por tabla maestra)
+SQL_CREAR_TABLA = '''
+    CREATE TABLE IF NOT EXISTS maestras_version (
+        tabla TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+'''
+SQL_INICIAR_VERSIONES = '''
+    INSERT OR IGNORE INTO maestras_version (tabla)
+    VALUES {}
+'''.format(', '.join(f"('{tabla}')" for tabla in TABLAS_MAESTRAS))
+
+
+def incrementar_version(cursor, tablas):
+    """
+    Marcar tablas como modificadas para los demás procesos. Se llama dentro de
+    la transacción que las modifica, así la versión sube junto con los datos.
+    """
+    cursor.executemany(
+        'UPDATE maestras_version SET version = version + 1 WHERE tabla = ?',
+        [(tabla,) for tabla in tablas]
+    )
+
+
+def _leer_versiones_externas():
+    """Versiones de maestras_version ({} si la migración v9 aún no corrió)"""
+    conn = obtener_conexion()
+    try:
+        return {fila[0]: fila[1] for fila in conn.execute('SELECT tabla, version FROM maestras_version')}
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+
+class EntradaCache:
+    """Respuesta cacheada: valor original, cuerpo JSON y ETag"""
+    __slots__ = ('valor', 'cuerpo', 'etag', 'versiones', 'expira')
+
+    def __init__(self, valor, versiones, expira):
+        self.valor = valor
+        self.cuerpo = json.dumps(valor, ensure_ascii=False, sort_keys=True, default=str)
+        # ETag fuerte derivado del contenido: estable entre recargas si nada cambió
+        self.etag = hashlib.sha1(self.cuerpo.encode('utf-8')).hexdigest()
+        self.versiones = versiones
+        self.expira = expira
+
+
+class CacheMaestras:
+    """Caché con TTL e invalidación por contador de versión de cada tabla"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else config.maestras_cache_ttl
+        self._lock = threading.Lock()
+        self._versiones = {tabla: 0 for tabla in TABLAS_MAESTRAS}
+        self._entradas = {}
+        # Última lectura de maestras_version y cuándo se hizo (time.monotonic)
+        self._externas = {}
+        self._externas_leidas = None
+
+        # Métricas
+        self._aciertos = 0
+        self._fallos = 0
+        self._invalidaciones = 0
+
+    def version(self, tabla):
+        """Versión actual de una tabla (0 si nunca se invalidó)"""
+        with self._lock:
+            return self._versiones.get(tabla, 0)
+
+    def invalidar(self, *tablas):
+        """Marcar tablas como modificadas: sus entradas dejan de ser válidas"""
+        with self._lock:
+            for tabla in tablas:
+                self._versiones[tabla] = self._versiones.get(tabla, 0) + 1
+            self._invalidaciones += 1
+
+    def _versiones_externas(self, ahora):
+        """maestras_version, leída como máximo una vez cada INTERVALO_VERSIONES_EXTERNAS"""
+        with self._lock:
+            if self._externas_leidas is not None and ahora - self._externas_leidas < INTERVALO_VERSIONES_EXTERNAS:
+                return self._externas
+            # Marcar antes de leer: los demás hilos siguen con la lectura anterior mientras tanto
+            self._externas_leidas = ahora
+        externas = _leer_versiones_externas()
+        with self._lock:
+            self._externas = externas
+        return externas
+
+    def obtener(self, clave, tablas, cargar):
+        """
+        Retorna la EntradaCache de `clave`, llamando a cargar() si no existe,
+        expiró o alguna de `tablas` cambió de versión (en este proceso o en
+        maestras_version) desde que se cargó.
+        """
+        ahora = time.monotonic()
+        externas = self._versiones_externas(ahora)
+        with self._lock:
+            versiones = tuple((self._versiones.get(tabla, 0), externas.get(tabla, 0)) for tabla in tablas)
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.versiones == versiones and entrada.expira > ahora:
+                self._aciertos += 1
+                return entrada
+            self._fallos += 1
+
+        # Cargar fuera del lock. Las versiones se tomaron ANTES de leer: si una
+        # escritura ocurre durante la carga, la entrada nace obsoleta y se recarga.
+        entrada = EntradaCache(cargar(), versiones, ahora + self.ttl)
+        with self._lock:
+            self._entradas[clave] = entrada
+        return entrada
+
+    def limpiar(self):
+        """Descartar todas las entradas"""
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """Métricas de uso de la caché"""
+        with self._lock:
+            return {
+                'ttl': self.ttl,
+                'entradas': len(self._entradas),
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'invalidaciones': self._invalidaciones,
+                'versiones': dict(self._versiones)
+            }
+
+
+# Instancia global compartida por los managers y app_web
+cache_maestras = CacheMaestras()
@@ -0,0 +1,238 @@
+"""
+Caché de PDFs direccionada por contenido
+Cada PDF generado queda registrado en la tabla pdf_cache (ver migraciones.py, v6)
+con la huella (sha256) de los datos con los que se dibujó. Si al volver a
+pedirlo la huella de los datos actuales coincide y el archivo sigue en disco,
+se entrega el archivo existente sin volver a dibujarlo.
+
+La carpeta pdfs/ tiene un tamaño máximo: al superarlo se borran primero los
+PDFs usados hace más tiempo. Solo se desalojan los PDFs registrados en el
+manifiesto; los demás archivos de la carpeta (p. ej. lote_*.pdf de la cola de
+trabajos) tienen su propia limpieza.
+
+Las escrituras del manifiesto pasan por el escritor único (escritor_db.py). Los
+aciertos se acumulan en memoria y se escriben de a lotes, así servir un PDF
+desde la caché no espera un COMMIT.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from config import config
+from db_pool import obtener_conexion
+from escritor_db import escritor_db
+
+SQL_CREAR_TABLA = '''
+    CREATE TABLE IF NOT EXISTS pdf_cache (
+        archivo TEXT PRIMARY KEY,
+        huella TEXT NOT NULL,
+        tamano INTEGER NOT NULL,
+        aciertos INTEGER DEFAULT 0,
+        creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        ultimo_acceso TIMESTAMP
+    )
+'''
+
+SQL_CREAR_INDICE = 'CREATE INDEX IF NOT EXISTS idx_pdf_cache_ultimo_acceso ON pdf_cache(ultimo_acceso)'
+
+# Aciertos que se acumulan en memoria antes de escribirlos en pdf_cache
+ACIERTOS_POR_LOTE = 50
+
+
+def _ahora():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _escribir_accesos(cursor, accesos):
+    """Escritura encolada: sumar aciertos y actualizar ultimo_acceso ({archivo: [aciertos, ultimo_acceso]})"""
+    cursor.executemany(
+        'UPDATE pdf_cache SET aciertos = aciertos + ?, ultimo_acceso = ? WHERE archivo = ?',
+        [(aciertos, ultimo_acceso, archivo) for archivo, (aciertos, ultimo_acceso) in accesos.items()]
+    )
+
+
+def _registrar_archivo(cursor, archivo, huella, tamano):
+    ahora = _ahora()
+    cursor.execute('''
+        INSERT OR REPLACE INTO pdf_cache (archivo, huella, tamano, aciertos, creado_en, ultimo_acceso)
+        VALUES (?, ?, ?, 0, ?, ?)
+    ''', (archivo, huella, tamano, ahora, ahora))
+
+
+def _eliminar_archivos(cursor, archivos):
+    cursor.executemany('DELETE FROM pdf_cache WHERE archivo = ?', [(archivo,) for archivo in archivos])
+
+
+def calcular_huella(*datos):
+    """sha256 de los datos serializados en forma canónica (claves ordenadas)"""
+    texto = json.dumps(datos, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class CachePDF:
+    """Manifiesto de PDFs generados con su huella de datos, contadores y desalojo por tamaño"""
+
+    def __init__(self, carpeta, db_path=None, max_bytes=None):
+        self.carpeta = carpeta
+        self.db_path = db_path or config.get_db_path()
+        self.max_bytes = max_bytes if max_bytes is not None else int(config.pdf_cache_max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+        # Métricas (fallos = PDFs dibujados y registrados; un pedido que cae en
+        # la cola de trabajos pasa dos veces por vigente() pero se dibuja una)
+        self._aciertos = 0
+        self._fallos = 0
+        self._desalojados = 0
+        self._aviso_manifiesto = False
+
+        # Aciertos aún no escritos en el manifiesto: {archivo: [aciertos, ultimo_acceso]}
+        self._accesos_pendientes = {}
+        self._aciertos_pendientes = 0
+
+    def _avisar(self, error):
+        """Informar una sola vez que el manifiesto no se puede usar"""
+        if not self._aviso_manifiesto:
+            self._aviso_manifiesto = True
+            print(f"[CachePDF] Manifiesto no disponible, los PDFs se regeneran siempre: {error}")
+
+    def vigente(self, archivo, huella):
+        """True si `archivo` ya existe y fue generado con estos mismos datos"""
+        ruta = os.path.join(self.carpeta, archivo)
+        try:
+            conn = obtener_conexion(self.db_path)
+            try:
+                row = conn.execute('SELECT huella, tamano FROM pdf_cache WHERE archivo = ?', (archivo,)).fetchone()
+                acierto = (row is not None and row[0] == huella
+                           and os.path.exists(ruta) and os.path.getsize(ruta) == row[1])
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as e:
+            # Sin tabla de manifiesto (migraciones no aplicadas): siempre se regenera
+            self._avisar(e)
+            acierto = False
+
+        with self._lock:
+            if acierto:
+                self._aciertos += 1
+                pendiente = self._accesos_pendientes.setdefault(archivo, [0, None])
+                pendiente[0] += 1
+                pendiente[1] = _ahora()
+                self._aciertos_pendientes += 1
+                lleno = self._aciertos_pendientes >= ACIERTOS_POR_LOTE
+            else:
+                lleno = False
+        if lleno:
+            self.guardar_accesos()
+        return acierto
+
+    def guardar_accesos(self):
+        """Escribir en el manifiesto los aciertos acumulados en memoria"""
+        with self._lock:
+            accesos = self._accesos_pendientes
+            self._accesos_pendientes = {}
+            self._aciertos_pendientes = 0
+        if not accesos:
+            return
+        try:
+            escritor_db.ejecutar(_escribir_accesos, accesos)
+        except sqlite3.Error as e:
+            self._avisar(e)
+
+    def registrar(self, archivo, huella):
+        """Registrar un PDF recién escrito en la carpeta y desalojar si se superó el tamaño máximo"""
+        ruta = os.path.join(self.carpeta, archivo)
+        with self._lock:
+            self._fallos += 1
+            # Los aciertos del archivo anterior con este nombre ya no corresponden
+            pendiente = self._accesos_pendientes.pop(archivo, None)
+            if pendiente:
+                self._aciertos_pendientes -= pendiente[0]
+        try:
+            escritor_db.ejecutar(_registrar_archivo, archivo, huella, os.path.getsize(ruta))
+        except sqlite3.OperationalError as e:
+            self._avisar(e)
+            return
+        self.desalojar(conservar=archivo)
+
+    def desalojar(self, conservar=None):
+        """
+        Borrar PDFs del manifiesto, del uso más antiguo al más reciente, hasta
+        que los PDFs registrados queden bajo max_bytes. Los archivos de la
+        carpeta sin registro en el manifiesto no se tocan.
+        El total sale de la columna tamano del manifiesto (un SUM, sin recorrer
+        la carpeta): la lista por uso solo se lee cuando se superó el máximo.
+        """
+        if not self.max_bytes:
+            return 0
+        try:
+            conn = obtener_conexion(self.db_path)
+            try:
+                total = conn.execute('SELECT COALESCE(SUM(tamano), 0) FROM pdf_cache').fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.OperationalError:
+            return 0
+        if total <= self.max_bytes:
+            return 0
+
+        # El orden de desalojo usa ultimo_acceso: primero escribir los aciertos pendientes
+        self.guardar_accesos()
+        conn = obtener_conexion(self.db_path)
+        try:
+            registrados = conn.execute(
+                'SELECT archivo, tamano FROM pdf_cache ORDER BY ultimo_acceso, archivo'
+            ).fetchall()
+        finally:
+            conn.close()
+
+        borrados = []
+        huerfanos = []
+        for nombre, tamano in registrados:
+            if total <= self.max_bytes:
+                break
+            if nombre == conservar:
+                continue
+            try:
+                os.remove(os.path.join(self.carpeta, nombre))
+            except FileNotFoundError:
+                # Registro de un PDF borrado a mano: se limpia junto con los desalojados
+                huerfanos.append(nombre)
+                total -= tamano
+                continue
+            except OSError:
+                continue
+            total -= tamano
+            borrados.append(nombre)
+
+        try:
+            escritor_db.ejecutar(_eliminar_archivos, borrados + huerfanos)
+        except sqlite3.Error as e:
+            print(f"[CachePDF] Error al limpiar el manifiesto: {e}")
+
+        with self._lock:
+            self._desalojados += len(borrados)
+        print(f"[CachePDF] {len(borrados)} PDFs desalojados (caché: {total / 1024 / 1024:.1f} MB)")
+        return len(borrados)
+
+    def estadisticas(self):
+        """Métricas de uso de la caché"""
+        try:
+            conn = obtener_conexion(self.db_path)
+            try:
+                entradas, bytes_totales = conn.execute('SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM pdf_cache').fetchone()
+            finally:
+                conn.close()
+        except sqlite3.OperationalError:
+            entradas, bytes_totales = 0, 0
+
+        with self._lock:
+            return {
+                'entradas': entradas,
+                'bytes': bytes_totales,
+                'max_bytes': self.max_bytes,
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'desalojados': self._desalojados
+            }
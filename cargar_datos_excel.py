@@ -1,146 +1,331 @@
 """
 Script para cargar datos desde datos.xlsx a las tablas maestras
+
+Uso:
+    python cargar_datos_excel.py              -> sincronización incremental (por defecto)
+    python cargar_datos_excel.py --simular    -> muestra los cambios sin aplicarlos
+    python cargar_datos_excel.py --completa   -> vacía las maestras y las carga de nuevo
+
+La sincronización compara cada pestaña con su tabla por la clave (codigo_costo,
+rut o nombre) y aplica solo altas, modificaciones y bajas lógicas (activo = 0)
+en una única transacción corta, así que se puede ejecutar con el servidor en
+marcha. La misma transacción sube la versión de las tablas modificadas en
+maestras_version, así la caché de maestras del servidor los ve en la siguiente
+consulta sin esperar el TTL.
 """
+import argparse
 import sqlite3
+import time
 import openpyxl
-from datetime import datetime
+from config import config
+from db_pool import obtener_conexion
+from cache_maestras import incrementar_version
+import migraciones
 
-def cargar_datos_excel():
-    """Cargar datos desde el archivo Excel a las tablas maestras"""
-    
-    print("📁 Abriendo archivo datos.xlsx...")
-    try:
-        workbook = openpyxl.load_workbook('datos.xlsx')
-    except Exception as e:
-        print(f"❌ Error al abrir el archivo: {e}")
-        return
-    
-    conn = sqlite3.connect('viajes.db')
-    cursor = conn.cursor()
-    
-    # Reiniciar tablas maestras
-    print("\n🔄 Reiniciando tablas maestras...")
-    cursor.execute("DROP TABLE IF EXISTS maestras_casinos")
-    cursor.execute("DROP TABLE IF EXISTS maestras_choferes")
-    cursor.execute("DROP TABLE IF EXISTS maestras_administrativos")
-    
-    # Recrear tablas
-    cursor.execute("""
-        CREATE TABLE maestras_casinos (
+# Tabla (y pestaña del Excel) -> (clave, campos de datos)
+MAESTRAS = {
+    'maestras_casinos': ('codigo_costo', ('casino', 'ruta')),
+    'maestras_choferes': ('rut', ('nombre', 'celular')),
+    'maestras_administrativos': ('nombre', ()),
+}
+
+# Esquema original de las maestras (la columna activo la agrega la migración v7)
+SQL_CREAR_TABLAS = [
+    """
+        CREATE TABLE IF NOT EXISTS maestras_casinos (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             codigo_costo INTEGER UNIQUE NOT NULL,
             casino TEXT NOT NULL,
             ruta TEXT,
             fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE maestras_choferes (
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS maestras_choferes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nombre TEXT UNIQUE NOT NULL,
             rut TEXT UNIQUE NOT NULL,
             celular TEXT,
             fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE maestras_administrativos (
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS maestras_administrativos (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nombre TEXT UNIQUE NOT NULL,
             fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    """)
-    
-    print("✅ Tablas maestras reiniciadas")
-    
-    # Cargar datos de cada pestaña
-    
-    # 1. Cargar maestras_casinos
-    if 'maestras_casinos' in workbook.sheetnames:
-        print("\n📊 Cargando maestras_casinos...")
-        sheet = workbook['maestras_casinos']
-        rows = list(sheet.iter_rows(min_row=2, values_only=True))  # Saltar encabezado
-        
-        for row in rows:
-            if row[0] is not None:  # Si hay codigo_costo
+    """,
+]
+
+# Columnas de cada pestaña: campo -> nombres aceptados en el encabezado.
+# Si el encabezado no se reconoce se usa la posición (el orden de este dict).
+COLUMNAS_EXCEL = {
+    'maestras_casinos': {
+        'codigo_costo': ('codigo_costo', 'codigo_centro_costo'),
+        'casino': ('casino', 'nombre_casino'),
+        'ruta': ('ruta',),
+    },
+    'maestras_choferes': {
+        'nombre': ('nombre',),
+        'rut': ('rut',),
+        'celular': ('celular', 'telefono'),
+    },
+    'maestras_administrativos': {
+        'nombre': ('nombre',),
+    },
+}
+
+# Cambios que se listan por tipo en el resumen
+MAX_DETALLE = 20
+
+ICONOS = {
+    'maestras_casinos': '🏢 Casinos/Centros de Costo',
+    'maestras_choferes': '🚗 Choferes',
+    'maestras_administrativos': '👤 Administrativos',
+}
+
+
+def _texto(valor, mayusculas=True):
+    if not valor:
+        return ''
+    texto = str(valor).strip()
+    return texto.upper() if mayusculas else texto
+
+
+def _codigo_costo(valor):
+    """Mismo valor que guarda la columna INTEGER (101.0 y '101' -> 101)"""
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, str) and valor.strip().isdigit():
+        return int(valor.strip())
+    return valor
+
+
+def _posiciones(tabla, encabezado):
+    """Índice de cada campo en la fila según el encabezado de la pestaña"""
+    nombres = [str(c).strip().lower() if c is not None else '' for c in encabezado or ()]
+    posiciones = {}
+    for orden, (campo, alias) in enumerate(COLUMNAS_EXCEL[tabla].items()):
+        posiciones[campo] = next((nombres.index(a) for a in alias if a in nombres), orden)
+    return posiciones
+
+
+def _normalizar(tabla, valores):
+    """(clave, (campos...)) de una fila del Excel ({campo: valor}), o None si no tiene clave"""
+    if tabla == 'maestras_casinos':
+        if valores['codigo_costo'] is None:
+            return None
+        return _codigo_costo(valores['codigo_costo']), (_texto(valores['casino']), _texto(valores['ruta']))
+    if tabla == 'maestras_choferes':
+        if valores['nombre'] is None:
+            return None
+        # Celular no se convierte a mayúsculas
+        return _texto(valores['rut']), (_texto(valores['nombre']), _texto(valores['celular'], mayusculas=False))
+    if valores['nombre'] is None:
+        return None
+    return _texto(valores['nombre']), ()
+
+
+def leer_excel(archivo):
+    """
+    {tabla: {clave: (campos...)}} con las pestañas presentes en el Excel.
+    Ante claves repetidas se conserva la primera fila.
+    """
+    workbook = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        datos = {}
+        for tabla in MAESTRAS:
+            if tabla not in workbook.sheetnames:
+                continue
+            filas_excel = workbook[tabla].iter_rows(values_only=True)
+            posiciones = _posiciones(tabla, next(filas_excel, None))
+            filas = {}
+            for row in filas_excel:
+                valores = {campo: row[i] if i < len(row) else None for campo, i in posiciones.items()}
+                normalizada = _normalizar(tabla, valores)
+                if normalizada is None:
+                    continue
+                clave, campos = normalizada
+                if clave == '':
+                    print(f"  ⚠️  {tabla}: fila sin {MAESTRAS[tabla][0]} omitida: {row}")
+                elif clave in filas:
+                    print(f"  ⚠️  {tabla}: {MAESTRAS[tabla][0]} duplicado: {clave}")
+                else:
+                    filas[clave] = campos
+            datos[tabla] = filas
+        return datos
+    finally:
+        workbook.close()
+
+
+def _clave_comparable(valor):
+    """Las claves de texto se comparan sin espacios ni diferencias de mayúsculas (rut ...-k / ...-K)"""
+    return valor.strip().upper() if isinstance(valor, str) else valor
+
+
+def _diferencias(cursor, tabla, filas):
+    """
+    Comparar la pestaña con la tabla: (altas, modificados, bajas, sin_cambios).
+    Modificados y bajas llevan la clave tal como está guardada en la tabla.
+    """
+    clave, campos = MAESTRAS[tabla]
+    columnas = ', '.join((clave,) + campos)
+    actuales = {}
+    for row in cursor.execute(f'SELECT {columnas}, activo FROM {tabla}'):
+        actuales[_clave_comparable(row[0])] = (row[0], tuple('' if v is None else v for v in row[1:-1]), row[-1])
+
+    altas = [(k, v) for k, v in filas.items() if k not in actuales]
+    modificados = [(actuales[k][0], v) for k, v in filas.items()
+                   if k in actuales and (actuales[k][1] != v or not actuales[k][2])]
+    bajas = [guardada for k, (guardada, _, activo) in actuales.items() if activo and k not in filas]
+    sin_cambios = len(filas) - len(altas) - len(modificados)
+    return altas, modificados, bajas, sin_cambios
+
+
+def _mostrar_detalle(simbolo, cambios):
+    for cambio in cambios[:MAX_DETALLE]:
+        print(f"     {simbolo} {cambio}")
+    if len(cambios) > MAX_DETALLE:
+        print(f"     ... y {len(cambios) - MAX_DETALLE} más")
+
+
+def sincronizar(conn, datos, simular=False):
+    """
+    Aplicar altas, modificaciones (incluye reactivar) y bajas lógicas de todas
+    las pestañas en una sola transacción. Retorna {tabla: conteos}.
+    """
+    cursor = conn.cursor()
+    resumen = {}
+    inicio = time.perf_counter()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for tabla, filas in datos.items():
+            clave, campos = MAESTRAS[tabla]
+            if not filas:
+                # Una pestaña vacía daría de baja toda la tabla: probablemente es un error del archivo
+                print(f"\n⚠️  Pestaña {tabla} sin registros: no se modifica la tabla")
+                continue
+
+            pendientes_altas, pendientes_modificados, bajas, sin_cambios = _diferencias(cursor, tabla, filas)
+            altas, modificados, conflictos = [], [], []
+
+            # Fila por fila: un conflicto (p. ej. nombre de chofer repetido con otro rut) no frena al resto
+            for k, valores in pendientes_altas:
                 try:
-                    # Convertir a mayúsculas
-                    casino = str(row[1]).strip().upper() if row[1] else ''
-                    ruta = str(row[2]).strip().upper() if len(row) > 2 and row[2] else ''
-                    cursor.execute("""
-                        INSERT INTO maestras_casinos (codigo_costo, casino, ruta)
-                        VALUES (?, ?, ?)
-                    """, (row[0], casino, ruta))
+                    cursor.execute(
+                        f"INSERT INTO {tabla} ({', '.join((clave,) + campos)}) VALUES ({', '.join('?' * (len(campos) + 1))})",
+                        (k,) + valores
+                    )
+                    altas.append((k, valores))
                 except sqlite3.IntegrityError as e:
-                    print(f"  ⚠️  Código de costo duplicado: {row[0]}")
-        
-        print(f"  ✅ {len(rows)} registros procesados")
-    
-    # 2. Cargar maestras_choferes
-    if 'maestras_choferes' in workbook.sheetnames:
-        print("\n📊 Cargando maestras_choferes...")
-        sheet = workbook['maestras_choferes']
-        rows = list(sheet.iter_rows(min_row=2, values_only=True))
-        
-        for row in rows:
-            if row[0] is not None:  # Si hay nombre
+                    conflictos.append(f"{k}: {e}")
+
+            asignaciones = ''.join(f', {campo} = ?' for campo in campos)
+            for k, valores in pendientes_modificados:
                 try:
-                    # Convertir a mayúsculas
-                    nombre = str(row[0]).strip().upper() if row[0] else ''
-                    rut = str(row[1]).strip().upper() if row[1] else ''
-                    celular = str(row[2]).strip() if len(row) > 2 and row[2] else ''  # Celular no se convierte a mayúsculas
-                    cursor.execute("""
-                        INSERT INTO maestras_choferes (nombre, rut, celular)
-                        VALUES (?, ?, ?)
-                    """, (nombre, rut, celular))
+                    cursor.execute(f"UPDATE {tabla} SET activo = 1{asignaciones} WHERE {clave} = ?", valores + (k,))
+                    modificados.append((k, valores))
                 except sqlite3.IntegrityError as e:
-                    print(f"  ⚠️  Nombre o RUT duplicado: {row[0]}")
-        
-        print(f"  ✅ {len(rows)} registros procesados")
-    
-    # 3. Cargar maestras_administrativos
-    if 'maestras_administrativos' in workbook.sheetnames:
-        print("\n📊 Cargando maestras_administrativos...")
-        sheet = workbook['maestras_administrativos']
-        rows = list(sheet.iter_rows(min_row=2, values_only=True))
-        
-        for row in rows:
-            if row[0] is not None:  # Si hay nombre
+                    conflictos.append(f"{k}: {e}")
+
+            cursor.executemany(f"UPDATE {tabla} SET activo = 0 WHERE {clave} = ?", [(k,) for k in bajas])
+
+            resumen[tabla] = {
+                'altas': len(altas), 'modificados': len(modificados), 'bajas': len(bajas),
+                'sin_cambios': sin_cambios, 'conflictos': len(conflictos)
+            }
+            print(f"\n{ICONOS[tabla]}: +{len(altas)} altas, ~{len(modificados)} modificados, "
+                  f"-{len(bajas)} bajas, {sin_cambios} sin cambios, {len(conflictos)} con conflicto")
+            _mostrar_detalle('+', [f"{k} {' | '.join(map(str, v))}".strip() for k, v in altas])
+            _mostrar_detalle('~', [f"{k} {' | '.join(map(str, v))}".strip() for k, v in modificados])
+            _mostrar_detalle('-', [str(k) for k in bajas])
+            _mostrar_detalle('⚠️', conflictos)
+
+        incrementar_version(cursor, [tabla for tabla, conteos in resumen.items()
+                                     if conteos['altas'] or conteos['modificados'] or conteos['bajas']])
+        cursor.execute('ROLLBACK' if simular else 'COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+
+    milisegundos = (time.perf_counter() - inicio) * 1000
+    if simular:
+        print(f"\n🔍 Simulación: no se aplicó ningún cambio ({milisegundos:.0f} ms)")
+    else:
+        print(f"\n✅ Sincronización aplicada en una transacción de {milisegundos:.0f} ms")
+    return resumen
+
+
+def cargar_completa(conn, datos):
+    """Vaciar las maestras del Excel y volver a cargarlas completas (ids desde 1)"""
+    cursor = conn.cursor()
+    print("\n🔄 Reiniciando tablas maestras...")
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for tabla, filas in datos.items():
+            clave, campos = MAESTRAS[tabla]
+            cursor.execute(f"DELETE FROM {tabla}")
+            cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (tabla,))
+            cargados = 0
+            for k, valores in filas.items():
                 try:
-                    # Convertir a mayúsculas
-                    nombre = str(row[0]).strip().upper() if row[0] else ''
-                    cursor.execute("""
-                        INSERT INTO maestras_administrativos (nombre)
-                        VALUES (?)
-                    """, (nombre,))
+                    cursor.execute(
+                        f"INSERT INTO {tabla} ({', '.join((clave,) + campos)}) VALUES ({', '.join('?' * (len(campos) + 1))})",
+                        (k,) + valores
+                    )
+                    cargados += 1
                 except sqlite3.IntegrityError as e:
-                    print(f"  ⚠️  Nombre duplicado: {row[0]}")
-        
-        print(f"  ✅ {len(rows)} registros procesados")
-    
-    conn.commit()
-    
-    # Mostrar resumen
-    print("\n" + "="*50)
-    print("📈 RESUMEN DE CARGA")
-    print("="*50)
-    
-    cursor.execute("SELECT COUNT(*) FROM maestras_casinos")
-    print(f"🏢 Casinos/Centros de Costo: {cursor.fetchone()[0]} registros")
-    
-    cursor.execute("SELECT COUNT(*) FROM maestras_choferes")
-    print(f"🚗 Choferes: {cursor.fetchone()[0]} registros")
-    
-    cursor.execute("SELECT COUNT(*) FROM maestras_administrativos")
-    print(f"👤 Administrativos: {cursor.fetchone()[0]} registros")
-    
-    print("="*50)
-    print("✅ Carga completada exitosamente")
-    
-    conn.close()
-    workbook.close()
+                    print(f"  ⚠️  {tabla}: {k} no cargado: {e}")
+            print(f"  ✅ {tabla}: {cargados} registros cargados")
+        incrementar_version(cursor, datos)
+        cursor.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+
+
+def cargar_datos_excel(archivo='datos.xlsx', completa=False, simular=False):
+    """Cargar datos desde el archivo Excel a las tablas maestras"""
+
+    print(f"📁 Abriendo archivo {archivo}...")
+    try:
+        datos = leer_excel(archivo)
+    except Exception as e:
+        print(f"❌ Error al abrir el archivo: {e}")
+        return
+
+    conn = obtener_conexion(config.get_db_path())
+    try:
+        # Tablas y columna activo (migración v7) antes de comparar o cargar
+        for sql in SQL_CREAR_TABLAS:
+            conn.execute(sql)
+        migraciones.aplicar_migraciones()
+
+        if completa:
+            cargar_completa(conn, datos)
+        else:
+            sincronizar(conn, datos, simular=simular)
+
+        # Mostrar resumen
+        print("\n" + "="*50)
+        print("📈 REGISTROS ACTIVOS")
+        print("="*50)
+        for tabla in MAESTRAS:
+            total = conn.execute(f"SELECT COUNT(*) FROM {tabla} WHERE activo = 1").fetchone()[0]
+            print(f"{ICONOS[tabla]}: {total} registros")
+        print("="*50)
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
-    cargar_datos_excel()
+    parser = argparse.ArgumentParser(description='Cargar las tablas maestras desde datos.xlsx')
+    parser.add_argument('--archivo', default='datos.xlsx', help='Excel con las pestañas de maestras')
+    parser.add_argument('--completa', action='store_true', help='Vaciar las maestras y cargarlas de nuevo')
+    parser.add_argument('--simular', action='store_true', help='Mostrar los cambios sin aplicarlos')
+    args = parser.parse_args()
+    if args.completa and args.simular:
+        parser.error('--simular solo aplica a la sincronización incremental')
+    cargar_datos_excel(args.archivo, completa=args.completa, simular=args.simular)
@@ -0,0 +1,252 @@
+"""
+Cola local de trabajos en segundo plano (PDFs y reportes pesados)
+Los trabajos se ejecutan en un pool acotado de hilos, fuera de los hilos de
+Waitress, y su estado queda persistido en la tabla jobs (ver migraciones.py, v5)
+para que el navegador consulte el progreso y descargue el resultado.
+
+El alta y los cambios de estado de cada trabajo pasan por el escritor único
+(escritor_db.py), igual que las demás escrituras de la aplicación.
+
+Dos pedidos idénticos (mismo tipo y parámetros) mientras el primero sigue
+pendiente o en ejecución comparten el mismo trabajo.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import config
+from db_pool import obtener_conexion
+from escritor_db import escritor_db
+
+PENDIENTE = 'pendiente'
+EJECUTANDO = 'ejecutando'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+ESTADOS_EN_CURSO = (PENDIENTE, EJECUTANDO)
+
+# Días que se conservan los trabajos terminados en la tabla
+DIAS_RETENCION = 7
+
+SQL_CREAR_TABLA = '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        clave TEXT NOT NULL,
+        parametros TEXT,
+        estado TEXT NOT NULL,
+        progreso INTEGER DEFAULT 0,
+        mensaje TEXT,
+        resultado TEXT,
+        error TEXT,
+        usuario TEXT,
+        creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        iniciado_en TIMESTAMP,
+        terminado_en TIMESTAMP
+    )
+'''
+
+SQL_CREAR_INDICE = 'CREATE INDEX IF NOT EXISTS idx_jobs_clave_estado ON jobs(clave, estado)'
+
+
+def _ahora():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _insertar_trabajo(cursor, id_trabajo, tipo, clave, parametros, usuario):
+    cursor.execute('''
+        INSERT INTO jobs (id, tipo, clave, parametros, estado, usuario, creado_en)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (id_trabajo, tipo, clave, parametros, PENDIENTE, usuario, _ahora()))
+
+
+def _actualizar_trabajo(cursor, id_trabajo, campos):
+    asignaciones = ', '.join(f'{campo} = ?' for campo in campos)
+    cursor.execute(f'UPDATE jobs SET {asignaciones} WHERE id = ?', list(campos.values()) + [id_trabajo])
+
+
+def limpiar_archivos_antiguos(carpeta, dias=DIAS_RETENCION):
+    """Borrar los resultados generados hace más de `dias` días"""
+    if not os.path.isdir(carpeta):
+        return 0
+    limite = time.time() - dias * 86400
+    borrados = 0
+    for nombre in os.listdir(carpeta):
+        ruta = os.path.join(carpeta, nombre)
+        try:
+            if os.path.isfile(ruta) and os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+                borrados += 1
+        except OSError:
+            pass
+    if borrados:
+        print(f"[Trabajos] {borrados} archivos antiguos eliminados de {carpeta}")
+    return borrados
+
+
+def clave_trabajo(tipo, parametros):
+    """Clave de deduplicación: mismo tipo + mismos parámetros"""
+    texto = json.dumps([tipo, parametros], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+class ColaTrabajos:
+    """Cola de trabajos con límite de concurrencia y estado persistido en SQLite"""
+
+    def __init__(self, db_path=None, max_concurrentes=None):
+        self.db_path = db_path or config.get_db_path()
+        self.max_concurrentes = max_concurrentes or config.jobs_max_concurrentes
+        self._tipos = {}
+        self._lock = threading.Lock()
+        self._en_curso = {}      # clave -> id del trabajo pendiente o en ejecución
+        self._terminados = {}    # id -> threading.Event
+        self._executor = None
+
+    # ========== CONFIGURACIÓN ==========
+
+    def registrar_tipo(self, tipo, funcion):
+        """
+        Registrar un tipo de trabajo.
+        funcion(parametros, progreso) -> dict serializable a JSON con el resultado;
+        progreso(porcentaje, mensaje) actualiza el avance visible para el cliente.
+        """
+        self._tipos[tipo] = funcion
+
+    def iniciar(self):
+        """Crear el pool de hilos y cerrar trabajos que quedaron a medias por un reinicio"""
+        if multiprocessing.current_process().name != 'MainProcess':
+            # Proceso hijo (pool de PDFs en lote) que importó app_web: la cola es del proceso principal
+            return
+
+        conn = obtener_conexion(self.db_path)
+        try:
+            conn.execute(
+                "UPDATE jobs SET estado = ?, error = ?, terminado_en = ? WHERE estado IN (?, ?)",
+                (ERROR, 'Interrumpido por reinicio del servidor', _ahora()) + ESTADOS_EN_CURSO
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE estado NOT IN (?, ?) AND creado_en < datetime('now', 'localtime', ?)",
+                ESTADOS_EN_CURSO + (f'-{DIAS_RETENCION} days',)
+            )
+        finally:
+            conn.close()
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrentes, thread_name_prefix='Trabajo')
+        print(f"[Trabajos] Cola iniciada ({self.max_concurrentes} trabajos simultáneos)")
+
+    def detener(self):
+        """Dejar de aceptar trabajos; los que están en ejecución terminan"""
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # ========== ENVÍO Y CONSULTA ==========
+
+    def enviar(self, tipo, parametros, usuario=None):
+        """
+        Encolar un trabajo. Retorna (id, deduplicado): si ya hay uno idéntico en
+        curso se devuelve su id en lugar de crear otro.
+        """
+        if tipo not in self._tipos:
+            raise ValueError(f'Tipo de trabajo desconocido: {tipo}')
+        if self._executor is None:
+            raise RuntimeError('La cola de trabajos no está iniciada')
+
+        clave = clave_trabajo(tipo, parametros)
+        with self._lock:
+            existente = self._en_curso.get(clave)
+            if existente:
+                return existente, True
+
+            id_trabajo = uuid.uuid4().hex
+            escritor_db.ejecutar(_insertar_trabajo, id_trabajo, tipo, clave,
+                                 json.dumps(parametros, ensure_ascii=False, default=str), usuario)
+
+            self._en_curso[clave] = id_trabajo
+            self._terminados[id_trabajo] = threading.Event()
+
+        self._executor.submit(self._ejecutar, id_trabajo, tipo, clave, parametros)
+        return id_trabajo, False
+
+    def estado(self, id_trabajo):
+        """Estado de un trabajo como dict (None si no existe)"""
+        conn = obtener_conexion(self.db_path)
+        try:
+            cursor = conn.execute('''
+                SELECT id, tipo, parametros, estado, progreso, mensaje, resultado, error,
+                       usuario, creado_en, iniciado_en, terminado_en
+                FROM jobs WHERE id = ?
+            ''', (id_trabajo,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'tipo': row[1],
+            'parametros': json.loads(row[2]) if row[2] else {},
+            'estado': row[3],
+            'progreso': row[4] or 0,
+            'mensaje': row[5],
+            'resultado': json.loads(row[6]) if row[6] else None,
+            'error': row[7],
+            'usuario': row[8],
+            'creado_en': row[9],
+            'iniciado_en': row[10],
+            'terminado_en': row[11]
+        }
+
+    def esperar(self, id_trabajo, timeout=None):
+        """Bloquear hasta que el trabajo termine (o venza timeout). Retorna su estado."""
+        with self._lock:
+            evento = self._terminados.get(id_trabajo)
+        if evento is not None:
+            evento.wait(timeout)
+        return self.estado(id_trabajo)
+
+    def estadisticas(self):
+        """Conteo de trabajos por estado"""
+        conn = obtener_conexion(self.db_path)
+        try:
+            conteos = dict(conn.execute('SELECT estado, COUNT(*) FROM jobs GROUP BY estado').fetchall())
+        finally:
+            conn.close()
+        with self._lock:
+            en_curso = len(self._en_curso)
+        return {'max_concurrentes': self.max_concurrentes, 'en_curso': en_curso, 'por_estado': conteos}
+
+    # ========== EJECUCIÓN ==========
+
+    def _actualizar(self, id_trabajo, **campos):
+        escritor_db.ejecutar(_actualizar_trabajo, id_trabajo, campos)
+
+    def _ejecutar(self, id_trabajo, tipo, clave, parametros):
+        """Cuerpo de cada trabajo en el pool de hilos"""
+        def progreso(porcentaje, mensaje=None):
+            self._actualizar(id_trabajo, progreso=int(porcentaje), mensaje=mensaje)
+
+        try:
+            # Dentro del try: si falla, el finally igual libera la clave en _en_curso
+            self._actualizar(id_trabajo, estado=EJECUTANDO, iniciado_en=_ahora())
+            resultado = self._tipos[tipo](parametros, progreso)
+            self._actualizar(
+                id_trabajo, estado=COMPLETADO, progreso=100, terminado_en=_ahora(),
+                resultado=json.dumps(resultado, ensure_ascii=False, default=str)
+            )
+        except Exception as e:
+            print(f"[Trabajos] Error en trabajo {tipo} {id_trabajo}: {e}")
+            self._actualizar(id_trabajo, estado=ERROR, error=str(e), terminado_en=_ahora())
+        finally:
+            with self._lock:
+                if self._en_curso.get(clave) == id_trabajo:
+                    del self._en_curso[clave]
+                evento = self._terminados.pop(id_trabajo, None)
+            if evento:
+                evento.set()
@@ -33,7 +33,32 @@ class Config:
         # Configuración del servidor
         self.host = os.getenv('ARATRACK_HOST', '0.0.0.0')
         self.threads = int(os.getenv('ARATRACK_THREADS', '10'))
-        
+
+        # Pool de conexiones SQLite (por defecto: hilos de Waitress + hilos de fondo)
+        self.db_pool_size = int(os.getenv('ARATRACK_DB_POOL_SIZE', str(self.threads + 4)))
+        self.db_pool_timeout = float(os.getenv('ARATRACK_DB_POOL_TIMEOUT', '30'))
+
+        # Escritor único de viajes: máximo de escrituras confirmadas en un mismo COMMIT
+        self.escritor_lote_max = int(os.getenv('ARATRACK_ESCRITOR_LOTE_MAX', '50'))
+
+        # Caché de tablas maestras (segundos de vida; las escrituras de la app la invalidan al instante)
+        self.maestras_cache_ttl = float(os.getenv('ARATRACK_MAESTRAS_CACHE_TTL', '300'))
+
+        # Cola de trabajos en segundo plano (PDFs y reportes generados a la vez)
+        self.jobs_max_concurrentes = int(os.getenv('ARATRACK_JOBS_MAX_CONCURRENTES', '2'))
+
+        # Tamaño máximo de la carpeta pdfs/ (se borran primero los PDFs usados hace más tiempo)
+        self.pdf_cache_max_mb = float(os.getenv('ARATRACK_PDF_CACHE_MAX_MB', '500'))
+
+        # Tamaño máximo de un archivo subido (Excel de rendiciones); más grande responde 413
+        self.upload_max_mb = float(os.getenv('ARATRACK_UPLOAD_MAX_MB', '20'))
+
+        # Registro de consultas lentas en _logs/consultas_lentas.log: umbral en ms (0 = desactivado)
+        self.sql_lento_ms = float(os.getenv('ARATRACK_SQL_LENTO_MS', '0'))
+
+        # Token para leer /metrics sin sesión (Authorization: Bearer <token>); vacío = solo admin o localhost
+        self.metricas_token = os.getenv('ARATRACK_METRICAS_TOKEN', '')
+
         # Secret key para Flask
         self.secret_key = os.getenv('ARATRACK_SECRET_KEY', 'aratrack-pro-2025-secure-key')
         
@@ -0,0 +1,211 @@
+"""
+Registro de consultas lentas (opcional)
+Con ARATRACK_SQL_LENTO_MS > 0, cada sentencia ejecutada por una conexión del
+pool (DBManager, MaestrasManager, AuthManager, escritor único, cachés) que tarde
+al menos ese umbral entre execute y la lectura de su última fila se anota en
+_logs/consultas_lentas.log: una línea JSON con el SQL, la forma de los
+parámetros (tipos, nunca valores), duración, filas y EXPLAIN QUERY PLAN.
+El archivo rota al llegar a MAX_BYTES_LOG.
+
+Las entradas se agrupan por huella: el SQL sin espacios de más y con los
+literales reemplazados por ?, así las queries armadas con f-string (filtros
+del dashboard, IN (...) de largo variable) caen en un mismo grupo.
+
+Resumen de los peores:
+    python consultas_lentas.py                   # top 20 por tiempo total
+    python consultas_lentas.py --orden max --plan
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from config import config
+
+ARCHIVO_LOG = os.path.join(config.base_dir, '_logs', 'consultas_lentas.log')
+MAX_BYTES_LOG = 5 * 1024 * 1024
+ARCHIVOS_ROTADOS = 3
+
+# Sentencias con plan de ejecución (DDL, PRAGMA y transacciones se anotan sin plan)
+SENTENCIAS_CON_PLAN = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_RE_COMENTARIOS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_ESPACIOS = re.compile(r'\s+')
+_RE_LISTA = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def huella(sql):
+    """SQL normalizado para agrupar: sin comentarios ni espacios de más, literales como ?"""
+    sql = _RE_COMENTARIOS.sub(' ', sql)
+    sql = _RE_TEXTO.sub('?', sql)
+    sql = _RE_NUMERO.sub('?', sql)
+    sql = _RE_ESPACIOS.sub(' ', sql).strip()
+    return _RE_LISTA.sub('(?, ...)', sql)
+
+
+def forma_parametros(parametros):
+    """Tipos de los parámetros sin sus valores (pueden ser contraseñas o RUTs)"""
+    if isinstance(parametros, dict):
+        return {clave: type(valor).__name__ for clave, valor in parametros.items()}
+    if isinstance(parametros, (list, tuple)):
+        return [type(valor).__name__ for valor in parametros]
+    return type(parametros).__name__
+
+
+def plan_de_consulta(conn, sql, parametros=()):
+    """EXPLAIN QUERY PLAN como lista de líneas indentadas según el árbol del plan"""
+    try:
+        filas = conn.execute(f'EXPLAIN QUERY PLAN {sql}', parametros).fetchall()
+    except (sqlite3.Error, ValueError) as e:
+        return [f'(sin plan: {e})']
+    profundidad = {0: -1}
+    lineas = []
+    for id_nodo, padre, _, detalle in filas:
+        profundidad[id_nodo] = profundidad.get(padre, -1) + 1
+        lineas.append('  ' * profundidad[id_nodo] + detalle)
+    return lineas
+
+
+class RegistroConsultasLentas:
+    """Anota en un log rotativo las sentencias que superan el umbral"""
+
+    def __init__(self, umbral_ms=None, archivo=ARCHIVO_LOG):
+        self.umbral_ms = config.sql_lento_ms if umbral_ms is None else umbral_ms
+        self.archivo = archivo
+        self._lock = threading.Lock()
+        self._log = None
+
+    @property
+    def activo(self):
+        return self.umbral_ms > 0
+
+    def _obtener_log(self):
+        with self._lock:
+            if self._log is None:
+                os.makedirs(os.path.dirname(self.archivo), exist_ok=True)
+                manejador = RotatingFileHandler(self.archivo, maxBytes=MAX_BYTES_LOG,
+                                                backupCount=ARCHIVOS_ROTADOS, encoding='utf-8')
+                manejador.setFormatter(logging.Formatter('%(message)s'))
+                log = logging.getLogger('aratrack.consultas_lentas')
+                log.setLevel(logging.INFO)
+                log.propagate = False
+                log.addHandler(manejador)
+                self._log = log
+            return self._log
+
+    def registrar(self, conn, tipo, sql, parametros, segundos, filas, filas_lote=None):
+        """
+        Anotar una sentencia lenta. tipo: execute, executemany o executescript.
+        En executemany `parametros` es la primera fila (o None si vino como generador)
+        y `filas_lote` la cantidad de filas del lote.
+        """
+        if tipo == 'executescript' or not sql.lstrip().upper().startswith(SENTENCIAS_CON_PLAN):
+            plan = []
+        elif tipo == 'executemany' and parametros is None:
+            plan = ['(sin plan: parámetros de executemany entregados como generador)']
+        else:
+            plan = plan_de_consulta(conn, sql, parametros or ())
+        entrada = {
+            'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'ms': round(segundos * 1000, 2),
+            'tipo': tipo,
+            'filas': filas,
+            'huella': huella(sql),
+            'sql': sql.strip(),
+            'parametros': forma_parametros(parametros) if parametros is not None else None,
+            'plan': plan,
+            'hilo': threading.current_thread().name
+        }
+        if filas_lote is not None:
+            entrada['filas_lote'] = filas_lote
+        try:
+            self._obtener_log().info(json.dumps(entrada, ensure_ascii=False))
+        except OSError as e:
+            print(f"[ConsultasLentas] No se pudo escribir {self.archivo}: {e}")
+
+
+# Instancia global usada por los cursores de db_pool
+consultas_lentas = RegistroConsultasLentas()
+
+
+# ========== RESUMEN (CLI) ==========
+
+def leer_entradas(archivo=ARCHIVO_LOG):
+    """Entradas del log y de sus archivos rotados (.1, .2, ...)"""
+    entradas = []
+    for ruta in [archivo] + [f'{archivo}.{i}' for i in range(1, ARCHIVOS_ROTADOS + 1)]:
+        if not os.path.exists(ruta):
+            continue
+        with open(ruta, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    entradas.append(json.loads(linea))
+                except json.JSONDecodeError:
+                    continue
+    return entradas
+
+
+def resumir(entradas):
+    """Agrupar por huella: veces, ms total / promedio / máximo y la entrada más lenta"""
+    grupos = {}
+    for entrada in entradas:
+        grupo = grupos.setdefault(entrada['huella'], {'huella': entrada['huella'], 'veces': 0,
+                                                      'total_ms': 0.0, 'max_ms': 0.0, 'filas': 0, 'peor': None})
+        grupo['veces'] += 1
+        grupo['total_ms'] += entrada['ms']
+        grupo['filas'] += entrada['filas'] or 0
+        if entrada['ms'] >= grupo['max_ms']:
+            grupo['max_ms'] = entrada['ms']
+            grupo['peor'] = entrada
+    for grupo in grupos.values():
+        grupo['promedio_ms'] = grupo['total_ms'] / grupo['veces']
+        grupo['alertas'] = _alertas(grupo['peor']['plan'])
+    return list(grupos.values())
+
+
+def _alertas(plan):
+    """Recorridos completos de tabla (SCAN sin índice) y ordenamientos en B-tree temporal"""
+    alertas = set()
+    for linea in plan:
+        linea = linea.strip()
+        if linea.startswith('SCAN') and 'INDEX' not in linea:
+            alertas.add('SCAN')
+        if 'TEMP B-TREE' in linea:
+            alertas.add('TEMP B-TREE')
+    return sorted(alertas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resumen del registro de consultas lentas')
+    parser.add_argument('--archivo', default=ARCHIVO_LOG, help='Log a leer (incluye sus rotaciones)')
+    parser.add_argument('--top', type=int, default=20, help='Cantidad de grupos a mostrar')
+    parser.add_argument('--orden', choices=['total', 'max', 'veces'], default='total')
+    parser.add_argument('--plan', action='store_true', help='Mostrar el plan de la ejecución más lenta')
+    args = parser.parse_args()
+
+    entradas = leer_entradas(args.archivo)
+    if not entradas:
+        print(f"Sin entradas en {args.archivo} (¿ARATRACK_SQL_LENTO_MS está configurado?)")
+        raise SystemExit(0)
+
+    clave = {'total': 'total_ms', 'max': 'max_ms', 'veces': 'veces'}[args.orden]
+    grupos = sorted(resumir(entradas), key=lambda g: g[clave], reverse=True)[:args.top]
+    print(f"{len(entradas)} consultas lentas en {len({e['huella'] for e in entradas})} grupos\n")
+    for i, grupo in enumerate(grupos, 1):
+        alertas = f"  [{', '.join(grupo['alertas'])}]" if grupo['alertas'] else ''
+        print(f"{i:>2}. {grupo['veces']}x  total {grupo['total_ms']:.0f} ms  prom {grupo['promedio_ms']:.1f} ms  "
+              f"máx {grupo['max_ms']:.1f} ms  filas/vez {grupo['filas'] / grupo['veces']:.0f}{alertas}")
+        sql = grupo['huella']
+        print(f"    {sql[:300]}{'...' if len(sql) > 300 else ''}")
+        if args.plan:
+            peor = grupo['peor']
+            print(f"    parámetros: {peor['parametros']}  ({peor['fecha']}, hilo {peor['hilo']})")
+            for linea in peor['plan']:
+                print(f"      {linea}")
+        print()
@@ -2,191 +2,209 @@
 Database Manager - Gestión de base de datos SQLite
 Estructura exacta según documento: viajes + comidas_preparadas
 """
-import sqlite3
-import os
-import sys
 from config import config
+from db_pool import obtener_conexion
+from escritor_db import escritor_db
+
+# Columnas de viajes que escribe la app (SIN columnas de firmas - solo aparecen en PDF)
+CAMPOS_VIAJE = (
+    'numero_viaje', 'casino', 'ruta', 'tipo_camion', 
+    'patente_camion', 'patente_semi', 'numero_rampa', 'transporte', 
+    'costo_codigo', 'termografos_gps', 'fecha', 'fecha_hora_llegada_dhl', 
+    'fecha_hora_salida_dhl', 'conductor', 'celular', 'rut', 'numero_camion', 
+    'num_wencos', 'bin', 'pallets', 'pallets_chep', 
+    'pallets_pl_negro_grueso', 'pallets_pl_negro_alternativo',
+    'pallets_refrigerado', 'wencos_refrigerado', 'pallets_congelado', 'wencos_congelado', 
+    'pallets_abarrote',
+    'check_congelado', 'check_refrigerado', 'check_abarrote', 
+    'check_implementos', 'check_aseo', 'check_trazabilidad', 'check_plataforma_wtck', 
+    'check_env_correo_wtck', 'check_revision_planilla_despacho', 'sello_salida_1p', 
+    'sello_salida_2p', 'sello_salida_3p', 'sello_salida_4p', 'sello_salida_5p', 
+    'sello_retorno_1p', 'sello_retorno_2p', 'sello_retorno_3p', 'sello_retorno_4p', 
+    'sello_retorno_5p', 'guia_1', 'guia_2', 'guia_3', 'guia_4', 'guia_5', 'guia_6', 
+    'guia_7', 'guia_8', 'guia_9', 'guia_10', 'guia_11', 'guia_12', 'guia_13', 'guia_14',
+    'guia_15', 'guia_16', 'guia_17', 'guia_18', 'guia_19', 'guia_20', 'guia_21',
+    'numero_certificado_fumigacion', 'revision_limpieza_camion_acciones', 
+    'administrativo_responsable'
+)
+
+# Clave de un viaje: no se modifica al actualizar
+CAMPOS_VIAJE_ACTUALIZABLES = tuple(c for c in CAMPOS_VIAJE if c not in ('numero_viaje', 'costo_codigo'))
+
+# Columnas de comidas_preparadas además de numero_viaje y numero_centro_costo
+CAMPOS_COMIDA = ('guia_comida', 'descripcion', 'kilo', 'bultos', 'proveedor')
+
+# Esquema base de viajes.db (las maestras las crea cargar_datos_excel.py y los
+# índices, el rollup, jobs y pdf_cache las migraciones)
+SQL_CREAR_TABLAS = [
+    """
+        CREATE TABLE IF NOT EXISTS viajes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_viaje TEXT NOT NULL,
+            casino TEXT,
+            ruta TEXT,
+            tipo_camion TEXT,
+            patente_camion TEXT,
+            patente_semi TEXT,
+            numero_rampa TEXT,
+            transporte TEXT,
+            costo_codigo TEXT NOT NULL,
+            termografos_gps TEXT,
+            fecha TEXT,
+            fecha_hora_llegada_dhl TEXT,
+            fecha_hora_salida_dhl TEXT,
+            conductor TEXT,
+            celular TEXT,
+            rut TEXT,
+            numero_camion TEXT,
+            num_wencos TEXT,
+            bin TEXT,
+            pallets TEXT,
+            pallets_chep TEXT,
+            pallets_pl_negro_grueso TEXT,
+            pallets_pl_negro_alternativo TEXT,
+            pallets_refrigerado TEXT,
+            wencos_refrigerado TEXT,
+            pallets_congelado TEXT,
+            wencos_congelado TEXT,
+            pallets_abarrote TEXT,
+            check_congelado TEXT,
+            check_refrigerado TEXT,
+            check_abarrote TEXT,
+            check_implementos TEXT,
+            check_aseo TEXT,
+            check_trazabilidad TEXT,
+            check_plataforma_wtck TEXT,
+            check_env_correo_wtck TEXT,
+            check_revision_planilla_despacho TEXT,
+            guia_1 TEXT, guia_2 TEXT, guia_3 TEXT, guia_4 TEXT, guia_5 TEXT,
+            guia_6 TEXT, guia_7 TEXT, guia_8 TEXT, guia_9 TEXT, guia_10 TEXT,
+            guia_11 TEXT, guia_12 TEXT, guia_13 TEXT, guia_14 TEXT, guia_15 TEXT,
+            guia_16 TEXT, guia_17 TEXT, guia_18 TEXT, guia_19 TEXT, guia_20 TEXT, guia_21 TEXT,
+            sello_salida_1p TEXT, sello_salida_2p TEXT, sello_salida_3p TEXT,
+            sello_salida_4p TEXT, sello_salida_5p TEXT,
+            sello_retorno_1p TEXT, sello_retorno_2p TEXT, sello_retorno_3p TEXT,
+            sello_retorno_4p TEXT, sello_retorno_5p TEXT,
+            numero_certificado_fumigacion TEXT,
+            revision_limpieza_camion_acciones TEXT,
+            administrativo_responsable TEXT,
+            UNIQUE(numero_viaje, costo_codigo)
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS comidas_preparadas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_viaje TEXT NOT NULL,
+            numero_centro_costo TEXT NOT NULL,
+            guia_comida TEXT,
+            descripcion TEXT,
+            kilo REAL,
+            bultos INTEGER,
+            proveedor TEXT,
+            FOREIGN KEY (numero_viaje, numero_centro_costo)
+                REFERENCES viajes(numero_viaje, costo_codigo) ON DELETE CASCADE
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS rendiciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nro_viaje INTEGER UNIQUE NOT NULL,
+            pdt TEXT,
+            ruta TEXT,
+            fecha_creacion DATETIME DEFAULT CURRENT_TIMESTAMP,
+            fecha_modificacion DATETIME,
+            estado_rendicion TEXT DEFAULT 'SIN REVISAR'
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS proveedores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL UNIQUE,
+            activo INTEGER DEFAULT 1,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_modificacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS transportes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patente TEXT NOT NULL UNIQUE,
+            transporte TEXT,
+            tipo_camion TEXT,
+            activo INTEGER DEFAULT 1,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'CREATE INDEX IF NOT EXISTS idx_patente ON transportes(patente)',
+]
+
+
+def cargar_viaje_por_centro(conn, numero_viaje, centro_costo=None):
+    """
+    Filas de un viaje y sus comidas agrupadas por centro de costo, con dos
+    consultas sobre la misma conexión (en lugar de dos por cada centro).
+    
+    Retorna {centro: {'viaje': dict, 'comidas': [dict, ...]}} con los centros
+    ordenados por código y las comidas por id. Con centro_costo se limita a ese centro.
+    """
+    filtro_viaje = ' AND costo_codigo = ?' if centro_costo is not None else ''
+    filtro_comidas = ' AND numero_centro_costo = ?' if centro_costo is not None else ''
+    params = (numero_viaje,) if centro_costo is None else (numero_viaje, centro_costo)
+    
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT * FROM viajes 
+        WHERE numero_viaje = ?{filtro_viaje}
+        ORDER BY costo_codigo
+    ''', params)
+    columnas = [d[0] for d in cursor.description]
+    centros = {}
+    for fila in cursor.fetchall():
+        viaje = dict(zip(columnas, fila))
+        centros[viaje['costo_codigo']] = {'viaje': viaje, 'comidas': []}
+    
+    if not centros:
+        return centros
+    
+    cursor.execute(f'''
+        SELECT * FROM comidas_preparadas 
+        WHERE numero_viaje = ?{filtro_comidas}
+        ORDER BY id
+    ''', params)
+    columnas = [d[0] for d in cursor.description]
+    for fila in cursor.fetchall():
+        comida = dict(zip(columnas, fila))
+        centro = centros.get(comida['numero_centro_costo'])
+        if centro is not None:
+            centro['comidas'].append(comida)
+    return centros
+
 
 class DBManager:
-    def __init__(self):
+    def __init__(self, db_path=None):
         # Usar configuración centralizada
-        self.db_path = config.get_db_path()
+        self.db_path = db_path or config.get_db_path()
     
     def get_connection(self):
-        """Obtener conexión a la base de datos con configuración óptima"""
-        conn = sqlite3.connect(
-            self.db_path,
-            timeout=30.0,  # Mayor timeout para esperar en caso de bloqueo
-            check_same_thread=False,
-            isolation_level=None  # Modo autocommit para mejor concurrencia
-        )
-        # Habilitar WAL mode para mejor concurrencia (lecturas y escrituras simultáneas)
-        conn.execute('PRAGMA journal_mode=WAL')
-        # Configurar busy timeout
-        conn.execute('PRAGMA busy_timeout=30000')
-        return conn
+        """Obtener conexión del pool compartido (WAL y busy_timeout aplicados en db_pool)"""
+        # Modo autocommit (isolation_level=None) para mejor concurrencia
+        return obtener_conexion(self.db_path)
     
     def init_database(self):
-        """Inicializar tablas con estructura exacta del documento"""
+        """Inicializar tablas con estructura exacta del documento (crea las que falten)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         # Activar WAL mode para toda la base de datos
         cursor.execute('PRAGMA journal_mode=WAL')
         
-        # Verificar que las tablas ya existen (fueron creadas por configurar_viajes_repetidos.py)
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='viajes'")
-        if cursor.fetchone() is None:
-            print("Tabla viajes no existe. Ejecuta configurar_viajes_repetidos.py primero")
-            conn.close()
-            return
-        
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='comidas_preparadas'")
-        if cursor.fetchone() is None:
-            print("Tabla comidas_preparadas no existe. Ejecuta configurar_viajes_repetidos.py primero")
+        try:
+            for sql in SQL_CREAR_TABLAS:
+                cursor.execute(sql)
+        finally:
             conn.close()
-            return
-        
-        conn.close()
         print("Base de datos inicializada con soporte multi-usuario (WAL mode)")
 
-    def insert_viaje(self, viaje_data):
-        """Insertar nuevo viaje con todos los campos"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Lista de todos los campos (SIN columnas de firmas - solo aparecen en PDF)
-            campos = [
-                'numero_viaje', 'casino', 'ruta', 'tipo_camion', 
-                'patente_camion', 'patente_semi', 'numero_rampa', 'transporte', 
-                'costo_codigo', 'termografos_gps', 'fecha', 'fecha_hora_llegada_dhl', 
-                'fecha_hora_salida_dhl', 'conductor', 'celular', 'rut', 'numero_camion', 
-                'num_wencos', 'bin', 'pallets', 'pallets_chep', 
-                'pallets_pl_negro_grueso', 'pallets_pl_negro_alternativo',
-                'pallets_refrigerado', 'wencos_refrigerado', 'pallets_congelado', 'wencos_congelado', 
-                'pallets_abarrote',
-                'check_congelado', 'check_refrigerado', 'check_abarrote', 
-                'check_implementos', 'check_aseo', 'check_trazabilidad', 'check_plataforma_wtck', 
-                'check_env_correo_wtck', 'check_revision_planilla_despacho', 'sello_salida_1p', 
-                'sello_salida_2p', 'sello_salida_3p', 'sello_salida_4p', 'sello_salida_5p', 
-                'sello_retorno_1p', 'sello_retorno_2p', 'sello_retorno_3p', 'sello_retorno_4p', 
-                'sello_retorno_5p', 'guia_1', 'guia_2', 'guia_3', 'guia_4', 'guia_5', 'guia_6', 
-                'guia_7', 'guia_8', 'guia_9', 'guia_10', 'guia_11', 'guia_12', 'guia_13', 'guia_14',
-                'guia_15', 'guia_16', 'guia_17', 'guia_18', 'guia_19', 'guia_20', 'guia_21',
-                'numero_certificado_fumigacion', 'revision_limpieza_camion_acciones', 
-                'administrativo_responsable'
-            ]
-            
-            # Preparar valores con defaults
-            valores = []
-            for campo in campos:
-                valores.append(viaje_data.get(campo, ''))
-            
-            # Crear query dinámico
-            placeholders = ', '.join(['?' for _ in campos])
-            query = f'''
-                INSERT INTO viajes ({', '.join(campos)})
-                VALUES ({placeholders})
-            '''
-            
-            cursor.execute(query, valores)
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error insertando viaje: {e}")
-            return False
-    
-    def insert_viaje_por_centro(self, viaje_data, centro_costo):
-        """Insertar viaje específico para un centro de costo"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Verificar si ya existe este viaje para este centro de costo
-            cursor.execute('''
-                SELECT COUNT(*) FROM viajes v
-                JOIN comidas_preparadas c ON v.numero_viaje = c.numero_viaje
-                WHERE v.numero_viaje = ? AND c.numero_centro_costo = ?
-            ''', (viaje_data.get('numero_viaje'), centro_costo))
-            
-            existe = cursor.fetchone()[0] > 0
-            
-            if not existe:
-                # Lista de todos los campos (SIN columnas de firmas - solo aparecen en PDF)
-                campos = [
-                    'numero_viaje', 'casino', 'ruta', 'tipo_camion', 
-                    'patente_camion', 'patente_semi', 'numero_rampa', 'transporte', 
-                    'costo_codigo', 'termografos_gps', 'fecha', 'fecha_hora_llegada_dhl', 
-                    'fecha_hora_salida_dhl', 'conductor', 'celular', 'rut', 'numero_camion', 
-                    'num_wencos', 'bin', 'pallets', 'pallets_chep', 
-                    'pallets_pl_negro_grueso', 'pallets_pl_negro_alternativo',
-                    'pallets_refrigerado', 'wencos_refrigerado', 'pallets_congelado', 'wencos_congelado', 
-                    'pallets_abarrote',
-                    'check_congelado', 'check_refrigerado', 'check_abarrote', 
-                    'check_implementos', 'check_aseo', 'check_trazabilidad', 'check_plataforma_wtck', 
-                    'check_env_correo_wtck', 'check_revision_planilla_despacho', 'sello_salida_1p', 
-                    'sello_salida_2p', 'sello_salida_3p', 'sello_salida_4p', 'sello_salida_5p', 
-                    'sello_retorno_1p', 'sello_retorno_2p', 'sello_retorno_3p', 'sello_retorno_4p', 
-                    'sello_retorno_5p', 'guia_1', 'guia_2', 'guia_3', 'guia_4', 'guia_5', 'guia_6', 
-                    'guia_7', 'guia_8', 'guia_9', 'guia_10', 'guia_11', 'guia_12', 'guia_13', 'guia_14',
-                    'guia_15', 'guia_16', 'guia_17', 'guia_18', 'guia_19', 'guia_20', 'guia_21',
-                    'numero_certificado_fumigacion', 'revision_limpieza_camion_acciones', 
-                    'administrativo_responsable'
-                ]
-                
-                # Preparar valores con defaults
-                valores = []
-                for campo in campos:
-                    valores.append(viaje_data.get(campo, ''))
-                
-                # Crear query dinámico
-                placeholders = ', '.join(['?' for _ in campos])
-                query = f'''
-                    INSERT INTO viajes ({', '.join(campos)})
-                    VALUES ({placeholders})
-                '''
-                
-                cursor.execute(query, valores)
-                viaje_id = cursor.lastrowid
-                conn.commit()
-                conn.close()
-                return viaje_id
-            else:
-                conn.close()
-                return True  # Ya existe, no es error
-                
-        except Exception as e:
-            print(f"Error insertando viaje por centro: {e}")
-            return False
-    
-    def insert_comida(self, comida_data):
-        """Insertar comida preparada"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO comidas_preparadas 
-                (numero_viaje, guia_comida, descripcion, kilo, bultos, numero_centro_costo)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                comida_data.get('numero_viaje'),
-                comida_data.get('guia_comida', ''),
-                comida_data.get('descripcion', ''),
-                comida_data.get('kilo', ''),
-                comida_data.get('bultos', ''),
-                comida_data.get('numero_centro_costo', '32062')
-            ))
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error insertando comida: {e}")
-            return False
-    
     def get_viaje(self, numero_viaje):
         """Obtener viaje por número"""
         try:
@@ -221,108 +239,63 @@ class DBManager:
             print(f"Error obteniendo comidas: {e}")
             return []
 
-    def update_viaje(self, numero_viaje, viaje_data):
-        """Actualizar viaje existente"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+    def _delete_viaje(self, cursor, viaje_id):
+        print(f"[DELETE_VIAJE] Eliminando viaje con ID: {viaje_id}")
+        
+        # Primero obtener numero_viaje para eliminar comidas
+        cursor.execute('SELECT numero_viaje FROM viajes WHERE id = ?', (viaje_id,))
+        result = cursor.fetchone()
+        
+        if result:
+            numero_viaje = result[0]
+            print(f"[DELETE_VIAJE] Numero de viaje encontrado: {numero_viaje}")
             
-            cursor.execute('''
-                UPDATE viajes 
-                SET casino = ?, conductor = ?, fecha = ?
-                WHERE numero_viaje = ?
-            ''', (
-                viaje_data.get('casino', ''),
-                viaje_data.get('conductor', ''),
-                viaje_data.get('fecha', ''),
-                numero_viaje
-            ))
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error actualizando viaje: {e}")
-            return False
+            # Eliminar comidas asociadas
+            cursor.execute('DELETE FROM comidas_preparadas WHERE numero_viaje = ?', (numero_viaje,))
+            comidas_deleted = cursor.rowcount
+            print(f"[DELETE_VIAJE] Comidas eliminadas: {comidas_deleted}")
+            
+            # Eliminar el viaje
+            cursor.execute('DELETE FROM viajes WHERE id = ?', (viaje_id,))
+            viajes_deleted = cursor.rowcount
+            print(f"[DELETE_VIAJE] Viajes eliminados: {viajes_deleted}")
+        else:
+            print(f"[DELETE_VIAJE] ERROR: No se encontró viaje con ID {viaje_id}")
     
     def delete_viaje(self, viaje_id):
         """Eliminar viaje por ID y sus comidas asociadas"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            print(f"[DELETE_VIAJE] Eliminando viaje con ID: {viaje_id}")
-            
-            # Primero obtener numero_viaje para eliminar comidas
-            cursor.execute('SELECT numero_viaje FROM viajes WHERE id = ?', (viaje_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                numero_viaje = result[0]
-                print(f"[DELETE_VIAJE] Numero de viaje encontrado: {numero_viaje}")
-                
-                # Eliminar comidas asociadas
-                cursor.execute('DELETE FROM comidas_preparadas WHERE numero_viaje = ?', (numero_viaje,))
-                comidas_deleted = cursor.rowcount
-                print(f"[DELETE_VIAJE] Comidas eliminadas: {comidas_deleted}")
-                
-                # Eliminar el viaje
-                cursor.execute('DELETE FROM viajes WHERE id = ?', (viaje_id,))
-                viajes_deleted = cursor.rowcount
-                print(f"[DELETE_VIAJE] Viajes eliminados: {viajes_deleted}")
-            else:
-                print(f"[DELETE_VIAJE] ERROR: No se encontró viaje con ID {viaje_id}")
-            
-            conn.commit()
-            conn.close()
+            escritor_db.ejecutar(self._delete_viaje, viaje_id)
             return True
         except Exception as e:
             print(f"Error eliminando viaje: {e}")
             return False
     
+    def _delete_viaje_unico(self, cursor, viaje_id, numero_viaje, centro_costo):
+        print(f"[DELETE_VIAJE_UNICO] Eliminando registro único - ID: {viaje_id}, Viaje: {numero_viaje}, Centro: {centro_costo}")
+        
+        # Primero eliminar SOLO las comidas de este viaje + centro de costo
+        cursor.execute('''
+            DELETE FROM comidas_preparadas 
+            WHERE numero_viaje = ? AND numero_centro_costo = ?
+        ''', (numero_viaje, centro_costo))
+        comidas_deleted = cursor.rowcount
+        print(f"[DELETE_VIAJE_UNICO] Comidas eliminadas: {comidas_deleted}")
+        
+        # Luego eliminar SOLO el registro de viaje específico por ID
+        cursor.execute('DELETE FROM viajes WHERE id = ?', (viaje_id,))
+        viajes_deleted = cursor.rowcount
+        print(f"[DELETE_VIAJE_UNICO] Registros de viaje eliminados: {viajes_deleted}")
+    
     def delete_viaje_unico(self, viaje_id, numero_viaje, centro_costo):
         """Eliminar SOLO un registro específico de viaje por ID y SUS comidas específicas por centro de costo"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            print(f"[DELETE_VIAJE_UNICO] Eliminando registro único - ID: {viaje_id}, Viaje: {numero_viaje}, Centro: {centro_costo}")
-            
-            # Primero eliminar SOLO las comidas de este viaje + centro de costo
-            cursor.execute('''
-                DELETE FROM comidas_preparadas 
-                WHERE numero_viaje = ? AND numero_centro_costo = ?
-            ''', (numero_viaje, centro_costo))
-            comidas_deleted = cursor.rowcount
-            print(f"[DELETE_VIAJE_UNICO] Comidas eliminadas: {comidas_deleted}")
-            
-            # Luego eliminar SOLO el registro de viaje específico por ID
-            cursor.execute('DELETE FROM viajes WHERE id = ?', (viaje_id,))
-            viajes_deleted = cursor.rowcount
-            print(f"[DELETE_VIAJE_UNICO] Registros de viaje eliminados: {viajes_deleted}")
-            
-            conn.commit()
-            conn.close()
+            escritor_db.ejecutar(self._delete_viaje_unico, viaje_id, numero_viaje, centro_costo)
             return True
         except Exception as e:
             print(f"Error eliminando registro único de viaje: {e}")
             return False
     
-    def delete_comida(self, comida_id):
-        """Eliminar comida específica"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM comidas_preparadas WHERE id = ?', (comida_id,))
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error eliminando comida: {e}")
-            return False
-    
     def buscar_viajes_avanzado(self, filtros):
         """Búsqueda avanzada con múltiples filtros"""
         try:
@@ -465,6 +438,18 @@ class DBManager:
             print(f"Error obteniendo viaje específico: {e}")
             return None
     
+    def get_viaje_por_centro(self, numero_viaje):
+        """Obtener todos los centros de un viaje con sus comidas (ver cargar_viaje_por_centro)"""
+        try:
+            conn = self.get_connection()
+            try:
+                return cargar_viaje_por_centro(conn, numero_viaje)
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Error obteniendo viaje por centro: {e}")
+            return {}
+    
     def get_comidas_por_viaje_y_centro(self, numero_viaje, codigo_centro):
         """Obtener comidas de un viaje para un centro de costo específico"""
         try:
@@ -561,32 +546,6 @@ class DBManager:
             print(f"Error verificando existencia: {e}")
             return False
     
-    def insert_comida_con_centro(self, comida_data):
-        """Insertar comida asociada a viaje y centro de costo específico"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO comidas_preparadas 
-                (numero_viaje, numero_centro_costo, guia_comida, descripcion, kilo, bultos)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                comida_data.get('numero_viaje'),
-                comida_data.get('numero_centro_costo'),
-                comida_data.get('guia_comida', ''),
-                comida_data.get('descripcion', ''),
-                comida_data.get('kilo', ''),
-                comida_data.get('bultos', '')
-            ))
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error insertando comida con centro: {e}")
-            return False
-    
     def get_estadisticas_viajes_repetidos(self):
         """Obtener estadísticas de viajes repetidos"""
         try:
@@ -620,68 +579,16 @@ class DBManager:
             print(f"Error obteniendo estadísticas: {e}")
             return {}
     
-    def update_viaje_by_numero_centro(self, numero_viaje_original, centro_costo_original, viaje_data):
-        """Actualizar un viaje específico por número de viaje y centro de costo"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Lista de campos actualizables (EXCLUIR numero_viaje y costo_codigo que son la clave)
-            campos = [
-                'casino', 'ruta', 'tipo_camion', 
-                'patente_camion', 'patente_semi', 'numero_rampa', 'transporte', 
-                'termografos_gps', 'fecha', 'fecha_hora_llegada_dhl', 
-                'fecha_hora_salida_dhl', 'conductor', 'celular', 'rut', 'numero_camion', 
-                'num_wencos', 'bin', 'pallets', 'pallets_chep', 'pallets_pl_negro_grueso', 
-                'pallets_pl_negro_alternativo', 'pallets_refrigerado', 
-                'wencos_refrigerado', 'pallets_congelado', 'wencos_congelado', 
-                'pallets_abarrote', 'check_congelado', 'check_refrigerado', 'check_abarrote', 
-                'check_implementos', 'check_aseo', 'check_trazabilidad', 'check_plataforma_wtck', 
-                'check_env_correo_wtck', 'check_revision_planilla_despacho', 'sello_salida_1p', 
-                'sello_salida_2p', 'sello_salida_3p', 'sello_salida_4p', 'sello_salida_5p', 
-                'sello_retorno_1p', 'sello_retorno_2p', 'sello_retorno_3p', 'sello_retorno_4p', 
-                'sello_retorno_5p', 'guia_1', 'guia_2', 'guia_3', 'guia_4', 'guia_5', 'guia_6', 
-                'guia_7', 'guia_8', 'guia_9', 'guia_10', 'guia_11', 'guia_12', 'guia_13', 'guia_14',
-                'guia_15', 'guia_16', 'guia_17', 'guia_18', 'guia_19', 'guia_20', 'guia_21',
-                'numero_certificado_fumigacion', 'revision_limpieza_camion_acciones', 
-                'administrativo_responsable'
-            ]
-            
-            # Crear SET clause
-            set_clause = ', '.join([f"{campo} = ?" for campo in campos])
-            
-            # Preparar valores
-            valores = []
-            for campo in campos:
-                valores.append(viaje_data.get(campo, ''))
-            
-            # Agregar condiciones WHERE al final
-            valores.extend([numero_viaje_original, centro_costo_original])
-            
-            # Ejecutar UPDATE
-            query = f"UPDATE viajes SET {set_clause} WHERE numero_viaje = ? AND costo_codigo = ?"
-            cursor.execute(query, valores)
-            
-            conn.commit()
-            conn.close()
-            return cursor.rowcount > 0
-        except Exception as e:
-            print(f"Error actualizando viaje: {e}")
-            return False
+    def _delete_comidas_by_viaje_centro(self, cursor, numero_viaje, centro_costo):
+        cursor.execute('''
+            DELETE FROM comidas_preparadas 
+            WHERE numero_viaje = ? AND numero_centro_costo = ?
+        ''', (numero_viaje, centro_costo))
     
     def delete_comidas_by_viaje_centro(self, numero_viaje, centro_costo):
         """Eliminar todas las comidas de un viaje específico por centro de costo"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                DELETE FROM comidas_preparadas 
-                WHERE numero_viaje = ? AND numero_centro_costo = ?
-            ''', (numero_viaje, centro_costo))
-            
-            conn.commit()
-            conn.close()
+            escritor_db.ejecutar(self._delete_comidas_by_viaje_centro, numero_viaje, centro_costo)
             return True
         except Exception as e:
             print(f"Error eliminando comidas: {e}")
@@ -705,3 +612,91 @@ class DBManager:
         except Exception as e:
             print(f"Error obteniendo centros de costo: {e}")
             return []
+    
+    def get_numeros_viaje_por_fecha(self, fecha_inicio, fecha_fin):
+        """Obtener los números de viaje con fecha dentro del rango (inclusive)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT DISTINCT numero_viaje FROM viajes 
+                WHERE fecha BETWEEN ? AND ?
+                ORDER BY numero_viaje
+            ''', (fecha_inicio, fecha_fin))
+            
+            numeros = [row[0] for row in cursor.fetchall()]
+            conn.close()
+            return numeros
+        except Exception as e:
+            print(f"Error obteniendo viajes por fecha: {e}")
+            return []
+    
+    # ========== ESCRITURA TRANSACCIONAL (VIAJE + COMIDAS) ==========
+    # Las escrituras de viajes pasan por el escritor único (escritor_db.py), que
+    # las agrupa en transacciones BEGIN IMMEDIATE; cada _funcion recibe su cursor.
+    # guardar_viaje_con_comidas / actualizar_viaje_con_comidas reemplazan a los
+    # antiguos insert_viaje, update_viaje_by_numero_centro e insert_comida*.
+    
+    def _insertar_comidas(self, cursor, numero_viaje, centro_costo, comidas):
+        """executemany de las comidas de un centro. Retorna los ids asignados, en orden."""
+        if not comidas:
+            return []
+        cursor.executemany(f'''
+            INSERT INTO comidas_preparadas (numero_viaje, numero_centro_costo, {', '.join(CAMPOS_COMIDA)})
+            VALUES (?, ?, {', '.join('?' for _ in CAMPOS_COMIDA)})
+        ''', [
+            (numero_viaje, centro_costo) + tuple(comida.get(campo, '') for campo in CAMPOS_COMIDA)
+            for comida in comidas
+        ])
+        # executemany no informa lastrowid; con un solo escritor dentro de la
+        # transacción, los rowid de este lote son consecutivos
+        ultimo = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+        return list(range(ultimo - len(comidas) + 1, ultimo + 1))
+    
+    def _guardar_viaje_con_comidas(self, cursor, viaje_data, comidas):
+        cursor.execute(f'''
+            INSERT INTO viajes ({', '.join(CAMPOS_VIAJE)})
+            VALUES ({', '.join('?' for _ in CAMPOS_VIAJE)})
+        ''', [viaje_data.get(campo, '') for campo in CAMPOS_VIAJE])
+        viaje_id = cursor.lastrowid
+        ids_comidas = self._insertar_comidas(
+            cursor, viaje_data.get('numero_viaje'), viaje_data.get('costo_codigo'), comidas
+        )
+        return viaje_id, ids_comidas
+    
+    def guardar_viaje_con_comidas(self, viaje_data, comidas):
+        """
+        Insertar el viaje de un centro de costo y todas sus comidas en una sola
+        transacción: se guarda todo o nada.
+        
+        Retorna (viaje_id, ids_comidas). Los errores (por ejemplo viaje + centro
+        ya existente) se propagan después de deshacer la escritura.
+        """
+        return escritor_db.ejecutar(self._guardar_viaje_con_comidas, viaje_data, comidas)
+    
+    def _actualizar_viaje_con_comidas(self, cursor, numero_viaje, centro_costo, viaje_data, comidas):
+        set_clause = ', '.join(f"{campo} = ?" for campo in CAMPOS_VIAJE_ACTUALIZABLES)
+        cursor.execute(
+            f"UPDATE viajes SET {set_clause} WHERE numero_viaje = ? AND costo_codigo = ?",
+            [viaje_data.get(campo, '') for campo in CAMPOS_VIAJE_ACTUALIZABLES] + [numero_viaje, centro_costo]
+        )
+        if cursor.rowcount == 0:
+            return None
+        cursor.execute('''
+            DELETE FROM comidas_preparadas 
+            WHERE numero_viaje = ? AND numero_centro_costo = ?
+        ''', (numero_viaje, centro_costo))
+        return self._insertar_comidas(cursor, numero_viaje, centro_costo, comidas)
+    
+    def actualizar_viaje_con_comidas(self, numero_viaje, centro_costo, viaje_data, comidas):
+        """
+        Actualizar el viaje de un centro de costo y reemplazar sus comidas
+        (DELETE + executemany) en una sola transacción.
+        
+        Retorna la lista de ids de las comidas nuevas, o None si el viaje no
+        existe (en ese caso no se toca nada).
+        """
+        return escritor_db.ejecutar(
+            self._actualizar_viaje_con_comidas, numero_viaje, centro_costo, viaje_data, comidas
+        )
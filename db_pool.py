@@ -0,0 +1,462 @@
+"""
+Pool de conexiones SQLite compartido por todos los managers
+Una conexión por hilo (afinidad) con un máximo global de conexiones abiertas.
+Los PRAGMA se aplican en un solo lugar al crear cada conexión.
+
+Mientras un request del servidor web tiene una MedicionSQL activa (ver
+metricas_http.py), los cursores de las conexiones del pool suman a ella el
+tiempo de SQL, la cantidad de consultas y las filas leídas. Con el registro
+de consultas lentas activo (ARATRACK_SQL_LENTO_MS, ver consultas_lentas.py)
+todos los cursores se miden y las sentencias lentas se anotan con su plan.
+"""
+import contextvars
+import sqlite3
+import threading
+import time
+from config import config
+from consultas_lentas import consultas_lentas
+
+
+class MedicionSQL:
+    """Acumulador de SQL de un request: segundos, consultas ejecutadas y filas leídas"""
+    __slots__ = ('segundos', 'consultas', 'filas')
+
+    def __init__(self):
+        self.segundos = 0.0
+        self.consultas = 0
+        self.filas = 0
+
+
+# Medición del request en curso (None fuera de un request: sin costo extra)
+medicion_sql = contextvars.ContextVar('medicion_sql', default=None)
+
+
+class CursorMedido:
+    """
+    Envoltorio de sqlite3.Cursor que mide cada sentencia (execute más la lectura
+    de sus filas): suma tiempo, consultas y filas a la MedicionSQL del request
+    (si hay una) y pasa las que superan el umbral a consultas_lentas.
+    """
+
+    def __init__(self, cursor, medicion):
+        self._cursor = cursor
+        self._medicion = medicion
+        self._sentencia = None
+        self._segundos = 0.0
+        self._filas = 0
+
+    def _medir(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            transcurrido = time.perf_counter() - inicio
+            self._segundos += transcurrido
+            if self._medicion is not None:
+                self._medicion.segundos += transcurrido
+
+    def _contar(self, filas):
+        self._filas += filas
+        if self._medicion is not None:
+            self._medicion.filas += filas
+
+    def _ejecutar(self, metodo, sql, parametros=(), filas_lote=None):
+        self._terminar()
+        if self._medicion is not None:
+            self._medicion.consultas += 1
+        self._sentencia = (metodo.__name__, sql, parametros, filas_lote)
+        self._segundos = 0.0
+        self._filas = 0
+        try:
+            if metodo.__name__ == 'executescript':
+                self._medir(metodo, sql)
+            else:
+                self._medir(metodo, sql, parametros)
+        except Exception:
+            self._terminar()
+            raise
+        if self._cursor.description is None:
+            # Sin filas que leer (INSERT, UPDATE, DDL): la sentencia ya terminó
+            self._terminar()
+        return self
+
+    def _terminar(self):
+        """Fin de la sentencia actual: anotarla si superó el umbral de consultas lentas"""
+        if self._sentencia is None:
+            return
+        tipo, sql, parametros, filas_lote = self._sentencia
+        self._sentencia = None
+        if consultas_lentas.activo and self._segundos * 1000 >= consultas_lentas.umbral_ms:
+            if tipo == 'executemany':
+                # executemany: solo la primera fila (si el lote es una secuencia) para el plan
+                parametros = parametros[0] if isinstance(parametros, (list, tuple)) and parametros else None
+            consultas_lentas.registrar(self._cursor.connection, tipo, sql, parametros,
+                                       self._segundos, self._filas, filas_lote)
+
+    def execute(self, sql, parametros=()):
+        return self._ejecutar(self._cursor.execute, sql, parametros)
+
+    def executemany(self, sql, parametros):
+        if not isinstance(parametros, (list, tuple)) and consultas_lentas.activo:
+            # Generador: se materializa para poder contar el lote y tomar la primera fila
+            parametros = list(parametros)
+        filas_lote = len(parametros) if isinstance(parametros, (list, tuple)) else None
+        return self._ejecutar(self._cursor.executemany, sql, parametros, filas_lote)
+
+    def executescript(self, sql):
+        return self._ejecutar(self._cursor.executescript, sql)
+
+    def fetchone(self):
+        fila = self._medir(self._cursor.fetchone)
+        if fila is None:
+            self._terminar()
+        else:
+            self._contar(1)
+        return fila
+
+    def fetchmany(self, size=None):
+        size = self._cursor.arraysize if size is None else size
+        filas = self._medir(self._cursor.fetchmany, size)
+        self._contar(len(filas))
+        if len(filas) < size:
+            self._terminar()
+        return filas
+
+    def fetchall(self):
+        filas = self._medir(self._cursor.fetchall)
+        self._contar(len(filas))
+        self._terminar()
+        return filas
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            fila = self._medir(next, self._cursor)
+        except StopIteration:
+            self._terminar()
+            raise
+        self._contar(1)
+        return fila
+
+    def close(self):
+        self._terminar()
+        self._cursor.close()
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        # Estado propio con _; el resto (row_factory, arraysize) va al cursor real
+        if nombre.startswith('_'):
+            object.__setattr__(self, nombre, valor)
+        else:
+            setattr(self._cursor, nombre, valor)
+
+
+class PooledConnection:
+    """Envoltorio de sqlite3.Connection que devuelve la conexión al pool en close()"""
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_liberada', False)
+
+    def close(self):
+        """Devolver la conexión al pool (no la cierra realmente)"""
+        if not self._liberada:
+            object.__setattr__(self, '_liberada', True)
+            self._pool._liberar(self._conn)
+
+    def __getattr__(self, nombre):
+        if self._liberada:
+            raise sqlite3.ProgrammingError('Conexión ya devuelta al pool')
+        return getattr(self._conn, nombre)
+
+    def cursor(self, *args):
+        """Cursor de la conexión real; medido si hay un request con MedicionSQL o registro de consultas lentas"""
+        if self._liberada:
+            raise sqlite3.ProgrammingError('Conexión ya devuelta al pool')
+        cursor = self._conn.cursor(*args)
+        medicion = medicion_sql.get()
+        if medicion is None and not consultas_lentas.activo:
+            return cursor
+        return CursorMedido(cursor, medicion)
+
+    # Atajos de sqlite3.Connection: pasan por cursor() para quedar medidos
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+
+    def __setattr__(self, nombre, valor):
+        # row_factory, isolation_level, etc. se aplican a la conexión real
+        setattr(self._conn, nombre, valor)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def __del__(self):
+        # Igual que sqlite3: si el código olvida close(), liberar al recolectar
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite con afinidad por hilo"""
+
+    def __init__(self, db_path, max_conexiones=None, timeout=None):
+        self.db_path = db_path
+        self.max_conexiones = max_conexiones or config.db_pool_size
+        self.timeout = timeout if timeout is not None else config.db_pool_timeout
+        self.intervalo_ping = 30.0  # Segundos sin uso antes de verificar la conexión
+
+        self._lock = threading.Condition(threading.Lock())
+        # Conexiones ociosas: id(conn) -> (conn, ident_hilo_dueño, ultimo_uso)
+        self._ociosas = {}
+        self._en_uso = set()
+        self._cerrado = False
+
+        # Métricas
+        self._creadas = 0
+        self._reutilizadas = 0
+        self._descartadas = 0
+        self._esperas = 0
+
+    # ========== CICLO DE VIDA DE CONEXIONES ==========
+
+    def _crear_conexion(self):
+        """Abrir una conexión nueva y aplicar los PRAGMA estándar"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30.0,  # Mayor timeout para esperar en caso de bloqueo
+            check_same_thread=False,  # La conexión puede pasar de un hilo a otro dentro del pool
+            isolation_level=None
+        )
+        # WAL: lecturas y escrituras simultáneas
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        # En WAL, NORMAL es seguro ante caídas de la app y evita un fsync por commit
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _conexion_sana(self, conn):
+        """Health check liviano de una conexión"""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _cerrar_silencioso(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def conexion(self, row_factory=None, isolation_level=None):
+        """
+        Obtener una conexión del pool.
+        row_factory / isolation_level se aplican en cada préstamo, así cada manager
+        conserva su comportamiento (tuplas y autocommit, o sqlite3.Row y transacciones).
+        """
+        hilo = threading.get_ident()
+        limite = time.monotonic() + self.timeout
+        conn = None
+        ultimo_uso = None
+
+        with self._lock:
+            while True:
+                if self._cerrado:
+                    raise sqlite3.ProgrammingError('El pool de conexiones está cerrado')
+
+                # 1. Preferir la conexión que este mismo hilo usó antes
+                candidata = None
+                for clave, (c, dueño, usado) in self._ociosas.items():
+                    if dueño == hilo:
+                        candidata = clave
+                        break
+                if candidata is not None:
+                    conn, _, ultimo_uso = self._ociosas.pop(candidata)
+                    break
+
+                # 2. Crear una nueva si queda cupo
+                if len(self._ociosas) + len(self._en_uso) < self.max_conexiones:
+                    break
+
+                # 3. Tomar la ociosa más antigua de otro hilo
+                if self._ociosas:
+                    candidata = min(self._ociosas, key=lambda k: self._ociosas[k][2])
+                    conn, _, ultimo_uso = self._ociosas.pop(candidata)
+                    break
+
+                # 4. Pool agotado: esperar a que alguien libere
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise sqlite3.OperationalError(
+                        f'Pool de conexiones agotado ({self.max_conexiones} en uso)'
+                    )
+                self._esperas += 1
+                self._lock.wait(restante)
+
+            # Reservar el cupo antes de salir del lock
+            marcador = object()
+            self._en_uso.add(id(marcador))
+
+        try:
+            if conn is not None and time.monotonic() - ultimo_uso > self.intervalo_ping:
+                if not self._conexion_sana(conn):
+                    self._cerrar_silencioso(conn)
+                    conn = None
+                    with self._lock:
+                        self._descartadas += 1
+
+            if conn is None:
+                conn = self._crear_conexion()
+                with self._lock:
+                    self._creadas += 1
+            else:
+                with self._lock:
+                    self._reutilizadas += 1
+
+            conn.row_factory = row_factory
+            conn.isolation_level = isolation_level
+        except Exception:
+            with self._lock:
+                self._en_uso.discard(id(marcador))
+                self._lock.notify()
+            raise
+
+        with self._lock:
+            self._en_uso.discard(id(marcador))
+            self._en_uso.add(id(conn))
+
+        return PooledConnection(self, conn)
+
+    def _liberar(self, conn):
+        """Recibir una conexión devuelta por un PooledConnection"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            reutilizable = not self._cerrado
+        except sqlite3.Error:
+            reutilizable = False
+
+        with self._lock:
+            self._en_uso.discard(id(conn))
+            if reutilizable and not self._cerrado:
+                self._ociosas[id(conn)] = (conn, threading.get_ident(), time.monotonic())
+            else:
+                self._descartadas += 1
+                self._cerrar_silencioso(conn)
+            self._lock.notify()
+
+    # ========== SALUD Y MÉTRICAS ==========
+
+    def verificar_salud(self):
+        """Verificar todas las conexiones ociosas y descartar las que fallen"""
+        with self._lock:
+            ociosas = list(self._ociosas.items())
+
+        descartadas = 0
+        for clave, (conn, dueño, _) in ociosas:
+            with self._lock:
+                # Puede haber sido tomada por otro hilo mientras tanto
+                if clave not in self._ociosas:
+                    continue
+                self._ociosas.pop(clave)
+                self._en_uso.add(clave)
+            sana = self._conexion_sana(conn)
+            with self._lock:
+                self._en_uso.discard(clave)
+                if sana and not self._cerrado:
+                    self._ociosas[clave] = (conn, dueño, time.monotonic())
+                else:
+                    self._cerrar_silencioso(conn)
+                    self._descartadas += 1
+                    if not sana:
+                        descartadas += 1
+                self._lock.notify()
+
+        estado = self.estadisticas()
+        estado['ok'] = descartadas == 0
+        estado['descartadas_en_verificacion'] = descartadas
+        return estado
+
+    def estadisticas(self):
+        """Métricas de tamaño y uso del pool"""
+        with self._lock:
+            return {
+                'db_path': self.db_path,
+                'max_conexiones': self.max_conexiones,
+                'abiertas': len(self._ociosas) + len(self._en_uso),
+                'en_uso': len(self._en_uso),
+                'ociosas': len(self._ociosas),
+                'creadas': self._creadas,
+                'reutilizadas': self._reutilizadas,
+                'descartadas': self._descartadas,
+                'esperas': self._esperas,
+                'cerrado': self._cerrado
+            }
+
+    def cerrar(self):
+        """Cerrar todas las conexiones ociosas; las que estén en uso se cierran al devolverse"""
+        with self._lock:
+            self._cerrado = True
+            ociosas = [conn for conn, _, _ in self._ociosas.values()]
+            self._ociosas.clear()
+            self._lock.notify_all()
+        for conn in ociosas:
+            self._cerrar_silencioso(conn)
+
+
+# ========== REGISTRO GLOBAL DE POOLS (uno por archivo de BD) ==========
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def obtener_pool(db_path=None):
+    """Retorna el pool asociado a db_path (por defecto la BD configurada)"""
+    if db_path is None:
+        db_path = config.get_db_path()
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None or pool._cerrado:
+            pool = ConnectionPool(db_path)
+            _pools[db_path] = pool
+        return pool
+
+
+def obtener_conexion(db_path=None, row_factory=None, isolation_level=None):
+    """Atajo: pedir una conexión al pool de db_path"""
+    return obtener_pool(db_path).conexion(row_factory=row_factory, isolation_level=isolation_level)
+
+
+def estadisticas_pools():
+    """Métricas de todos los pools activos"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.estadisticas() for pool in pools]
+
+
+def cerrar_pools():
+    """Hook de apagado: cerrar todos los pools"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.cerrar()
+    print("[Pool] Conexiones SQLite cerradas")
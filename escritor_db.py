@@ -0,0 +1,213 @@
+"""
+Escritor único de SQLite con commit agrupado (group commit)
+Las escrituras de los endpoints no abren su propia transacción: se encolan
+como funcion(cursor, ...) y un solo hilo las ejecuta. Lo que se acumula en la
+cola mientras se confirma un lote entra en el siguiente, que se ejecuta en
+una sola transacción BEGIN IMMEDIATE ... COMMIT (un SAVEPOINT por escritura,
+así el error de una no deshace las demás).
+
+Como hay un solo escritor, los hilos de Waitress ya no compiten por el lock
+de escritura de SQLite (SQLITE_BUSY + busy_timeout). Las lecturas siguen por
+el pool normal y ven snapshots WAL.
+
+Pasan por aquí todas las escrituras del servidor: viajes y comidas
+(db_manager), maestras, proveedores y transportes (maestras_manager y
+app_web), usuarios (auth_manager), rendiciones, la tabla jobs de la cola de
+trabajos y el manifiesto de la caché de PDFs. Quedan fuera, con su propia
+transacción, la creación del esquema al iniciar (migraciones.py,
+init_users_table) y los scripts de línea de comandos que corren en otro
+proceso (cargar_datos_excel.py, reiniciar_bd_completa.py, ...).
+"""
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from config import config
+from db_pool import obtener_conexion, medicion_sql
+
+# Muestras recientes que se conservan para los percentiles de las métricas
+MUESTRAS_METRICAS = 1000
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+class EscritorDB:
+    """Hilo escritor único que agrupa las escrituras encoladas en transacciones"""
+
+    def __init__(self, db_path=None, lote_max=None):
+        self.db_path = db_path or config.get_db_path()
+        self.lote_max = lote_max or config.escritor_lote_max
+        self._cola = queue.Queue()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+        # Métricas
+        self._escrituras = 0
+        self._fallidas = 0
+        self._commits = 0
+        self._profundidad_max = 0
+        self._latencias_commit = deque(maxlen=MUESTRAS_METRICAS)   # ms de BEGIN a COMMIT por lote
+        self._esperas = deque(maxlen=MUESTRAS_METRICAS)            # ms desde que se encola hasta el COMMIT
+        self._tamanos_lote = deque(maxlen=MUESTRAS_METRICAS)
+
+    # ========== CICLO DE VIDA ==========
+
+    def _asegurar_hilo(self):
+        """El hilo se crea con la primera escritura (también en scripts y procesos hijos)"""
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='EscritorDB', daemon=True)
+                self._hilo.start()
+
+    def detener(self, timeout=5):
+        """Procesar lo que quedó en la cola y terminar el hilo"""
+        with self._lock:
+            hilo = self._hilo
+            self._hilo = None
+        if hilo is not None and hilo.is_alive():
+            self._cola.put(None)
+            hilo.join(timeout)
+
+    # ========== ESCRITURA ==========
+
+    def ejecutar(self, funcion, *args, **kwargs):
+        """
+        Encolar funcion(cursor, *args, **kwargs) y esperar a que su lote se confirme.
+        Retorna lo que retorne la función o relanza su excepción (su escritura
+        se deshace sin afectar a las demás del lote).
+        """
+        if threading.current_thread() is self._hilo:
+            raise RuntimeError('Una escritura encolada no puede encolar otra escritura')
+        self._asegurar_hilo()
+
+        futuro = Future()
+        encolado = time.perf_counter()
+        self._cola.put((funcion, args, kwargs, futuro, encolado))
+        profundidad = self._cola.qsize()
+        with self._lock:
+            if profundidad > self._profundidad_max:
+                self._profundidad_max = profundidad
+        try:
+            return futuro.result()
+        finally:
+            # El request que espera cuenta la escritura (cola + lote + COMMIT) como tiempo de SQL
+            medicion = medicion_sql.get()
+            if medicion is not None:
+                medicion.segundos += time.perf_counter() - encolado
+                medicion.consultas += 1
+
+    def _bucle(self):
+        """Tomar un pedido y sumar al lote los que ya esperan en la cola"""
+        while True:
+            pedido = self._cola.get()
+            if pedido is None:
+                return
+            lote = [pedido]
+            detener = False
+            while len(lote) < self.lote_max:
+                try:
+                    siguiente = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    detener = True
+                    break
+                lote.append(siguiente)
+            self._procesar(lote)
+            if detener:
+                return
+
+    def _procesar(self, lote):
+        """Ejecutar un lote en una sola transacción y entregar cada resultado a quien espera"""
+        resultados = []
+        try:
+            conn = obtener_conexion(self.db_path)
+        except Exception as e:
+            for _, _, _, futuro, _ in lote:
+                futuro.set_exception(e)
+            return
+
+        try:
+            cursor = conn.cursor()
+            inicio = time.perf_counter()
+            cursor.execute('BEGIN IMMEDIATE')
+            for funcion, args, kwargs, futuro, _ in lote:
+                cursor.execute('SAVEPOINT escritura')
+                try:
+                    resultados.append((futuro, funcion(cursor, *args, **kwargs), None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO escritura')
+                    resultados.append((futuro, None, e))
+                cursor.execute('RELEASE escritura')
+            cursor.execute('COMMIT')
+            fin = time.perf_counter()
+        except Exception as e:
+            # Falló la transacción del lote (BEGIN, COMMIT o el disco): nada quedó escrito
+            try:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            print(f"[EscritorDB] Error en lote de {len(lote)} escrituras: {e}")
+            with self._lock:
+                self._fallidas += len(lote)
+            for _, _, _, futuro, _ in lote:
+                futuro.set_exception(e)
+            return
+        finally:
+            conn.close()
+
+        fallidas = sum(1 for _, _, error in resultados if error is not None)
+        with self._lock:
+            self._commits += 1
+            self._escrituras += len(lote) - fallidas
+            self._fallidas += fallidas
+            self._tamanos_lote.append(len(lote))
+            self._latencias_commit.append((fin - inicio) * 1000)
+            self._esperas.extend((fin - encolado) * 1000 for _, _, _, _, encolado in lote)
+
+        for futuro, resultado, error in resultados:
+            if error is not None:
+                futuro.set_exception(error)
+            else:
+                futuro.set_result(resultado)
+
+    # ========== MÉTRICAS ==========
+
+    def estadisticas(self):
+        """Profundidad de la cola, tamaño de los lotes y latencias (ms) de commit y de espera"""
+        with self._lock:
+            latencias = list(self._latencias_commit)
+            esperas = list(self._esperas)
+            tamanos = list(self._tamanos_lote)
+            return {
+                'activo': self._hilo is not None and self._hilo.is_alive(),
+                'en_cola': self._cola.qsize(),
+                'profundidad_max': self._profundidad_max,
+                'lote_max': self.lote_max,
+                'escrituras': self._escrituras,
+                'fallidas': self._fallidas,
+                'commits': self._commits,
+                'escrituras_por_commit': round(sum(tamanos) / len(tamanos), 2) if tamanos else 0,
+                'commit_ms': {
+                    'promedio': round(sum(latencias) / len(latencias), 2) if latencias else 0,
+                    'p95': round(_percentil(latencias, 0.95), 2),
+                    'max': round(max(latencias), 2) if latencias else 0
+                },
+                'espera_ms': {
+                    'promedio': round(sum(esperas) / len(esperas), 2) if esperas else 0,
+                    'p95': round(_percentil(esperas, 0.95), 2),
+                    'max': round(max(esperas), 2) if esperas else 0
+                }
+            }
+
+
+# Instancia global: un solo escritor para la base configurada
+escritor_db = EscritorDB()
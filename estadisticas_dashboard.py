@@ -0,0 +1,198 @@
+"""
+Motor de agregación del dashboard
+Calcula los seis conjuntos de resultados de /api/dashboard/estadisticas
+(resumen, tendencia, tendencia_tipos, por_administrativo, top_casinos y
+detalle) con cinco consultas GROUP BY sobre el rango filtrado: tendencia y
+tendencia_tipos salen de la misma agrupación por período.
+
+Cada ORDER BY termina en la clave del grupo, así los empates (mismo total)
+salen siempre en el mismo orden y el LIMIT de top_casinos siempre elige los
+mismos casinos.
+
+Las vistas semanal y mensual suman viajes_rollup_diario en vez de las filas de
+viajes; los viajes distintos (no sumables) se cuentan aparte con COUNT(DISTINCT)
+sobre viajes_rollup_numeros y se unen por clave de grupo.
+"""
+import sqlite3
+from rollup_diario import TABLA_ROLLUP, TABLA_NUMEROS, MEDIDAS
+
+# Formato de agrupación de strftime según la vista del dashboard
+FORMATOS_PERIODO = {
+    'diaria': '%Y-%m-%d',
+    'semanal': '%Y-W%W',
+    'mensual': '%Y-%m'
+}
+
+# Checks en el orden de las claves del JSON (columna del rollup -> clave)
+CHECKS = ['congelado', 'refrigerado', 'abarrote', 'implementos', 'aseo', 'trazabilidad']
+MEDIDAS_CHECKS = [f'check_{check}' for check in CHECKS]
+MEDIDAS_PALLETS = ['pallets', 'pallets_chep', 'pallets_pl_negro_grueso', 'pallets_pl_negro_alternativo']
+
+_EXPRESIONES = {nombre: expr.format(p='') for nombre, expr in MEDIDAS}
+
+
+def formato_periodo(vista):
+    """Formato strftime para la vista ('diaria', 'semanal' o cualquier otra -> mensual)"""
+    return FORMATOS_PERIODO.get(vista, FORMATOS_PERIODO['mensual'])
+
+
+def _filtro(fecha_inicio, fecha_fin, administrativo):
+    where_clause = "WHERE fecha BETWEEN ? AND ?"
+    params = [fecha_inicio, fecha_fin]
+
+    if administrativo:
+        where_clause += " AND administrativo_responsable = ?"
+        params.append(administrativo)
+    return where_clause, params
+
+
+class _Consultas:
+    """
+    Arma las consultas agrupadas sobre viajes (una fila por bitácora) o sobre el
+    rollup. Cada consulta devuelve las claves, las medidas pedidas y, si se pide,
+    la cantidad de viajes distintos como última columna.
+    """
+
+    def __init__(self, conn, where_clause, params, rollup):
+        self.conn = conn
+        self.where_clause = where_clause
+        self.params = params
+        self.rollup = rollup
+
+    def _suma(self, nombre):
+        if self.rollup:
+            return f'SUM({nombre})'
+        return 'COUNT(*)' if nombre == 'bitacoras' else f'SUM({_EXPRESIONES[nombre]})'
+
+    def _viajes_distintos(self, claves):
+        """Subconsulta con los viajes distintos por grupo (solo para el rollup, sin clave casino)"""
+        seleccion = ''.join(f'{expr} as {alias}, ' for alias, expr in claves)
+        agrupacion = f"GROUP BY {', '.join(alias for alias, _ in claves)}" if claves else ''
+        return f'''
+            SELECT {seleccion}COUNT(DISTINCT numero_viaje) as viajes
+            FROM {TABLA_NUMEROS}
+            {self.where_clause}
+            {agrupacion}
+        '''
+
+    def agrupar(self, claves, medidas, viajes=False, orden='', limite=None):
+        """
+        claves: [(alias, expresión)] del GROUP BY; medidas: columnas de MEDIDAS a sumar;
+        orden: ORDER BY sobre los alias (claves, medidas o 'viajes')
+        """
+        seleccion = [f'{expr} as {alias}' for alias, expr in claves]
+        seleccion += [f'{self._suma(nombre)} as {nombre}' for nombre in medidas]
+        agrupacion = f"GROUP BY {', '.join(alias for alias, _ in claves)}" if claves else ''
+        orden_sql = f'ORDER BY {orden}' if orden else ''
+        limite_sql = f'LIMIT {int(limite)}' if limite else ''
+        params = list(self.params)
+
+        if viajes and not self.rollup:
+            seleccion.append('COUNT(DISTINCT numero_viaje) as viajes')
+        tabla = TABLA_ROLLUP if self.rollup else 'viajes'
+        sql = f'''
+            SELECT {', '.join(seleccion)}
+            FROM {tabla}
+            {self.where_clause}
+            {agrupacion}
+        '''
+        if viajes and self.rollup:
+            union = ' AND '.join(f's.{alias} IS v.{alias}' for alias, _ in claves) or '1'
+            sql = f'''
+                SELECT s.*, COALESCE(v.viajes, 0) as viajes
+                FROM ({sql}) s
+                LEFT JOIN ({self._viajes_distintos(claves)}) v ON {union}
+            '''
+            params += self.params
+        return self.conn.execute(f'{sql} {orden_sql} {limite_sql}', params).fetchall()
+
+
+def _estadisticas(consultas, vista):
+    periodo = ('periodo', f"strftime('{formato_periodo(vista)}', fecha)")
+    admin = ('administrativo_responsable', 'administrativo_responsable')
+    casino = ('casino', 'casino')
+
+    # Resumen general (SUM sobre cero filas es NULL, como antes)
+    medidas_resumen = ['bitacoras'] + MEDIDAS_CHECKS + ['num_wencos', 'bin'] + MEDIDAS_PALLETS
+    fila = consultas.agrupar([], medidas_resumen, viajes=True)[0]
+    pallets = [valor or 0 for valor in fila[9:13]]
+    resumen = {
+        'total_bitacoras': fila[0] or 0,
+        'viajes_unicos': fila[13],
+        'check_congelado': fila[1],
+        'check_refrigerado': fila[2],
+        'check_abarrote': fila[3],
+        'check_implementos': fila[4],
+        'check_aseo': fila[5],
+        'check_trazabilidad': fila[6],
+        'total_wencos': fila[7] or 0,
+        'total_bin': fila[8] or 0,
+        'pallets_std': pallets[0],
+        'pallets_chep': pallets[1],
+        'pallets_negro_grueso': pallets[2],
+        'pallets_negro_alternativo': pallets[3],
+        'total_pallets': sum(pallets)
+    }
+
+    # Tendencia temporal y por tipos: una sola agrupación por período
+    filas = consultas.agrupar([periodo], ['bitacoras'] + MEDIDAS_CHECKS, viajes=True, orden='periodo')
+    tendencia = [{'periodo': f[0], 'total_bitacoras': f[1], 'viajes_unicos': f[8]} for f in filas]
+    tendencia_tipos = []
+    for f in filas:
+        fila_tipos = {'periodo': f[0]}
+        fila_tipos.update(zip(CHECKS, f[2:8]))
+        tendencia_tipos.append(fila_tipos)
+
+    # Por administrativo
+    filas = consultas.agrupar([admin], ['bitacoras'], viajes=True,
+                              orden='bitacoras DESC, administrativo_responsable')
+    por_administrativo = [{
+        'administrativo': f[0] if f[0] is not None else 'Sin asignar',
+        'total_bitacoras': f[1],
+        'viajes_unicos': f[2]
+    } for f in filas]
+
+    # Top 10 casinos
+    filas = consultas.agrupar([casino], ['bitacoras'], orden='bitacoras DESC, casino', limite=10)
+    top_casinos = [{'casino': f[0] if f[0] is not None else 'Sin especificar', 'total': f[1]} for f in filas]
+
+    # Detalle para tabla con pallets y wencos totales
+    filas = consultas.agrupar([periodo, admin], ['bitacoras'] + MEDIDAS_CHECKS + MEDIDAS_PALLETS + ['num_wencos'],
+                              viajes=True, orden='periodo DESC, bitacoras DESC, administrativo_responsable')
+    detalle = []
+    for f in filas:
+        fila_detalle = {
+            'periodo': f[0],
+            'administrativo': f[1] if f[1] is not None else 'Sin asignar',
+            'total_bitacoras': f[2],
+            'viajes_unicos': f[14]
+        }
+        fila_detalle.update(zip(CHECKS, f[3:9]))
+        fila_detalle['pallets'] = sum(valor or 0 for valor in f[9:13])
+        fila_detalle['wencos'] = f[13] or 0
+        detalle.append(fila_detalle)
+
+    return {
+        'resumen': resumen,
+        'tendencia': tendencia,
+        'tendencia_tipos': tendencia_tipos,
+        'por_administrativo': por_administrativo,
+        'top_casinos': top_casinos,
+        'detalle': detalle
+    }
+
+
+def calcular_estadisticas(conn, fecha_inicio, fecha_fin, administrativo='', vista='diaria'):
+    """
+    Calcular todas las estadísticas del dashboard.
+    Retorna el mismo diccionario que serializaba get_estadisticas_dashboard.
+    """
+    where_clause, params = _filtro(fecha_inicio, fecha_fin, administrativo)
+    if vista != 'diaria':
+        try:
+            return _estadisticas(_Consultas(conn, where_clause, params, rollup=True), vista)
+        except sqlite3.OperationalError as e:
+            # Rollup o índice aún no creados (migraciones pendientes): agrupar viajes
+            print(f"[Dashboard] Rollup no disponible, usando las filas de viajes: {e}")
+
+    return _estadisticas(_Consultas(conn, where_clause, params, rollup=False), vista)
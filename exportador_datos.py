@@ -0,0 +1,231 @@
+"""
+Exportación de reportes en formatos de datos (CSV, NDJSON y Parquet)
+Pensado para cargas de BI: cada formato es un generador de bytes que recorre
+el cursor por lotes, sin materializar el resultado completo.
+
+Parquet requiere pyarrow (opcional): si no está instalado el formato se
+informa como no disponible y los demás siguen funcionando.
+"""
+import csv
+import io
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# formato -> (extensión, mimetype)
+FORMATOS = {
+    'csv': ('csv', 'text/csv'),
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Filas por lote de lectura (CSV/NDJSON) y por row group (Parquet)
+TAMANO_LOTE = 1000
+TAMANO_ROW_GROUP = 50000
+
+# Mayor entero que float64 representa sin pérdida (2^53)
+MAXIMO_ENTERO_EXACTO = 2 ** 53
+
+
+def formato_disponible(formato):
+    """True si el formato existe y sus dependencias están instaladas"""
+    if formato == 'parquet':
+        return pa is not None
+    return formato in FORMATOS
+
+
+def _lotes(filas, tamano):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def generar_csv(columnas, filas):
+    """CSV UTF-8 con encabezado (sin BOM, separador coma)"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    escritor.writerow(columnas)
+    for lote in _lotes(filas, TAMANO_LOTE):
+        escritor.writerows(lote)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def generar_ndjson(columnas, filas):
+    """Un objeto JSON por línea con las columnas como claves"""
+    for lote in _lotes(filas, TAMANO_LOTE):
+        lineas = [json.dumps(dict(zip(columnas, fila)), ensure_ascii=False, default=str) for fila in lote]
+        yield ('\n'.join(lineas) + '\n').encode('utf-8')
+
+
+def _tipo_parquet(clases, enteros_grandes):
+    """
+    Tipo Parquet para las clases de valor no nulas de una columna ({'integer',
+    'real', 'text', 'blob'}): int64 o float64 solo si la conversión es exacta,
+    binary si son todos blobs y string en cualquier otro caso.
+    """
+    if clases == {'integer'}:
+        return pa.int64()
+    if clases == {'real'} or (clases == {'integer', 'real'} and not enteros_grandes):
+        return pa.float64()
+    if clases == {'blob'}:
+        return pa.binary()
+    return pa.string()
+
+
+def _clase(valor):
+    if isinstance(valor, bool):
+        return 'text'
+    if isinstance(valor, int):
+        return 'integer'
+    if isinstance(valor, float):
+        return 'real'
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return 'blob'
+    return 'text'
+
+
+def _tipo_columna(valores):
+    """Tipo de una columna según los valores de un lote (cuando no hay tipos_columnas)"""
+    no_nulos = [v for v in valores if v is not None]
+    enteros_grandes = any(isinstance(v, int) and abs(v) > MAXIMO_ENTERO_EXACTO for v in no_nulos)
+    return _tipo_parquet({_clase(v) for v in no_nulos}, enteros_grandes)
+
+
+def tipos_columnas(conn, sql, parametros, num_columnas):
+    """
+    Tipos Parquet de cada columna según TODAS las filas de la consulta: una
+    pasada previa con typeof() sobre la consulta completa, así el esquema no
+    depende de lo que traiga el primer row group.
+    """
+    nombres = [f'c{i}' for i in range(num_columnas)]
+    agregados = []
+    for nombre in nombres:
+        agregados.append(f'group_concat(DISTINCT typeof({nombre}))')
+        agregados.append(f"MAX(typeof({nombre}) = 'integer' AND "
+                         f"({nombre} > {MAXIMO_ENTERO_EXACTO} OR {nombre} < -{MAXIMO_ENTERO_EXACTO}))")
+    fila = conn.execute(
+        f"WITH consulta({', '.join(nombres)}) AS ({sql}) SELECT {', '.join(agregados)} FROM consulta",
+        parametros
+    ).fetchone()
+
+    tipos = []
+    for i in range(num_columnas):
+        clases = set((fila[2 * i] or '').split(',')) - {'null', ''}
+        tipos.append(_tipo_parquet(clases, bool(fila[2 * i + 1])))
+    return tipos
+
+
+def _convertir(valores, tipo, columna):
+    """
+    Ajustar los valores de un lote al tipo de la columna sin perder información:
+    números a texto, enteros exactos a float64. Cualquier otro valor que no
+    entre en el tipo corta la exportación con ValueError (nunca se escribe NULL
+    ni se trunca).
+    """
+    if tipo == pa.string():
+        return [v if v is None or isinstance(v, str) else str(v) for v in valores]
+
+    convertidos = []
+    for v in valores:
+        if v is None:
+            convertidos.append(None)
+        elif tipo == pa.int64() and _clase(v) == 'integer':
+            convertidos.append(v)
+        elif tipo == pa.float64() and _clase(v) == 'real':
+            convertidos.append(v)
+        elif tipo == pa.float64() and _clase(v) == 'integer' and abs(v) <= MAXIMO_ENTERO_EXACTO:
+            convertidos.append(float(v))
+        elif tipo == pa.binary() and _clase(v) == 'blob':
+            convertidos.append(bytes(v))
+        else:
+            raise ValueError(f"Columna {columna}: el valor {v!r} no se puede escribir como {tipo} sin pérdida")
+    return convertidos
+
+
+class _Salida(io.RawIOBase):
+    """Archivo de solo escritura para ParquetWriter: acumula bytes hasta que el generador los entrega"""
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def generar_parquet(columnas, filas, tipos=None):
+    """
+    Parquet con un row group cada TAMANO_ROW_GROUP filas.
+    `tipos` (de tipos_columnas) fija el esquema a partir de la consulta completa;
+    sin ellos se infiere del primer row group. Un valor posterior que no entre
+    en el tipo de su columna corta la exportación con ValueError.
+    """
+    if pa is None:
+        raise RuntimeError('pyarrow no está instalado: formato parquet no disponible')
+
+    salida = _Salida()
+    escritor = None
+    esquema = pa.schema(list(zip(columnas, tipos))) if tipos else None
+
+    for lote in _lotes(filas, TAMANO_ROW_GROUP):
+        por_columna = list(zip(*lote))
+        if esquema is None:
+            esquema = pa.schema([
+                (nombre, _tipo_columna(valores)) for nombre, valores in zip(columnas, por_columna)
+            ])
+        if escritor is None:
+            escritor = pq.ParquetWriter(salida, esquema)
+
+        arreglos = [pa.array(_convertir(valores, campo.type, campo.name), type=campo.type)
+                    for campo, valores in zip(esquema, por_columna)]
+        escritor.write_table(pa.Table.from_arrays(arreglos, schema=esquema))
+        yield salida.vaciar()
+
+    if escritor is None:
+        # Resultado vacío: archivo válido (sin tipos, todas las columnas como texto)
+        esquema = esquema or pa.schema([(nombre, pa.string()) for nombre in columnas])
+        escritor = pq.ParquetWriter(salida, esquema)
+    escritor.close()
+    yield salida.vaciar()
+
+
+GENERADORES = {
+    'csv': generar_csv,
+    'ndjson': generar_ndjson,
+    'parquet': generar_parquet,
+}
+
+
+def generar(formato, columnas, filas, tipos=None):
+    """Generador de bytes del formato pedido (tipos: los de tipos_columnas, solo para parquet)"""
+    if formato == 'parquet':
+        return generar_parquet(columnas, filas, tipos)
+    return GENERADORES[formato](columnas, filas)
@@ -0,0 +1,225 @@
+"""
+Motor de exportación XLSX en streaming
+Escribe la hoja fila por fila directamente dentro del ZIP y entrega los bytes
+comprimidos a medida que se generan: la memoria no crece con el tamaño del
+reporte y el primer byte sale apenas se procesan las primeras filas.
+
+openpyxl (incluso en modo write_only) arma el ZIP completo al guardar, por eso
+aquí se genera el SpreadsheetML mínimo a mano: una hoja, fila de encabezados
+con color y anchos de columna calculados sobre una muestra de filas.
+"""
+import re
+import zipfile
+from itertools import islice, chain
+from xml.sax.saxutils import escape
+
+MIME_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Filas usadas para calcular anchos de columna (y leídas antes del primer byte)
+FILAS_MUESTRA = 200
+ANCHO_MAXIMO = 50
+# Bytes comprimidos acumulados antes de entregarlos a la respuesta
+TAMANO_BLOQUE = 64 * 1024
+# Compresión rápida: el XML de una hoja comprime bien incluso en nivel 1
+NIVEL_COMPRESION = 1
+
+# Caracteres de control no permitidos en XML 1.0
+_CARACTERES_ILEGALES = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    f'<Relationship Id="rId1" Type="{_NS_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+    f'<Relationship Id="rId2" Type="{_NS_REL}/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+
+def _workbook_xml(nombre_hoja):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<workbook xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}">'
+        f'<sheets><sheet name="{escape(nombre_hoja, {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _styles_xml(color_encabezado):
+    """Estilo 0: normal. Estilo 1: encabezado en negrita blanca sobre color, centrado."""
+    color = f'FF{color_encabezado.upper()}'
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<styleSheet xmlns="{_NS_MAIN}">'
+        '<fonts count="2">'
+        '<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+        '<font><b/><sz val="12"/><color rgb="FFFFFFFF"/><name val="Calibri"/><family val="2"/></font>'
+        '</fonts>'
+        '<fills count="3">'
+        '<fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill>'
+        f'<fill><patternFill patternType="solid"><fgColor rgb="{color}"/><bgColor rgb="{color}"/></patternFill></fill>'
+        '</fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1" applyAlignment="1">'
+        '<alignment horizontal="center" vertical="center"/></xf>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    )
+
+
+def letra_columna(numero):
+    """1 -> A, 27 -> AA"""
+    letras = ''
+    while numero:
+        numero, resto = divmod(numero - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _texto(valor):
+    return escape(_CARACTERES_ILEGALES.sub('', valor))
+
+
+def _celda(ref, valor):
+    """XML de una celda: número nativo o texto en línea (None -> celda omitida)"""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return f'<c r="{ref}" t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float)) and valor == valor and valor not in (float('inf'), float('-inf')):
+        return f'<c r="{ref}"><v>{valor!r}</v></c>'
+    if isinstance(valor, bytes):
+        valor = valor.decode('utf-8', errors='replace')
+    elif not isinstance(valor, str):
+        valor = str(valor)
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{_texto(valor)}</t></is></c>'
+
+
+def calcular_anchos(encabezados, muestra, ancho_maximo=ANCHO_MAXIMO):
+    """Ancho de cada columna según el texto más largo del encabezado y la muestra"""
+    anchos = [len(str(h)) for h in encabezados]
+    for fila in muestra:
+        if len(fila) > len(anchos):
+            anchos.extend([0] * (len(fila) - len(anchos)))
+        for i, valor in enumerate(fila):
+            if valor is not None:
+                largo = len(str(valor))
+                if largo > anchos[i]:
+                    anchos[i] = largo
+    return [min(ancho + 2, ancho_maximo) for ancho in anchos]
+
+
+class _Salida:
+    """Destino no posicionable para ZipFile: acumula bytes hasta que el generador los entrega"""
+
+    def __init__(self):
+        self._partes = []
+        self.tamano = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self.tamano += len(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        self.tamano = 0
+        return datos
+
+
+def generar_xlsx(filas, encabezados, nombre_hoja='Hoja1', color_encabezado='4472C4',
+                 anchos=None, filas_muestra=FILAS_MUESTRA):
+    """
+    Generador de bytes de un archivo XLSX.
+
+    filas: iterable de secuencias (p.ej. filas_cursor(cursor)); se recorre una sola vez.
+    anchos: lista de anchos fijos; si es None se calculan con las primeras filas_muestra filas.
+    """
+    filas = iter(filas)
+    muestra = list(islice(filas, filas_muestra))
+    if anchos is None:
+        anchos = calcular_anchos(encabezados, muestra)
+
+    # Las filas pueden traer más columnas que encabezados: se escriben igual
+    num_columnas = max([len(encabezados)] + [len(fila) for fila in muestra])
+    columnas = [letra_columna(i) for i in range(1, num_columnas + 1)]
+    salida = _Salida()
+
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=NIVEL_COMPRESION) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _RELS)
+        zf.writestr('xl/workbook.xml', _workbook_xml(nombre_hoja[:31]))
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        zf.writestr('xl/styles.xml', _styles_xml(color_encabezado))
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w') as hoja:
+            partes = [
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+                f'<worksheet xmlns="{_NS_MAIN}"><cols>'
+            ]
+            for i, ancho in enumerate(anchos, 1):
+                partes.append(f'<col min="{i}" max="{i}" width="{ancho}" customWidth="1"/>')
+            partes.append('</cols><sheetData><row r="1">')
+            for col, encabezado in zip(columnas, encabezados):
+                partes.append(f'<c r="{col}1" s="1" t="inlineStr"><is><t>{_texto(str(encabezado))}</t></is></c>')
+            partes.append('</row>')
+            hoja.write(''.join(partes).encode('utf-8'))
+
+            partes = []
+            for num_fila, fila in enumerate(chain(muestra, filas), 2):
+                partes.append(f'<row r="{num_fila}">')
+                for col, valor in zip(columnas, fila):
+                    partes.append(_celda(f'{col}{num_fila}', valor))
+                partes.append('</row>')
+
+                if len(partes) > 2000:
+                    hoja.write(''.join(partes).encode('utf-8'))
+                    partes = []
+                    if salida.tamano >= TAMANO_BLOQUE:
+                        yield salida.vaciar()
+
+            partes.append('</sheetData></worksheet>')
+            hoja.write(''.join(partes).encode('utf-8'))
+
+    yield salida.vaciar()
+
+
+def filas_cursor(cursor, tamano_lote=500):
+    """Iterar un cursor por lotes con fetchmany (sin cargar todo el resultado)"""
+    while True:
+        lote = cursor.fetchmany(tamano_lote)
+        if not lote:
+            break
+        yield from lote
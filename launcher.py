@@ -8,6 +8,7 @@ import os
 import webbrowser
 import time
 import threading
+import multiprocessing
 import socket
 import sqlite3
 
@@ -115,7 +116,11 @@ def main():
     try:
         print("Cargando aplicacion...")
         from app_web import app
+        import migraciones
         print("✓ Aplicacion lista")
+        
+        # Mantenimiento periódico de estadísticas del planificador (PRAGMA optimize)
+        migraciones.iniciar_mantenimiento()
         print()
         print("Servidor ejecutandose:")
         print(f"  • Esta PC: http://localhost:5000")
@@ -152,4 +157,7 @@ def main():
         sys.exit(1)
 
 if __name__ == '__main__':
+    # Primero que nada: en el ejecutable, los procesos del pool de PDFs en lote
+    # (spawn) arrancan este mismo programa y aquí terminan sin volver a ejecutar main()
+    multiprocessing.freeze_support()
     main()
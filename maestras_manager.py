@@ -1,9 +1,9 @@
-import sqlite3
-import sys
-import os
 from typing import List, Dict, Optional
-from datetime import datetime
 from config import config
+from db_pool import obtener_conexion
+from escritor_db import escritor_db
+from cache_maestras import cache_maestras
+from db_manager import cargar_viaje_por_centro
 
 class MaestrasManager:
     """Clase para manejar las tablas maestras (choferes, administrativos, casinos)"""
@@ -16,17 +16,82 @@ class MaestrasManager:
             self.db_path = db_path
     
     def _get_connection(self):
-        """Obtener conexión optimizada para concurrencia"""
-        conn = sqlite3.connect(
-            self.db_path,
-            timeout=30.0,  # Mayor timeout para esperar en caso de bloqueo
-            check_same_thread=False,
-            isolation_level=None  # Modo autocommit para mejor concurrencia
+        """Obtener conexión del pool compartido (autocommit, WAL)"""
+        return obtener_conexion(self.db_path)
+    
+    def _reactivar(self, cursor, tabla, condicion, parametros, **campos):
+        """
+        Reactivar el registro dado de baja (activo = 0) que cumple `condicion`,
+        actualizando `campos`. Retorna True si había uno.
+        """
+        asignaciones = ''.join(f', {campo} = ?' for campo in campos)
+        cursor.execute(
+            f"UPDATE {tabla} SET activo = 1{asignaciones} WHERE activo = 0 AND {condicion}",
+            tuple(campos.values()) + tuple(parametros)
         )
-        # Habilitar WAL mode para mejor concurrencia
-        conn.execute('PRAGMA journal_mode=WAL')
-        conn.execute('PRAGMA busy_timeout=30000')
-        return conn
+        return cursor.rowcount > 0
+    
+    # Las escrituras pasan por el escritor único (escritor_db.py): cada _funcion
+    # recibe el cursor de su transacción, así la verificación de duplicados y el
+    # INSERT no se intercalan con otra escritura.
+    
+    def _escribir(self, tabla, funcion, *args):
+        """Ejecutar funcion(cursor, *args) en el escritor e invalidar la caché de `tabla` si escribió"""
+        resultado = escritor_db.ejecutar(funcion, *args)
+        if resultado:
+            cache_maestras.invalidar(tabla)
+        return resultado
+    
+    def _crear_casino(self, cursor, codigo_costo, casino, ruta):
+        """Reactivar o insertar el casino. Retorna False si ya existía activo."""
+        # Dado de baja por la sincronización con datos.xlsx: se reactiva
+        if self._reactivar(cursor, 'maestras_casinos', 'codigo_costo = ?', (codigo_costo,), casino=casino, ruta=ruta):
+            return True
+        
+        cursor.execute("SELECT 1 FROM maestras_casinos WHERE codigo_costo = ?", (codigo_costo,))
+        if cursor.fetchone():
+            return False  # Ya existe
+        
+        cursor.execute("""
+            INSERT INTO maestras_casinos (codigo_costo, casino, ruta)
+            VALUES (?, ?, ?)
+        """, (codigo_costo, casino, ruta))
+        return True
+    
+    def _crear_chofer(self, cursor, nombre, celular, rut):
+        """Reactivar o insertar el chofer (por RUT). Retorna False si ya existía activo."""
+        if self._reactivar(cursor, 'maestras_choferes', 'rut = ?', (rut,), nombre=nombre, celular=celular):
+            return True
+        
+        cursor.execute("SELECT id FROM maestras_choferes WHERE rut = ?", (rut,))
+        if cursor.fetchone():
+            return False
+        
+        cursor.execute("""
+            INSERT INTO maestras_choferes (nombre, celular, rut)
+            VALUES (?, ?, ?)
+        """, (nombre, celular, rut))
+        return True
+    
+    def _crear_administrativo(self, cursor, nombre, condicion):
+        """Reactivar o insertar el administrativo que cumple `condicion` (sobre nombre). False si ya existía activo."""
+        if self._reactivar(cursor, 'maestras_administrativos', condicion, (nombre,)):
+            return True
+        
+        cursor.execute(f"SELECT id FROM maestras_administrativos WHERE {condicion}", (nombre,))
+        if cursor.fetchone():
+            return False
+        
+        cursor.execute("""
+            INSERT INTO maestras_administrativos (nombre)
+            VALUES (?)
+        """, (nombre,))
+        return True
+    
+    def _actualizar(self, cursor, sql, parametros):
+        """UPDATE de una maestra. Retorna True si modificó alguna fila."""
+        cursor.execute(sql, parametros)
+        return cursor.rowcount > 0
     
     def buscar_choferes_por_nombre(self, nombre: str) -> List[Dict]:
         """Buscar choferes por nombre (búsqueda parcial, insensible a mayúsculas)"""
@@ -37,7 +102,7 @@ class MaestrasManager:
         query = """
         SELECT id, nombre, celular, rut 
         FROM maestras_choferes 
-        WHERE UPPER(nombre) LIKE UPPER(?)
+        WHERE activo = 1 AND UPPER(nombre) LIKE UPPER(?)
         ORDER BY nombre
         LIMIT 10
         """
@@ -65,7 +130,7 @@ class MaestrasManager:
         query = """
         SELECT id, nombre 
         FROM maestras_administrativos 
-        WHERE UPPER(nombre) LIKE UPPER(?)
+        WHERE activo = 1 AND UPPER(nombre) LIKE UPPER(?)
         ORDER BY nombre
         LIMIT 10
         """
@@ -91,7 +156,7 @@ class MaestrasManager:
         query = """
         SELECT codigo_costo, casino, ruta
         FROM maestras_casinos 
-        WHERE codigo_costo = ?
+        WHERE codigo_costo = ? AND activo = 1
         """
         
         cursor.execute(query, (codigo,))
@@ -115,6 +180,7 @@ class MaestrasManager:
         query = """
         SELECT id, codigo_costo, casino, ruta 
         FROM maestras_casinos 
+        WHERE activo = 1
         ORDER BY casino ASC
         """
         
@@ -134,79 +200,26 @@ class MaestrasManager:
     
     def agregar_casino_si_no_existe(self, codigo_costo: int, casino: str, ruta: str) -> bool:
         """Agregar casino si no existe (basado en código de costo)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Verificar si ya existe
-            cursor.execute("SELECT 1 FROM maestras_casinos WHERE codigo_costo = ?", (codigo_costo,))
-            if cursor.fetchone():
-                conn.close()
-                return False  # Ya existe
-            
-            # Agregar nuevo casino
-            cursor.execute("""
-                INSERT INTO maestras_casinos (codigo_costo, casino, ruta)
-                VALUES (?, ?, ?)
-            """, (codigo_costo, casino, ruta))
-            
-            conn.commit()
-            conn.close()
-            return True  # Se agregó con éxito
-            
+            return self._escribir('maestras_casinos', self._crear_casino, codigo_costo, casino, ruta)
         except Exception as e:
-            conn.close()
             print(f"Error al agregar casino: {e}")
             return False
     
     def agregar_chofer_si_no_existe(self, nombre: str, telefono: str, rut: str) -> bool:
         """Agregar chofer si no existe (basado en RUT)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si ya existe
-        cursor.execute("SELECT id FROM maestras_choferes WHERE rut = ?", (rut,))
-        if cursor.fetchone():
-            conn.close()
-            return False  # Ya existe
-        
-        # Agregar nuevo chofer
-        cursor.execute("""
-        INSERT INTO maestras_choferes (nombre, celular, rut)
-        VALUES (?, ?, ?)
-        """, (nombre, telefono, rut))
-        
-        conn.commit()
-        conn.close()
-        return True  # Agregado exitosamente
+        return self._escribir('maestras_choferes', self._crear_chofer, nombre, telefono, rut)
     
     def agregar_administrativo_si_no_existe(self, nombre: str) -> bool:
         """Agregar administrativo si no existe (basado en nombre)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si ya existe
-        cursor.execute("SELECT id FROM maestras_administrativos WHERE UPPER(nombre) = UPPER(?)", (nombre,))
-        if cursor.fetchone():
-            conn.close()
-            return False  # Ya existe
-        
-        # Agregar nuevo administrativo
-        cursor.execute("""
-        INSERT INTO maestras_administrativos (nombre)
-        VALUES (?)
-        """, (nombre,))
-        
-        conn.commit()
-        conn.close()
-        return True  # Agregado exitosamente
+        return self._escribir('maestras_administrativos', self._crear_administrativo, nombre, 'UPPER(nombre) = UPPER(?)')
     
     def obtener_todos_los_choferes(self) -> List[Dict]:
         """Obtener todos los choferes"""
         conn = self._get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id, nombre, celular, rut FROM maestras_choferes ORDER BY nombre")
+        cursor.execute("SELECT id, nombre, celular, rut FROM maestras_choferes WHERE activo = 1 ORDER BY nombre")
         results = cursor.fetchall()
         
         choferes = []
@@ -229,6 +242,7 @@ class MaestrasManager:
         cursor.execute("""
             SELECT id, codigo_costo, casino, ruta 
             FROM maestras_casinos 
+            WHERE activo = 1
             ORDER BY codigo_costo ASC
         """)
         results = cursor.fetchall()
@@ -250,7 +264,7 @@ class MaestrasManager:
         conn = self._get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id, nombre FROM maestras_administrativos ORDER BY nombre")
+        cursor.execute("SELECT id, nombre FROM maestras_administrativos WHERE activo = 1 ORDER BY nombre")
         results = cursor.fetchall()
         
         administrativos = []
@@ -266,23 +280,7 @@ class MaestrasManager:
     def crear_centro_costo(self, codigo_costo: str, casino: str, ruta: str = "") -> bool:
         """Crear un nuevo centro de costo en maestras_casinos"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Verificar si ya existe
-            cursor.execute("SELECT id FROM maestras_casinos WHERE codigo_costo = ?", (codigo_costo,))
-            if cursor.fetchone():
-                conn.close()
-                return False
-            
-            cursor.execute("""
-                INSERT INTO maestras_casinos (codigo_costo, casino, ruta)
-                VALUES (?, ?, ?)
-            """, (codigo_costo, casino, ruta))
-            
-            conn.commit()
-            conn.close()
-            return True
+            return self._escribir('maestras_casinos', self._crear_casino, codigo_costo, casino, ruta)
         except Exception as e:
             print(f"Error creando centro de costo: {e}")
             return False
@@ -290,23 +288,7 @@ class MaestrasManager:
     def crear_chofer(self, nombre: str, rut: str, celular: str = "") -> bool:
         """Crear un nuevo chofer en maestras_choferes"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Verificar si ya existe
-            cursor.execute("SELECT id FROM maestras_choferes WHERE rut = ?", (rut,))
-            if cursor.fetchone():
-                conn.close()
-                return False
-            
-            cursor.execute("""
-                INSERT INTO maestras_choferes (nombre, celular, rut)
-                VALUES (?, ?, ?)
-            """, (nombre, celular, rut))
-            
-            conn.commit()
-            conn.close()
-            return True
+            return self._escribir('maestras_choferes', self._crear_chofer, nombre, celular, rut)
         except Exception as e:
             print(f"Error creando chofer: {e}")
             return False
@@ -314,23 +296,7 @@ class MaestrasManager:
     def crear_administrativo(self, nombre: str) -> bool:
         """Crear un nuevo administrativo en maestras_administrativos"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Verificar si ya existe
-            cursor.execute("SELECT id FROM maestras_administrativos WHERE nombre = ?", (nombre,))
-            if cursor.fetchone():
-                conn.close()
-                return False
-            
-            cursor.execute("""
-                INSERT INTO maestras_administrativos (nombre)
-                VALUES (?)
-            """, (nombre,))
-            
-            conn.commit()
-            conn.close()
-            return True
+            return self._escribir('maestras_administrativos', self._crear_administrativo, nombre, 'nombre = ?')
         except Exception as e:
             print(f"Error creando administrativo: {e}")
             return False
@@ -340,7 +306,7 @@ class MaestrasManager:
         conn = self._get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT nombre FROM maestras_administrativos ORDER BY nombre")
+        cursor.execute("SELECT nombre FROM maestras_administrativos WHERE activo = 1 ORDER BY nombre")
         results = cursor.fetchall()
         
         nombres = [row[0] for row in results]
@@ -351,61 +317,43 @@ class MaestrasManager:
     # ========== MÉTODOS DE ACTUALIZACIÓN ==========
     def actualizar_casino(self, casino_id: int, codigo_costo: int, casino: str, ruta: str) -> bool:
         """Actualizar un casino existente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
+            escritor_db.ejecutar(self._actualizar, """
                 UPDATE maestras_casinos 
                 SET codigo_costo = ?, casino = ?, ruta = ?
                 WHERE id = ?
             """, (codigo_costo, casino, ruta, casino_id))
-            
-            conn.commit()
-            conn.close()
+            cache_maestras.invalidar('maestras_casinos')
             return True
         except Exception as e:
-            conn.close()
             print(f"Error al actualizar casino: {e}")
             return False
     
     def actualizar_chofer(self, chofer_id: int, nombre: str, telefono: str, rut: str) -> bool:
         """Actualizar un chofer existente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
+            escritor_db.ejecutar(self._actualizar, """
                 UPDATE maestras_choferes 
                 SET nombre = ?, celular = ?, rut = ?
                 WHERE id = ?
             """, (nombre, telefono, rut, chofer_id))
-            
-            conn.commit()
-            conn.close()
+            cache_maestras.invalidar('maestras_choferes')
             return True
         except Exception as e:
-            conn.close()
             print(f"Error al actualizar chofer: {e}")
             return False
     
     def actualizar_administrativo(self, admin_id: int, nombre: str) -> bool:
         """Actualizar un administrativo existente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
+            escritor_db.ejecutar(self._actualizar, """
                 UPDATE maestras_administrativos 
                 SET nombre = ?
                 WHERE id = ?
             """, (nombre, admin_id))
-            
-            conn.commit()
-            conn.close()
+            cache_maestras.invalidar('maestras_administrativos')
             return True
         except Exception as e:
-            conn.close()
             print(f"Error al actualizar administrativo: {e}")
             return False
     
@@ -413,64 +361,37 @@ class MaestrasManager:
     
     def actualizar_centro_costo_por_codigo(self, codigo_costo: str, casino: str, ruta: str = "") -> bool:
         """Actualizar un centro de costo por su código"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
+            return self._escribir('maestras_casinos', self._actualizar, """
                 UPDATE maestras_casinos 
                 SET casino = ?, ruta = ?
                 WHERE codigo_costo = ?
             """, (casino, ruta, codigo_costo))
-            
-            conn.commit()
-            success = cursor.rowcount > 0
-            conn.close()
-            return success
         except Exception as e:
-            conn.close()
             print(f"Error al actualizar centro de costo: {e}")
             return False
     
     def actualizar_chofer_por_nombre(self, nombre: str, rut: str, celular: str = "") -> bool:
         """Actualizar un chofer por su nombre"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
+            return self._escribir('maestras_choferes', self._actualizar, """
                 UPDATE maestras_choferes 
                 SET rut = ?, celular = ?
                 WHERE nombre = ?
             """, (rut, celular, nombre))
-            
-            conn.commit()
-            success = cursor.rowcount > 0
-            conn.close()
-            return success
         except Exception as e:
-            conn.close()
             print(f"Error al actualizar chofer: {e}")
             return False
     
     def actualizar_administrativo_por_nombre(self, nombre_original: str, nombre_nuevo: str) -> bool:
         """Actualizar un administrativo por su nombre"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
+            return self._escribir('maestras_administrativos', self._actualizar, """
                 UPDATE maestras_administrativos 
                 SET nombre = ?
                 WHERE nombre = ?
             """, (nombre_nuevo, nombre_original))
-            
-            conn.commit()
-            success = cursor.rowcount > 0
-            conn.close()
-            return success
         except Exception as e:
-            conn.close()
             print(f"Error al actualizar administrativo: {e}")
             return False
     
@@ -483,7 +404,7 @@ class MaestrasManager:
             cursor.execute("""
                 SELECT nombre, rut, celular
                 FROM maestras_choferes
-                WHERE nombre = ?
+                WHERE nombre = ? AND activo = 1
             """, (nombre,))
             
             row = cursor.fetchone()
@@ -678,46 +599,17 @@ class MaestrasManager:
     def obtener_viaje_completo_por_numero_y_centro(self, numero_viaje: str, centro_costo: str) -> Dict:
         """Obtener todos los datos de un viaje específico por número y centro de costo"""
         conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Obtener datos del viaje
-        query_viaje = """
-        SELECT * FROM viajes 
-        WHERE numero_viaje = ? AND costo_codigo = ?
-        ORDER BY id DESC
-        LIMIT 1
-        """
-        cursor.execute(query_viaje, (numero_viaje, centro_costo))
-        viaje_result = cursor.fetchone()
-        
-        if not viaje_result:
+        try:
+            # Viaje y comidas en dos consultas (columnas desde cursor.description)
+            por_centro = cargar_viaje_por_centro(conn, numero_viaje, centro_costo)
+        finally:
             conn.close()
-            return {}
-            
-        # Obtener nombres de las columnas de viajes
-        cursor.execute("PRAGMA table_info(viajes)")
-        viaje_columns = [row[1] for row in cursor.fetchall()]
-        viaje_data = dict(zip(viaje_columns, viaje_result))
-        
-        # Obtener comidas asociadas
-        query_comidas = """
-        SELECT * FROM comidas_preparadas 
-        WHERE numero_viaje = ? AND numero_centro_costo = ?
-        ORDER BY id
-        """
-        cursor.execute(query_comidas, (numero_viaje, centro_costo))
-        comidas_results = cursor.fetchall()
-        
-        comidas = []
-        if comidas_results:
-            cursor.execute("PRAGMA table_info(comidas_preparadas)")
-            comidas_columns = [row[1] for row in cursor.fetchall()]
-            for comida_row in comidas_results:
-                comidas.append(dict(zip(comidas_columns, comida_row)))
         
-        conn.close()
+        datos = next(iter(por_centro.values()), None)
+        if not datos:
+            return {}
         
         return {
-            'viaje_data': viaje_data,
-            'comidas': comidas
+            'viaje_data': datos['viaje'],
+            'comidas': datos['comidas']
         }
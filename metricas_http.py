@@ -0,0 +1,250 @@
+"""
+Métricas de rendimiento por ruta del servidor web
+Un before_request / after_request / teardown_request registra por cada
+(ruta, método): histograma de latencia, histograma de tiempo de SQL,
+consultas y filas leídas (cursores medidos de db_pool), bytes de respuesta,
+requests por código de estado y cuántos requests hay en curso.
+
+Se exponen en formato Prometheus (GET /metrics) y en /admin/metricas.
+
+La ruta es la regla de Flask (/api/viaje/<numero_viaje>), no la URL, para que
+la cantidad de series no crezca con los parámetros. La latencia se mide hasta
+que la vista retorna: en respuestas transmitidas (Excel en streaming) no
+incluye el envío del cuerpo, pero los bytes sí se cuentan al terminar.
+"""
+import bisect
+import threading
+import time
+from flask import g, request
+from db_pool import MedicionSQL, medicion_sql
+
+# Límites (segundos) de los buckets de los histogramas; el último bucket es +Inf
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Requests a rutas que no existen (404, escáneres) se agrupan en una sola serie
+RUTA_DESCONOCIDA = 'sin_ruta'
+
+
+def _escapar(valor):
+    """Valor de etiqueta en formato de texto de Prometheus"""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Histograma:
+    """Histograma acumulativo con buckets fijos (conteos por bucket, suma, cantidad y máximo)"""
+    __slots__ = ('buckets', 'conteos', 'suma', 'cantidad', 'maximo')
+
+    def __init__(self, buckets=BUCKETS_SEGUNDOS):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+        self.cantidad = 0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        self.conteos[bisect.bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+        self.cantidad += 1
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def cuantil(self, q):
+        """
+        Estimación por interpolación lineal dentro del bucket (como histogram_quantile),
+        acotada al máximo observado
+        """
+        if not self.cantidad:
+            return 0.0
+        objetivo = q * self.cantidad
+        acumulado = 0
+        for i, conteo in enumerate(self.conteos):
+            if acumulado + conteo >= objetivo and conteo:
+                if i == len(self.buckets):
+                    return self.maximo
+                inferior = self.buckets[i - 1] if i else 0.0
+                return min(self.maximo, inferior + (self.buckets[i] - inferior) * (objetivo - acumulado) / conteo)
+            acumulado += conteo
+        return self.maximo
+
+
+class MetricasRuta:
+    """Acumuladores de una (ruta, método)"""
+    __slots__ = ('duracion', 'sql', 'estados', 'consultas', 'filas', 'bytes')
+
+    def __init__(self):
+        self.duracion = Histograma()
+        self.sql = Histograma()
+        self.estados = {}
+        self.consultas = 0
+        self.filas = 0
+        self.bytes = 0
+
+
+class MetricasHTTP:
+    """Métricas de todos los requests del servidor (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rutas = {}
+        self._en_curso = 0
+        self._en_curso_max = 0
+        self._inicio = time.time()
+
+    # ========== HOOKS DE FLASK ==========
+
+    def instalar(self, app):
+        """Registrar los hooks en la aplicación"""
+        app.before_request(self._antes)
+        app.after_request(self._despues)
+        app.teardown_request(self._al_terminar)
+
+    def _antes(self):
+        medicion = MedicionSQL()
+        medicion_sql.set(medicion)
+        g.metricas = {'inicio': time.perf_counter(), 'medicion': medicion, 'estado': None, 'bytes': 0}
+        with self._lock:
+            self._en_curso += 1
+            if self._en_curso > self._en_curso_max:
+                self._en_curso_max = self._en_curso
+
+    def _despues(self, respuesta):
+        metricas = g.get('metricas')
+        if metricas is None:
+            return respuesta
+        metricas['estado'] = respuesta.status_code
+        if respuesta.content_length is not None:
+            metricas['bytes'] = respuesta.content_length
+        elif respuesta.is_streamed and not respuesta.direct_passthrough:
+            # Cuerpo generado de a partes: contar los bytes a medida que se envían
+            respuesta.response = self._contar_bytes(respuesta.response, self._clave())
+        return respuesta
+
+    def _al_terminar(self, error=None):
+        metricas = g.pop('metricas', None)
+        medicion_sql.set(None)
+        if metricas is None:
+            return
+        duracion = time.perf_counter() - metricas['inicio']
+        estado = metricas['estado'] or 500
+        medicion = metricas['medicion']
+        with self._lock:
+            self._en_curso -= 1
+            ruta = self._obtener(self._clave())
+            ruta.duracion.observar(duracion)
+            ruta.sql.observar(medicion.segundos)
+            ruta.estados[estado] = ruta.estados.get(estado, 0) + 1
+            ruta.consultas += medicion.consultas
+            ruta.filas += medicion.filas
+            ruta.bytes += metricas['bytes']
+
+    def _clave(self):
+        regla = request.url_rule
+        return (regla.rule if regla is not None else RUTA_DESCONOCIDA, request.method)
+
+    def _obtener(self, clave):
+        ruta = self._rutas.get(clave)
+        if ruta is None:
+            ruta = self._rutas[clave] = MetricasRuta()
+        return ruta
+
+    def _contar_bytes(self, partes, clave):
+        total = 0
+        try:
+            for parte in partes:
+                total += len(parte.encode('utf-8') if isinstance(parte, str) else parte)
+                yield parte
+        finally:
+            with self._lock:
+                self._obtener(clave).bytes += total
+
+    # ========== LECTURA ==========
+
+    def resumen(self):
+        """Una fila por (ruta, método), de la que más tiempo total consume a la que menos"""
+        with self._lock:
+            filas = []
+            for (ruta, metodo), m in self._rutas.items():
+                cantidad = m.duracion.cantidad
+                filas.append({
+                    'ruta': ruta,
+                    'metodo': metodo,
+                    'requests': cantidad,
+                    'errores': sum(n for estado, n in m.estados.items() if estado >= 500),
+                    'total_s': round(m.duracion.suma, 3),
+                    'promedio_ms': round(m.duracion.suma / cantidad * 1000, 1) if cantidad else 0,
+                    'p50_ms': round(m.duracion.cuantil(0.50) * 1000, 1),
+                    'p95_ms': round(m.duracion.cuantil(0.95) * 1000, 1),
+                    'p99_ms': round(m.duracion.cuantil(0.99) * 1000, 1),
+                    'sql_promedio_ms': round(m.sql.suma / cantidad * 1000, 1) if cantidad else 0,
+                    'sql_porcentaje': round(m.sql.suma / m.duracion.suma * 100, 1) if m.duracion.suma else 0,
+                    'consultas_promedio': round(m.consultas / cantidad, 1) if cantidad else 0,
+                    'filas_promedio': round(m.filas / cantidad, 1) if cantidad else 0,
+                    'kb_promedio': round(m.bytes / cantidad / 1024, 1) if cantidad else 0
+                })
+            return {
+                'en_curso': self._en_curso,
+                'en_curso_max': self._en_curso_max,
+                'desde': self._inicio,
+                'rutas': sorted(filas, key=lambda f: f['total_s'], reverse=True)
+            }
+
+    def prometheus(self, extras=()):
+        """
+        Texto en formato de exposición de Prometheus.
+        extras: tuplas (nombre, tipo, ayuda, valor) con métricas de otros componentes.
+        """
+        lineas = []
+
+        def encabezado(nombre, tipo, ayuda):
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+
+        def histograma(nombre, ayuda, obtener):
+            encabezado(nombre, 'histogram', ayuda)
+            for (ruta, metodo), m in rutas:
+                h = obtener(m)
+                etiquetas = f'ruta="{_escapar(ruta)}",metodo="{metodo}"'
+                acumulado = 0
+                for limite, conteo in zip(h.buckets + ('+Inf',), h.conteos):
+                    acumulado += conteo
+                    lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+                lineas.append(f'{nombre}_sum{{{etiquetas}}} {_numero(h.suma)}')
+                lineas.append(f'{nombre}_count{{{etiquetas}}} {h.cantidad}')
+
+        def contador(nombre, ayuda, obtener):
+            encabezado(nombre, 'counter', ayuda)
+            for (ruta, metodo), m in rutas:
+                lineas.append(f'{nombre}{{ruta="{_escapar(ruta)}",metodo="{metodo}"}} {obtener(m)}')
+
+        with self._lock:
+            rutas = sorted(self._rutas.items())
+            histograma('aratrack_http_duracion_segundos', 'Latencia de los requests por ruta', lambda m: m.duracion)
+            histograma('aratrack_http_sql_segundos', 'Tiempo de SQL por request (incluye esperas del escritor)',
+                       lambda m: m.sql)
+
+            encabezado('aratrack_http_requests_total', 'counter', 'Requests por ruta y código de estado')
+            for (ruta, metodo), m in rutas:
+                for estado, n in sorted(m.estados.items()):
+                    lineas.append(f'aratrack_http_requests_total{{ruta="{_escapar(ruta)}",metodo="{metodo}",'
+                                  f'estado="{estado}"}} {n}')
+
+            contador('aratrack_http_sql_consultas_total', 'Consultas SQL ejecutadas', lambda m: m.consultas)
+            contador('aratrack_http_filas_total', 'Filas leídas de SQLite', lambda m: m.filas)
+            contador('aratrack_http_respuesta_bytes_total', 'Bytes de respuesta enviados', lambda m: m.bytes)
+
+            encabezado('aratrack_http_en_curso', 'gauge', 'Requests en curso')
+            lineas.append(f'aratrack_http_en_curso {self._en_curso}')
+
+        for nombre, tipo, ayuda, valor in extras:
+            encabezado(nombre, tipo, ayuda)
+            lineas.append(f'{nombre} {_numero(valor)}')
+
+        return '\n'.join(lineas) + '\n'
+
+
+# Instancia global: una por proceso del servidor
+metricas_http = MetricasHTTP()
@@ -0,0 +1,277 @@
+"""
+Migraciones versionadas del esquema de viajes.db
+Crea y mantiene los índices de las consultas calientes (dashboard, reportes,
+joins viajes <-> comidas_preparadas) y programa ANALYZE / PRAGMA optimize.
+
+Uso:
+    python migraciones.py              -> aplica migraciones pendientes
+    python migraciones.py --verificar  -> aplica y verifica los planes con EXPLAIN QUERY PLAN
+"""
+import sys
+import threading
+from datetime import datetime
+from config import config
+from db_pool import obtener_conexion
+import rollup_diario
+import cola_trabajos
+import cache_pdf
+import cache_maestras
+
+# Cada migración: (versión, descripción, [sentencias SQL])
+# Nunca modificar una migración ya publicada: agregar una nueva con versión mayor.
+MIGRACIONES = [
+    (1, 'Índices para filtros por fecha y agrupaciones del dashboard', [
+        # Cubre tendencia, por_administrativo y top_casinos sin tocar la tabla
+        '''CREATE INDEX IF NOT EXISTS idx_viajes_fecha_admin_casino
+           ON viajes(fecha, administrativo_responsable, casino, numero_viaje)''',
+        # Dashboard filtrado por administrativo
+        '''CREATE INDEX IF NOT EXISTS idx_viajes_admin_fecha
+           ON viajes(administrativo_responsable, fecha)''',
+    ]),
+    (2, 'Índice para el join comidas_preparadas -> viajes', [
+        '''CREATE INDEX IF NOT EXISTS idx_comidas_viaje_centro
+           ON comidas_preparadas(numero_viaje, numero_centro_costo)''',
+    ]),
+    (3, 'Índice para el listado de patentes del formulario de nuevo viaje', [
+        '''CREATE INDEX IF NOT EXISTS idx_viajes_patente_camion
+           ON viajes(patente_camion)''',
+    ]),
+    (4, 'Rollup diario de viajes (tabla + triggers de mantenimiento)', rollup_diario.SENTENCIAS_MIGRACION),
+    (5, 'Tabla jobs de la cola de trabajos en segundo plano', [
+        cola_trabajos.SQL_CREAR_TABLA,
+        cola_trabajos.SQL_CREAR_INDICE,
+    ]),
+    (6, 'Manifiesto de la caché de PDFs', [
+        cache_pdf.SQL_CREAR_TABLA,
+        cache_pdf.SQL_CREAR_INDICE,
+    ]),
+    (7, 'Baja lógica en maestras (sincronización incremental con datos.xlsx)', [
+        'ALTER TABLE maestras_casinos ADD COLUMN activo INTEGER NOT NULL DEFAULT 1',
+        'ALTER TABLE maestras_choferes ADD COLUMN activo INTEGER NOT NULL DEFAULT 1',
+        'ALTER TABLE maestras_administrativos ADD COLUMN activo INTEGER NOT NULL DEFAULT 1',
+    ]),
+    (8, 'Viajes por día y administrativo (viajes distintos del dashboard semanal/mensual)',
+     rollup_diario.SENTENCIAS_MIGRACION_NUMEROS),
+    (9, 'Versión de maestras compartida entre procesos (caché de maestras)', [
+        cache_maestras.SQL_CREAR_TABLA,
+        cache_maestras.SQL_INICIAR_VERSIONES,
+    ]),
+    (10, 'Tabla intermedia de la carga de rendiciones desde Excel', [
+        '''CREATE TABLE IF NOT EXISTS rendiciones_carga (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               carga TEXT NOT NULL,
+               nro_viaje INTEGER NOT NULL,
+               pdt TEXT,
+               ruta TEXT,
+               fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )''',
+        '''CREATE INDEX IF NOT EXISTS idx_rendiciones_carga_carga
+           ON rendiciones_carga(carga, id)''',
+    ]),
+]
+
+# Consultas calientes y el índice que deben usar (verificado con EXPLAIN QUERY PLAN)
+CONSULTAS_VERIFICADAS = [
+    (
+        'Dashboard: tendencia por período',
+        '''SELECT strftime('%Y-%m-%d', fecha) as periodo, COUNT(*), COUNT(DISTINCT numero_viaje)
+           FROM viajes WHERE fecha BETWEEN ? AND ? GROUP BY periodo''',
+        ('2025-01-01', '2025-12-31'),
+        'idx_viajes_fecha_admin_casino'
+    ),
+    (
+        'Dashboard: top casinos',
+        '''SELECT COALESCE(casino, 'Sin especificar'), COUNT(*) as total
+           FROM viajes WHERE fecha BETWEEN ? AND ? GROUP BY casino ORDER BY total DESC LIMIT 10''',
+        ('2025-01-01', '2025-12-31'),
+        'idx_viajes_fecha_admin_casino'
+    ),
+    (
+        'Dashboard: filtro por administrativo',
+        '''SELECT COUNT(*) FROM viajes
+           WHERE fecha BETWEEN ? AND ? AND administrativo_responsable = ?''',
+        ('2025-01-01', '2025-12-31', 'ADMIN'),
+        'idx_viajes_admin_fecha'
+    ),
+    (
+        'Reporte comidas e implementos (join)',
+        '''SELECT v.fecha, c.descripcion FROM comidas_preparadas c
+           INNER JOIN viajes v ON c.numero_viaje = v.numero_viaje AND c.numero_centro_costo = v.costo_codigo
+           WHERE v.fecha BETWEEN ? AND ?''',
+        ('2025-01-01', '2025-12-31'),
+        'idx_comidas_viaje_centro'
+    ),
+    (
+        'Comidas de un viaje y centro de costo',
+        '''SELECT * FROM comidas_preparadas WHERE numero_viaje = ? AND numero_centro_costo = ? ORDER BY id''',
+        ('100', '100'),
+        'idx_comidas_viaje_centro'
+    ),
+    (
+        'Patentes del formulario nuevo viaje',
+        '''SELECT DISTINCT patente_camion FROM viajes WHERE patente_camion IS NOT NULL ORDER BY patente_camion''',
+        (),
+        'idx_viajes_patente_camion'
+    ),
+    (
+        'Dashboard semanal/mensual: rollup diario',
+        '''SELECT strftime('%Y-%m', fecha) as periodo, SUM(bitacoras)
+           FROM viajes_rollup_diario WHERE fecha BETWEEN ? AND ? GROUP BY periodo''',
+        ('2025-01-01', '2025-12-31'),
+        'idx_rollup_fecha_admin_casino'
+    ),
+    (
+        'Dashboard semanal/mensual: viajes distintos',
+        '''SELECT strftime('%Y-%m', fecha) as periodo, COUNT(DISTINCT numero_viaje)
+           FROM viajes_rollup_numeros WHERE fecha BETWEEN ? AND ? GROUP BY periodo''',
+        ('2025-01-01', '2025-12-31'),
+        'idx_rollup_numeros_fecha_admin'
+    ),
+]
+
+# Intervalo del mantenimiento de estadísticas (6 horas)
+INTERVALO_MANTENIMIENTO = 6 * 60 * 60
+
+_hilo_mantenimiento = None
+_detener = threading.Event()
+
+
+def _asegurar_tabla_versiones(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def version_actual(db_path=None):
+    """Retorna la versión de esquema aplicada (0 si no hay migraciones)"""
+    conn = obtener_conexion(db_path or config.get_db_path())
+    try:
+        _asegurar_tabla_versiones(conn)
+        row = conn.execute('SELECT MAX(version) FROM schema_migraciones').fetchone()
+        return row[0] or 0
+    finally:
+        conn.close()
+
+
+def aplicar_migraciones(db_path=None):
+    """
+    Aplica en orden las migraciones pendientes, cada una en su propia transacción.
+    Retorna la lista de versiones aplicadas.
+    """
+    conn = obtener_conexion(db_path or config.get_db_path())
+    aplicadas = []
+    try:
+        _asegurar_tabla_versiones(conn)
+        actual = conn.execute('SELECT MAX(version) FROM schema_migraciones').fetchone()[0] or 0
+
+        for version, descripcion, sentencias in MIGRACIONES:
+            if version <= actual:
+                continue
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for sql in sentencias:
+                    conn.execute(sql)
+                conn.execute(
+                    'INSERT INTO schema_migraciones (version, descripcion) VALUES (?, ?)',
+                    (version, descripcion)
+                )
+                conn.execute('COMMIT')
+                aplicadas.append(version)
+                print(f"[Migraciones] v{version} aplicada: {descripcion}")
+            except Exception as e:
+                conn.execute('ROLLBACK')
+                print(f"[Migraciones] Error en v{version} ({descripcion}): {e}")
+                break
+
+        if aplicadas:
+            # Estadísticas frescas para que el planificador elija los índices nuevos
+            conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return aplicadas
+
+
+def verificar_indices(db_path=None):
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre las consultas calientes y verifica que usen su índice.
+    Retorna lista de dicts: consulta, indice, usa_indice, plan
+    """
+    conn = obtener_conexion(db_path or config.get_db_path())
+    resultados = []
+    try:
+        for nombre, sql, params, indice in CONSULTAS_VERIFICADAS:
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+            resultados.append({
+                'consulta': nombre,
+                'indice': indice,
+                'usa_indice': any(indice in paso for paso in plan),
+                'plan': plan
+            })
+    finally:
+        conn.close()
+    return resultados
+
+
+def optimizar(db_path=None):
+    """Actualizar estadísticas del planificador (barato si nada cambió)"""
+    conn = obtener_conexion(db_path or config.get_db_path())
+    try:
+        # Limitar el muestreo para que no bloquee en tablas grandes
+        conn.execute('PRAGMA analysis_limit=1000')
+        conn.execute('PRAGMA optimize')
+        ahora = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        print(f"[Migraciones] PRAGMA optimize ejecutado: {ahora}")
+    except Exception as e:
+        print(f"[Migraciones] Error en PRAGMA optimize: {e}")
+    finally:
+        conn.close()
+
+
+def _loop_mantenimiento():
+    """Bucle del hilo: PRAGMA optimize cada INTERVALO_MANTENIMIENTO segundos."""
+    while not _detener.wait(timeout=INTERVALO_MANTENIMIENTO):
+        optimizar()
+
+
+def iniciar_mantenimiento():
+    """Inicia el hilo de mantenimiento de estadísticas en segundo plano (una sola vez por proceso)."""
+    global _hilo_mantenimiento
+    if _hilo_mantenimiento is not None and _hilo_mantenimiento.is_alive():
+        return
+    _detener.clear()
+    _hilo_mantenimiento = threading.Thread(target=_loop_mantenimiento, daemon=True, name="MantenimientoBD")
+    _hilo_mantenimiento.start()
+    print("[Migraciones] Mantenimiento de estadísticas programado cada "
+          f"{INTERVALO_MANTENIMIENTO // 3600} horas")
+
+
+def detener_mantenimiento():
+    """Detiene el hilo de mantenimiento."""
+    _detener.set()
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("MIGRACIONES DE ESQUEMA - viajes.db")
+    print("=" * 60)
+
+    aplicadas = aplicar_migraciones()
+    print(f"\nVersión de esquema: {version_actual()}")
+    if not aplicadas:
+        print("No había migraciones pendientes")
+
+    if '--verificar' in sys.argv:
+        print("\nVerificando planes de ejecución...")
+        fallos = 0
+        for r in verificar_indices():
+            estado = "[OK]" if r['usa_indice'] else "[X] "
+            print(f"  {estado} {r['consulta']} -> {r['indice']}")
+            if not r['usa_indice']:
+                fallos += 1
+                for paso in r['plan']:
+                    print(f"        {paso}")
+        sys.exit(1 if fallos else 0)
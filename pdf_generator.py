@@ -7,11 +7,190 @@ from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, PageBreak, Spacer
 from reportlab.lib.units import inch, mm
 from reportlab.lib import colors
+from reportlab import rl_config
 import io
 import os
 import sys
+import time
+import threading
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from db_manager import DBManager
+from cache_pdf import CachePDF, calcular_huella
+
+# Incrementar al cambiar el diseño de la planilla: invalida todos los PDFs cacheados
+VERSION_PLANTILLA = 1
+
+# Opcional: lotes en un solo PDF (formato 'pdf'); sin pypdf solo se ofrece 'zip'
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
+# Los PDFs se escriben como binario: sin la codificación ASCII85 de los streams
+# (pensada para canales de 7 bits) el dibujo es más rápido y el archivo más chico
+rl_config.useA85 = 0
+
+# ========== PLANTILLA PRECOMPILADA ==========
+# Las partes fijas de la "PLANILLA CONTROL DESPACHO" (estilos, anchos y altos)
+# se arman una vez por proceso; cada página solo completa los datos de las celdas.
+# Anchos y altos como tuplas: Table no puede modificarlos entre una página y otra.
+
+GRIS_OSCURO = colors.HexColor('#808080')
+GRIS_CLARO = colors.HexColor('#D0D0D0')
+
+ANCHOS_ENCABEZADO = (5*inch, 0.8*inch, 1.7*inch)
+ANCHOS_INFO = (1.1*inch, 3.7*inch, 0.9*inch, 1.8*inch)
+ALTOS_INFO = (0.25*inch,) + (0.18*inch,)*7
+ANCHOS_SEIS_COLUMNAS = (1.25*inch,) * 6
+ALTOS_ACTIVOS = (0.30*inch,)*5
+ANCHOS_CHECKS = (0.55*inch, 0.22*inch, 0.55*inch, 0.22*inch, 0.55*inch, 0.22*inch, 0.6*inch, 0.22*inch, 0.45*inch, 0.22*inch, 0.5*inch, 0.22*inch, 0.75*inch, 0.22*inch, 0.7*inch, 0.22*inch, 0.9*inch, 0.22*inch)
+ALTOS_CHECKS = (0.3*inch,)
+ANCHOS_TITULO = (7.5*inch,)
+ANCHOS_GUIAS = (1.07*inch,) * 7
+ANCHOS_COMIDAS = (1.2*inch, 1.6*inch, 3.5*inch, 0.6*inch, 0.6*inch)
+ALTO_FILA_COMIDAS = 0.18*inch
+ANCHOS_FIRMAS = (1.875*inch,) * 4
+ALTOS_FIRMAS = (0.2*inch,)
+
+ESTILO_ENCABEZADO = TableStyle([
+    ('BACKGROUND', (0, 0), (0, 0), GRIS_OSCURO),
+    ('BACKGROUND', (1, 0), (1, 0), GRIS_CLARO),
+    ('TEXTCOLOR', (0, 0), (0, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+ESTILO_INFO = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), GRIS_CLARO),
+    ('BACKGROUND', (2, 0), (2, -1), GRIS_CLARO),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ('FONTSIZE', (0, 0), (0, -1), 5.5),
+    ('FONTSIZE', (2, 0), (2, -1), 5.5),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('FONTSIZE', (1, 0), (1, 0), 8),
+    ('FONTSIZE', (3, 0), (3, 0), 8),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+ESTILO_HEADER_ACTIVOS = TableStyle([
+    ('BACKGROUND', (0, 0), (3, 0), GRIS_OSCURO),
+    ('BACKGROUND', (4, 0), (5, 0), GRIS_OSCURO),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+    ('SPAN', (0, 0), (3, 0)),
+    ('SPAN', (4, 0), (5, 0)),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+ESTILO_ACTIVOS = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), GRIS_CLARO),
+    ('BACKGROUND', (2, 0), (2, 2), GRIS_CLARO),
+    ('BACKGROUND', (4, 0), (4, -1), GRIS_CLARO),
+    ('SPAN', (1, 3), (3, 3)),
+    ('SPAN', (1, 4), (3, 4)),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (0, -1), 6.5),
+    ('FONTSIZE', (2, 0), (2, -1), 6.5),
+    ('FONTSIZE', (4, 0), (4, -1), 6.5),
+    ('FONTSIZE', (1, 0), (1, 2), 10),
+    ('FONTSIZE', (3, 0), (3, 2), 10),
+    ('FONTSIZE', (5, 0), (5, -1), 10),
+    ('FONTSIZE', (1, 3), (3, 3), 8),
+    ('FONTSIZE', (1, 4), (3, 4), 8),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+ESTILO_CHECKS = TableStyle([
+    ('BACKGROUND', (0, 0), (0, 0), GRIS_CLARO),
+    ('BACKGROUND', (2, 0), (2, 0), GRIS_CLARO),
+    ('BACKGROUND', (4, 0), (4, 0), GRIS_CLARO),
+    ('BACKGROUND', (6, 0), (6, 0), GRIS_CLARO),
+    ('BACKGROUND', (8, 0), (8, 0), GRIS_CLARO),
+    ('BACKGROUND', (10, 0), (10, 0), GRIS_CLARO),
+    ('BACKGROUND', (12, 0), (12, 0), GRIS_CLARO),
+    ('BACKGROUND', (14, 0), (14, 0), GRIS_CLARO),
+    ('BACKGROUND', (16, 0), (16, 0), GRIS_CLARO),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 6),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+ESTILO_SELLOS = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), GRIS_CLARO),
+    ('BACKGROUND', (1, 0), (-1, 0), GRIS_CLARO),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+# Barras de título (GUIAS, COMIDAS PREPARADAS / IMPLEMENTOS)
+ESTILO_TITULO = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), GRIS_OSCURO),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+ESTILO_GUIAS = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+ESTILO_COMIDAS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), GRIS_CLARO),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 6),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+ESTILO_FIRMAS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), GRIS_CLARO),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 6),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+# Campos de checkbox en el orden en que aparecen en la fila
+CHECKS_PLANILLA = [
+    ('CONG.', 'check_congelado'),
+    ('REFRIG.', 'check_refrigerado'),
+    ('ABARR.', 'check_abarrote'),
+    ('IMPLEM.', 'check_implementos'),
+    ('ASEO', 'check_aseo'),
+    ('TRAZ.', 'check_trazabilidad'),
+    ('PLAT. WTCK', 'check_plataforma_wtck'),
+    ('ENV. WTCK', 'check_env_correo_wtck'),
+    ('REV. PLANILLA', 'check_revision_planilla_despacho'),
+]
+
 
 class PDFGenerator:
     def __init__(self):
@@ -23,6 +202,7 @@ class PDFGenerator:
         else:
             # Corriendo como script normal
             self.base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.cache = CachePDF(os.path.join(self.base_dir, 'pdfs'))
         
     def generar_pdf_viaje(self, viaje_dict, comidas_list):
         """Generar PDF para un viaje específico (método principal usado por app_web.py)"""
@@ -53,7 +233,7 @@ class PDFGenerator:
             filepath = os.path.join(pdfs_dir, filename)
             
             with open(filepath, 'wb') as f:
-                f.write(buffer.getvalue())
+                f.write(buffer.getbuffer())
             
             return filepath
             
@@ -80,18 +260,8 @@ class PDFGenerator:
         # 1. ENCABEZADO
         encabezado = Table([
             ['PLANILLA CONTROL DESPACHO', 'VIAJE', get('numero_viaje')]
-        ], colWidths=[5*inch, 0.8*inch, 1.7*inch])
-        
-        encabezado.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#808080')),
-            ('BACKGROUND', (1, 0), (1, 0), colors.HexColor('#D0D0D0')),
-            ('TEXTCOLOR', (0, 0), (0, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        ], colWidths=ANCHOS_ENCABEZADO)
+        encabezado.setStyle(ESTILO_ENCABEZADO)
         content.append(encabezado)
         content.append(Spacer(1, 1*mm))
         
@@ -105,42 +275,16 @@ class PDFGenerator:
             ['CONDUCTOR', get('conductor'), 'N° CAMION', get('numero_camion')],
             ['RUT', get('rut'), 'FECHA HORA LLEGADA', get('fecha_hora_llegada_dhl')],
             ['CELULAR', get('celular'), 'FECHA HORA SALIDA', get('fecha_hora_salida_dhl')],
-        ], colWidths=[1.1*inch, 3.7*inch, 0.9*inch, 1.8*inch], rowHeights=[0.25*inch] + [0.18*inch]*7)
-        
-        info.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#D0D0D0')),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 7),
-            ('FONTSIZE', (0, 0), (0, -1), 5.5),
-            ('FONTSIZE', (2, 0), (2, -1), 5.5),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (1, 0), (1, 0), 8),
-            ('FONTSIZE', (3, 0), (3, 0), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
+        ], colWidths=ANCHOS_INFO, rowHeights=ALTOS_INFO)
+        info.setStyle(ESTILO_INFO)
         content.append(info)
         content.append(Spacer(1, 1*mm))
         
         # 3. HEADER ACTIVOS SALIDA Y PALLETS POR AREA
         header_activos = Table([
             ['ACTIVOS SALIDA', '', '', '', 'PALLETS POR AREA', '']
-        ], colWidths=[1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch])
-        
-        header_activos.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (3, 0), colors.HexColor('#808080')),
-            ('BACKGROUND', (4, 0), (5, 0), colors.HexColor('#808080')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
-            ('SPAN', (0, 0), (3, 0)),
-            ('SPAN', (4, 0), (5, 0)),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        ], colWidths=ANCHOS_SEIS_COLUMNAS)
+        header_activos.setStyle(ESTILO_HEADER_ACTIVOS)
         content.append(header_activos)
         content.append(Spacer(1, 0))
         
@@ -151,61 +295,18 @@ class PDFGenerator:
             ['PALLET\nCHEP', get_num('pallets_chep'), 'PALLET\nNEGRO ALTER.', get_num('pallets_pl_negro_alternativo'), 'ABARROTE', get_num('pallets_abarrote')],
             ['ADMIN.\nRESPONSABLE', get('administrativo_responsable'), '', '', 'WENCOS\nCONGELADO', get_num('wencos_congelado')],
             ['REVISION\nLIMPIEZA', get('revision_limpieza_camion_acciones'), '', '', 'WENCOS\nREFRIGERADO', get_num('wencos_refrigerado')],
-        ], colWidths=[1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch], rowHeights=[0.30*inch]*5)
-        
-        activos.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (2, 0), (2, 2), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (4, 0), (4, -1), colors.HexColor('#D0D0D0')),
-            ('SPAN', (1, 3), (3, 3)),
-            ('SPAN', (1, 4), (3, 4)),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (0, -1), 6.5),
-            ('FONTSIZE', (2, 0), (2, -1), 6.5),
-            ('FONTSIZE', (4, 0), (4, -1), 6.5),
-            ('FONTSIZE', (1, 0), (1, 2), 10),
-            ('FONTSIZE', (3, 0), (3, 2), 10),
-            ('FONTSIZE', (5, 0), (5, -1), 10),
-            ('FONTSIZE', (1, 3), (3, 3), 8),
-            ('FONTSIZE', (1, 4), (3, 4), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
+        ], colWidths=ANCHOS_SEIS_COLUMNAS, rowHeights=ALTOS_ACTIVOS)
+        activos.setStyle(ESTILO_ACTIVOS)
         content.append(activos)
         content.append(Spacer(1, 1*mm))
         
         # 5. CHECKBOXES - UNA SOLA FILA
-        check_congelado = 'x' if get('check_congelado') == 'X' else ''
-        check_refrigerado = 'x' if get('check_refrigerado') == 'X' else ''
-        check_abarrote = 'x' if get('check_abarrote') == 'X' else ''
-        check_implementos = 'x' if get('check_implementos') == 'X' else ''
-        check_aseo = 'x' if get('check_aseo') == 'X' else ''
-        check_trazabilidad = 'x' if get('check_trazabilidad') == 'X' else ''
-        check_plataforma = 'x' if get('check_plataforma_wtck') == 'X' else ''
-        check_env_correo = 'x' if get('check_env_correo_wtck') == 'X' else ''
-        check_revision = 'x' if get('check_revision_planilla_despacho') == 'X' else ''
-        
-        checks = Table([
-            ['CONG.', check_congelado, 'REFRIG.', check_refrigerado, 'ABARR.', check_abarrote, 'IMPLEM.', check_implementos, 'ASEO', check_aseo, 'TRAZ.', check_trazabilidad, 'PLAT. WTCK', check_plataforma, 'ENV. WTCK', check_env_correo, 'REV. PLANILLA', check_revision],
-        ], colWidths=[0.55*inch, 0.22*inch, 0.55*inch, 0.22*inch, 0.55*inch, 0.22*inch, 0.6*inch, 0.22*inch, 0.45*inch, 0.22*inch, 0.5*inch, 0.22*inch, 0.75*inch, 0.22*inch, 0.7*inch, 0.22*inch, 0.9*inch, 0.22*inch], rowHeights=[0.3*inch])
-        
-        checks.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (2, 0), (2, 0), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (4, 0), (4, 0), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (6, 0), (6, 0), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (8, 0), (8, 0), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (10, 0), (10, 0), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (12, 0), (12, 0), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (14, 0), (14, 0), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (16, 0), (16, 0), colors.HexColor('#D0D0D0')),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
+        fila_checks = []
+        for etiqueta, campo in CHECKS_PLANILLA:
+            fila_checks.extend([etiqueta, 'x' if get(campo) == 'X' else ''])
+        
+        checks = Table([fila_checks], colWidths=ANCHOS_CHECKS, rowHeights=ALTOS_CHECKS)
+        checks.setStyle(ESTILO_CHECKS)
         content.append(checks)
         content.append(Spacer(1, 1*mm))
         
@@ -214,60 +315,28 @@ class PDFGenerator:
             ['SELLOS', '1P', '2P', '3P', '4P', '5P'],
             ['SALIDA', get('sello_salida_1p'), get('sello_salida_2p'), get('sello_salida_3p'), get('sello_salida_4p'), get('sello_salida_5p')],
             ['ENTRADA', get('sello_retorno_1p'), get('sello_retorno_2p'), get('sello_retorno_3p'), get('sello_retorno_4p'), get('sello_retorno_5p')],
-        ], colWidths=[1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch, 1.25*inch])
-        
-        sellos.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#D0D0D0')),
-            ('BACKGROUND', (1, 0), (-1, 0), colors.HexColor('#D0D0D0')),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 7),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
+        ], colWidths=ANCHOS_SEIS_COLUMNAS)
+        sellos.setStyle(ESTILO_SELLOS)
         content.append(sellos)
         content.append(Spacer(1, 1*mm))
         
         # 7. GUÍAS
-        guias_header = Table([['GUIAS']], colWidths=[7.5*inch])
-        guias_header.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#808080')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        guias_header = Table([['GUIAS']], colWidths=ANCHOS_TITULO)
+        guias_header.setStyle(ESTILO_TITULO)
         content.append(guias_header)
         
         guias = Table([
             [get('guia_1'), get('guia_2'), get('guia_3'), get('guia_4'), get('guia_5'), get('guia_6'), get('guia_7')],
             [get('guia_8'), get('guia_9'), get('guia_10'), get('guia_11'), get('guia_12'), get('guia_13'), get('guia_14')],
             [get('guia_15'), get('guia_16'), get('guia_17'), get('guia_18'), get('guia_19'), get('guia_20'), get('guia_21')],
-        ], colWidths=[1.07*inch] * 7)
-        
-        guias.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 7),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
+        ], colWidths=ANCHOS_GUIAS)
+        guias.setStyle(ESTILO_GUIAS)
         content.append(guias)
         content.append(Spacer(1, 1*mm))
         
         # 8. COMIDAS PREPARADAS
-        comidas_header = Table([['COMIDAS PREPARADAS / IMPLEMENTOS']], colWidths=[7.5*inch])
-        comidas_header.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#808080')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        comidas_header = Table([['COMIDAS PREPARADAS / IMPLEMENTOS']], colWidths=ANCHOS_TITULO)
+        comidas_header.setStyle(ESTILO_TITULO)
         content.append(comidas_header)
         
         # Tabla de comidas - DIN\u00c1MICA (se adapta a la cantidad de comidas)
@@ -307,89 +376,257 @@ class PDFGenerator:
         if len(comidas_data) == 1:
             comidas_data.append(['', '', '', '', ''])
         
-        # Calcular altura de filas din\u00e1micamente
-        num_filas = len(comidas_data)
-        altura_fila = 0.18*inch
-        
         comidas_table = Table(
             comidas_data, 
-            colWidths=[1.2*inch, 1.6*inch, 3.5*inch, 0.6*inch, 0.6*inch],
-            rowHeights=[altura_fila] * num_filas
+            colWidths=ANCHOS_COMIDAS,
+            rowHeights=[ALTO_FILA_COMIDAS] * len(comidas_data)
         )
-        comidas_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#D0D0D0')),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
+        comidas_table.setStyle(ESTILO_COMIDAS)
         content.append(comidas_table)
         content.append(Spacer(1, 1*mm))
         
         # 9. FIRMAS
         firmas = Table([
             ['NOMBRE Y FIRMA DHL', 'PORTERIA DHL', 'FIRMA CONDUCTOR', 'FIRMA RESP. CASINO\nDEVOLUCION Y RECEPCIONES'],
-        ], colWidths=[1.875*inch] * 4, rowHeights=[0.2*inch])
-        
-        firmas.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#D0D0D0')),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
+        ], colWidths=ANCHOS_FIRMAS, rowHeights=ALTOS_FIRMAS)
+        firmas.setStyle(ESTILO_FIRMAS)
         content.append(firmas)
         
         return content
     
-    def generar_pdf_completo(self, numero_viaje):
-        """Generar PDF con todas las hojas (un centro de costo por hoja)"""
-        try:
-            # Obtener centros de costo del viaje
-            centros = self.db_manager.get_centros_costo_por_viaje(numero_viaje)
-            if not centros:
-                return None
-            
-            # Crear buffer con márgenes optimizados
-            buffer = io.BytesIO()
-            doc = SimpleDocTemplate(
-                buffer, 
-                pagesize=letter,
-                rightMargin=10*mm, 
-                leftMargin=10*mm,
-                topMargin=8*mm, 
-                bottomMargin=8*mm
-            )
-            
-            content = []
-            
-            # Generar una página por cada centro de costo
-            for i, centro in enumerate(centros):
-                if i > 0:
-                    content.append(PageBreak())
-                
-                viaje_dict = self.db_manager.get_viaje_por_numero_y_centro(numero_viaje, centro)
-                comidas_list = self.db_manager.get_comidas_por_viaje_y_centro(numero_viaje, centro)
-                
-                if viaje_dict:
-                    content.extend(self._crear_pagina_planilla(viaje_dict, comidas_list))
-            
-            # Construir PDF
-            doc.build(content)
+    def _leer_hojas(self, numero_viaje):
+        """Centros de costo del viaje y (viaje_dict, comidas_list) de cada uno (dos consultas en total)"""
+        por_centro = self.db_manager.get_viaje_por_centro(numero_viaje)
+        centros = list(por_centro)
+        hojas = [(datos['viaje'], datos['comidas']) for datos in por_centro.values()]
+        return centros, hojas
+    
+    def _dibujar_hojas(self, hojas):
+        """Bytes de un PDF con una página por cada (viaje_dict, comidas_list)"""
+        # Crear buffer con márgenes optimizados
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(
+            buffer, 
+            pagesize=letter,
+            rightMargin=10*mm, 
+            leftMargin=10*mm,
+            topMargin=8*mm, 
+            bottomMargin=8*mm
+        )
+        
+        content = []
+        
+        # Generar una página por cada centro de costo
+        for i, (viaje_dict, comidas_list) in enumerate(hojas):
+            if i > 0:
+                content.append(PageBreak())
             
+            if viaje_dict:
+                content.extend(self._crear_pagina_planilla(viaje_dict, comidas_list))
+        
+        # Construir PDF
+        doc.build(content)
+        return buffer.getvalue()
+    
+    def preparar_pdf_completo(self, numero_viaje):
+        """
+        Leer los datos del PDF completo de un viaje sin dibujarlo.
+        Retorna None si el viaje no tiene centros de costo, o un dict con
+        'nombre', 'huella' (identifica el contenido: sirve de ETag), 'num_centros',
+        'hojas' (datos para dibujar) y 'archivo' (ruta del PDF en disco si sigue vigente, si no None).
+        """
+        # Datos de cada hoja: se leen una vez y sirven para la huella y para dibujar
+        centros, hojas = self._leer_hojas(numero_viaje)
+        if not centros:
+            return None
+        
+        filename = f"viaje_{numero_viaje}_completo.pdf"
+        filepath = os.path.join(self.base_dir, 'pdfs', filename)
+        huella = calcular_huella(VERSION_PLANTILLA, centros, hojas)
+        
+        return {
+            'nombre': filename,
+            'huella': huella,
+            'num_centros': len(centros),
+            'hojas': hojas,
+            # Si los datos no cambiaron desde la última vez, el PDF en disco sirve tal cual
+            'archivo': filepath if self.cache.vigente(filename, huella) else None
+        }
+    
+    def dibujar_pdf_completo(self, preparado, persistir=True):
+        """Bytes del PDF preparado; con persistir también queda en pdfs/ y en la caché"""
+        contenido = self._dibujar_hojas(preparado['hojas'])
+        
+        if persistir:
             # Guardar en carpeta pdfs junto al ejecutable o script
             pdfs_dir = os.path.join(self.base_dir, 'pdfs')
             os.makedirs(pdfs_dir, exist_ok=True)
-            filename = f"viaje_{numero_viaje}_completo.pdf"
-            filepath = os.path.join(pdfs_dir, filename)
+            filepath = os.path.join(pdfs_dir, preparado['nombre'])
             
-            with open(filepath, 'wb') as f:
-                f.write(buffer.getvalue())
+            # Temporal propio + renombrar: una descarga en curso nunca ve un archivo a medias
+            # y dos generaciones simultáneas del mismo viaje no se pisan
+            temporal = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporal, 'wb') as f:
+                f.write(contenido)
+            os.replace(temporal, filepath)
             
-            return filepath
+            self.cache.registrar(preparado['nombre'], preparado['huella'])
+            preparado['archivo'] = filepath
+        
+        return contenido
+    
+    def generar_pdf_completo(self, numero_viaje):
+        """Generar PDF con todas las hojas (un centro de costo por hoja)"""
+        try:
+            preparado = self.preparar_pdf_completo(numero_viaje)
+            if not preparado:
+                return None
+            
+            if not preparado['archivo']:
+                self.dibujar_pdf_completo(preparado)
+            return preparado['archivo']
             
         except Exception as e:
             print(f"Error generando PDF completo: {str(e)}")
             return None
+    
+    def generar_pdf_lote(self, numeros_viaje=None, fecha_inicio=None, fecha_fin=None,
+                         formato='zip', procesos=None, progreso=None):
+        """
+        Generar los PDFs completos de varios viajes (lista de números o rango de
+        fechas) repartiendo el dibujo en un pool de procesos.
+        
+        formato: 'zip' (un PDF por viaje) o 'pdf' (un solo PDF con todos los viajes)
+        progreso: callback opcional progreso(porcentaje, mensaje)
+        Retorna dict con 'archivo', tiempos por viaje ('viajes') y totales.
+        """
+        if formato not in FORMATOS_LOTE:
+            raise ValueError(f'Formato de lote no soportado: {formato}')
+        if not formato_lote_disponible(formato):
+            raise ValueError("El formato de lote 'pdf' requiere pypdf (pip install pypdf)")
+        por_fecha = numeros_viaje is None
+        if por_fecha:
+            numeros_viaje = self.db_manager.get_numeros_viaje_por_fecha(fecha_inicio, fecha_fin)
+        numeros_viaje = list(dict.fromkeys(str(n) for n in numeros_viaje))
+        if not numeros_viaje:
+            raise ValueError('No hay viajes para generar')
+        
+        procesos = max(1, min(procesos or os.cpu_count() or 1, len(numeros_viaje)))
+        inicio = time.perf_counter()
+        tiempos = {}
+        
+        def registrar(numero_viaje, filepath, segundos):
+            tiempos[numero_viaje] = (filepath, segundos)
+            if progreso:
+                progreso(int(len(tiempos) * 90 / len(numeros_viaje)),
+                         f'{len(tiempos)} de {len(numeros_viaje)} viajes generados')
+        
+        if procesos == 1:
+            for numero_viaje in numeros_viaje:
+                registrar(*_generar_viaje(self, numero_viaje))
+        else:
+            # spawn también en Linux: los procesos no heredan conexiones SQLite abiertas
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto,
+                                     initializer=_iniciar_proceso) as pool:
+                futuros = [pool.submit(_generar_en_proceso, numero_viaje) for numero_viaje in numeros_viaje]
+                for futuro in as_completed(futuros):
+                    registrar(*futuro.result())
+        
+        generados = [n for n in numeros_viaje if tiempos[n][0]]
+        if not generados:
+            raise RuntimeError('No se pudo generar ningún PDF del lote')
+        
+        if por_fecha:
+            etiqueta = f'{fecha_inicio}_a_{fecha_fin}'
+        else:
+            etiqueta = datetime.now().strftime('%Y%m%d_%H%M%S')
+        pdfs_dir = os.path.join(self.base_dir, 'pdfs')
+        filepath = os.path.join(pdfs_dir, f'lote_{etiqueta}.{formato}')
+        
+        if formato == 'zip':
+            # Los PDFs ya vienen comprimidos: ZIP sin compresión
+            with zipfile.ZipFile(filepath + '.tmp', 'w', compression=zipfile.ZIP_STORED) as zf:
+                for numero_viaje in generados:
+                    archivo = tiempos[numero_viaje][0]
+                    zf.write(archivo, os.path.basename(archivo))
+        else:
+            writer = PdfWriter()
+            for numero_viaje in generados:
+                writer.append(tiempos[numero_viaje][0])
+            with open(filepath + '.tmp', 'wb') as f:
+                writer.write(f)
+        os.replace(filepath + '.tmp', filepath)
+        
+        total = time.perf_counter() - inicio
+        print(f"[PDF] Lote de {len(generados)} viajes generado en {total:.1f}s con {procesos} proceso(s)")
+        return {
+            'archivo': filepath,
+            'formato': formato,
+            'procesos': procesos,
+            'total_segundos': round(total, 3),
+            'generados': len(generados),
+            'fallidos': [n for n in numeros_viaje if not tiempos[n][0]],
+            'viajes': [
+                {'numero_viaje': n, 'segundos': round(tiempos[n][1], 3), 'ok': bool(tiempos[n][0])}
+                for n in numeros_viaje
+            ]
+        }
+
+
+# ========== LOTES EN PROCESOS ==========
+
+FORMATOS_LOTE = ('zip', 'pdf')
+
+
+def formato_lote_disponible(formato):
+    """True si el formato de lote existe y sus dependencias están instaladas"""
+    if formato == 'pdf':
+        return PdfWriter is not None
+    return formato in FORMATOS_LOTE
+
+# Generador propio de cada proceso del pool (se crea una vez por proceso)
+_generador_proceso = None
+
+
+def _iniciar_proceso():
+    global _generador_proceso
+    _generador_proceso = PDFGenerator()
+
+
+def _generar_viaje(generador, numero_viaje):
+    inicio = time.perf_counter()
+    filepath = generador.generar_pdf_completo(numero_viaje)
+    return numero_viaje, filepath, time.perf_counter() - inicio
+
+
+def _generar_en_proceso(numero_viaje):
+    """Tarea del pool: lee los datos, arma las planillas y escribe el PDF del viaje"""
+    return _generar_viaje(_generador_proceso, numero_viaje)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    
+    parser = argparse.ArgumentParser(description='Generar PDFs completos de viajes en lote')
+    parser.add_argument('viajes', nargs='*', help='Números de viaje (si no se indica --desde/--hasta)')
+    parser.add_argument('--desde', help='Fecha inicial (YYYY-MM-DD)')
+    parser.add_argument('--hasta', help='Fecha final (YYYY-MM-DD), por defecto igual a --desde')
+    parser.add_argument('--formato', choices=FORMATOS_LOTE, default='zip')
+    parser.add_argument('--procesos', type=int, default=None, help='Procesos a usar (por defecto: núcleos)')
+    args = parser.parse_args()
+    
+    if not args.viajes and not args.desde:
+        parser.error('Indicar números de viaje o --desde')
+    if not formato_lote_disponible(args.formato):
+        parser.error("--formato pdf requiere pypdf (pip install pypdf)")
+    
+    resultado = PDFGenerator().generar_pdf_lote(
+        numeros_viaje=args.viajes or None,
+        fecha_inicio=args.desde,
+        fecha_fin=args.hasta or args.desde,
+        formato=args.formato,
+        procesos=args.procesos
+    )
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
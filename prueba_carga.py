@@ -0,0 +1,682 @@
+"""
+Prueba de carga: usuarios virtuales que repiten las sesiones de los formularios
+Cada usuario virtual inicia sesión por /login (cookie propia, conexión
+keep-alive propia) y repite, hasta cumplir la duración, una de estas sesiones
+con pausas de "tipeo" entre pasos:
+
+  nuevo_viaje   lo que pide nuevo_viaje.html: la página, las maestras que carga
+                al abrir (choferes, proveedores, transportes, administrativos),
+                buscar-viaje-numero al escribir el número, centro-costo-detalles
+                al elegir el centro, obtener-transporte / obtener-chofer al
+                completar patente y chofer, y guardar-viaje por cada centro
+                (1 a CENTROS_MAX; desde el segundo, buscar-viaje-numero ya
+                encuentra el viaje y precarga el formulario como en la pantalla)
+  editar_viaje  lo que pide editar_viaje.js: la página y sus maestras,
+                buscar-centros-costo, buscar-viaje del centro elegido,
+                actualizar-viaje con el formulario completo (comidas incluidas)
+                y el PDF del viaje como lo pide generar_pdf.html (/pdf/viaje/<n>,
+                o POST /api/generar-pdf con --pdf api; los dos pasan por la cola
+                y si responden 202 se consulta el trabajo hasta que termine)
+
+Solo se editan viajes creados por la misma prueba (números CARGA<corrida>...)
+y al terminar se eliminan por /api/eliminar-viaje, así que también puede
+apuntarse a un servidor ya levantado (--url). Con --iniciar se levanta un
+Waitress por cada valor de --threads sobre una copia de la base (viajes.db
+o la de --base, p. ej. una base sintética de benchmark_viajes.py) y se
+comparan: es la forma de elegir ARATRACK_THREADS midiendo en vez de suponer.
+
+Se informa por endpoint: requests, % de errores (estado inesperado o fallo de
+conexión), p50 / p95 / p99 / máx. en ms y KB promedio; y en total: requests
+por segundo, sesiones completas y duración de sesión. La vista del servidor
+(tiempo de SQL, requests en curso) queda en /admin/metricas del mismo Waitress.
+
+Uso:
+    python prueba_carga.py --iniciar --threads 4 8 16 --usuarios 30 --duracion 120
+    python prueba_carga.py --iniciar --base /tmp/aratrack_benchmark/viajes_100k.db --usuarios 20
+    python prueba_carga.py --url http://localhost:5000 --usuarios 10 --pausa 0 --salida carga.json
+"""
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import quote, urlencode, urlsplit
+from config import config
+
+# Proporción de cada sesión en la mezcla (editar sólo corre si ya hay viajes creados)
+MEZCLA = {'nuevo_viaje': 0.4, 'editar_viaje': 0.6}
+
+CENTROS_MAX = 4                 # centros de costo por viaje nuevo (1 a CENTROS_MAX)
+COMIDAS_POR_CENTRO = (0, 5)
+TIMEOUT_REQUEST = 120           # segundos; el PDF de un viaje grande puede tardar
+ESPERA_SERVIDOR = 60            # segundos para que el Waitress iniciado responda
+INTERVALO_TRABAJO = 1           # segundos entre consultas del estado de un trabajo (202)
+
+# Un p95 total hasta esta proporción del mejor se considera equivalente al elegir hilos
+TOLERANCIA_P95 = 0.10
+
+DIRECTORIO = os.path.join(tempfile.gettempdir(), 'aratrack_carga')
+
+CAMPOS_NUMERICOS = ('num_wencos', 'bin', 'pallets', 'pallets_chep', 'pallets_pl_negro_grueso',
+                    'pallets_pl_negro_alternativo', 'pallets_congelado', 'wencos_congelado',
+                    'pallets_refrigerado', 'wencos_refrigerado', 'pallets_abarrote')
+CAMPOS_CHECK = ('check_congelado', 'check_refrigerado', 'check_abarrote', 'check_implementos', 'check_aseo',
+                'check_trazabilidad', 'check_plataforma_wtck', 'check_env_correo_wtck',
+                'check_revision_planilla_despacho')
+CAMPOS_GUIAS = tuple(f'guia_{i}' for i in range(1, 22))
+CAMPOS_SELLOS = tuple(f'sello_{tipo}_{i}p' for tipo in ('salida', 'retorno') for i in range(1, 6))
+CAMPOS_TEXTO = ('numero_certificado_fumigacion', 'revision_limpieza_camion_acciones', 'administrativo_responsable',
+                'tipo_camion', 'patente_camion', 'patente_semi', 'numero_rampa', 'transporte', 'numero_camion',
+                'termografos_gps', 'celular', 'rut', 'fecha', 'casino', 'ruta')
+
+DESCRIPCIONES = ['COLACION FRIA ENVASADA', 'ALMUERZO CALIENTE', 'DESAYUNO', 'CENA', 'PAN', 'FRUTA', 'LACTEOS']
+
+
+def percentil(ordenados, q):
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, max(0, math.ceil(q * len(ordenados)) - 1))]
+
+
+# ========== CLIENTE HTTP ==========
+
+class _PasoFallido(Exception):
+    """Un request de la sesión respondió algo que la pantalla trataría como error"""
+
+
+class Resultados:
+    """Tiempos por endpoint y por sesión de todos los usuarios virtuales (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.sesiones = {}
+
+    def registrar(self, nombre, ms, estado, bytes_respuesta, ok):
+        with self._lock:
+            e = self.endpoints.setdefault(nombre, {'tiempos': [], 'errores': 0, 'estados': {}, 'bytes': 0})
+            e['tiempos'].append(ms)
+            e['bytes'] += bytes_respuesta
+            e['estados'][estado] = e['estados'].get(estado, 0) + 1
+            if not ok:
+                e['errores'] += 1
+
+    def sesion(self, escenario, segundos, ok):
+        with self._lock:
+            s = self.sesiones.setdefault(escenario, {'tiempos': [], 'fallidas': 0})
+            s['tiempos'].append(segundos)
+            if not ok:
+                s['fallidas'] += 1
+
+
+class Navegador:
+    """Un usuario virtual: conexión keep-alive y cookie de sesión propias, sin seguir redirecciones"""
+
+    def __init__(self, url, resultados):
+        partes = urlsplit(url)
+        self.host = partes.hostname
+        self.puerto = partes.port or (443 if partes.scheme == 'https' else 80)
+        self.clase = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        self.resultados = resultados
+        self.cookies = {}
+        self._conn = None
+
+    def cerrar(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _enviar(self, metodo, ruta, cuerpo, encabezados):
+        reutilizada = self._conn is not None
+        if self._conn is None:
+            self._conn = self.clase(self.host, self.puerto, timeout=TIMEOUT_REQUEST)
+        try:
+            self._conn.request(metodo, ruta, body=cuerpo, headers=encabezados)
+            respuesta = self._conn.getresponse()
+            return respuesta, respuesta.read()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            self.cerrar()
+            if not reutilizada:
+                raise
+            # El servidor cerró la conexión inactiva: reintentar una vez con una nueva
+            self._conn = self.clase(self.host, self.puerto, timeout=TIMEOUT_REQUEST)
+            self._conn.request(metodo, ruta, body=cuerpo, headers=encabezados)
+            respuesta = self._conn.getresponse()
+            return respuesta, respuesta.read()
+
+    def pedir(self, nombre, metodo, ruta, json_=None, formulario=None, esperados=(200,), registrar=True):
+        """
+        Ejecutar un request y registrar su tiempo bajo `nombre` (la ruta con sus
+        parámetros como <...>). Retorna (estado, cuerpo); lanza _PasoFallido si
+        el estado no es uno de los esperados.
+        """
+        encabezados = {'Accept-Encoding': 'identity'}
+        cuerpo = None
+        if json_ is not None:
+            cuerpo = json.dumps(json_).encode('utf-8')
+            encabezados['Content-Type'] = 'application/json'
+        elif formulario is not None:
+            cuerpo = urlencode(formulario).encode('utf-8')
+            encabezados['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            encabezados['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+
+        inicio = time.perf_counter()
+        try:
+            respuesta, datos = self._enviar(metodo, ruta, cuerpo, encabezados)
+        except (OSError, http.client.HTTPException) as e:
+            self.cerrar()
+            if registrar:
+                self.resultados.registrar(nombre, (time.perf_counter() - inicio) * 1000, 0, 0, False)
+            raise _PasoFallido(f'{nombre}: {type(e).__name__}: {e}')
+        ms = (time.perf_counter() - inicio) * 1000
+
+        for valor in respuesta.headers.get_all('Set-Cookie') or ():
+            for clave, morsel in SimpleCookie(valor).items():
+                self.cookies[clave] = morsel.value
+        if respuesta.will_close:
+            self.cerrar()
+
+        ok = respuesta.status in esperados
+        if registrar:
+            self.resultados.registrar(nombre, ms, respuesta.status, len(datos), ok)
+        if not ok:
+            raise _PasoFallido(f'{nombre}: estado {respuesta.status}')
+        return respuesta.status, datos
+
+    def json(self, *args, **kwargs):
+        _, datos = self.pedir(*args, **kwargs)
+        return json.loads(datos)
+
+    def iniciar_sesion(self, usuario, password, registrar=True):
+        """Como el formulario de login: GET /login, POST (302 si es correcto) y la página de inicio"""
+        self.pedir('GET /login', 'GET', '/login', registrar=registrar)
+        try:
+            self.pedir('POST /login', 'POST', '/login', formulario={'username': usuario, 'password': password},
+                       esperados=(302, 303), registrar=registrar)
+        except _PasoFallido:
+            return False
+        self.pedir('GET /', 'GET', '/', registrar=registrar)
+        return True
+
+
+# ========== SESIONES DE LOS FORMULARIOS ==========
+
+class Contexto:
+    """Estado compartido por los usuarios virtuales: maestras, viajes creados y parámetros"""
+
+    def __init__(self, maestras, pausa, pdf, corrida):
+        self.maestras = maestras
+        self.pausa = pausa
+        self.pdf = pdf
+        self.corrida = corrida
+        self._lock = threading.Lock()
+        self._contador = itertools.count(1)
+        self.creados = []           # (numero_viaje, centro_costo)
+
+    def nuevo_numero(self):
+        with self._lock:
+            return f'CARGA{self.corrida}{next(self._contador):05d}'
+
+    def registrar_creado(self, numero, codigo):
+        with self._lock:
+            self.creados.append((numero, codigo))
+
+    def viaje_al_azar(self, rnd):
+        with self._lock:
+            return rnd.choice(self.creados)[0] if self.creados else None
+
+
+def pensar(rnd, contexto):
+    """Pausa del operador entre pasos (0,5 a 1,5 veces --pausa)"""
+    if contexto.pausa > 0:
+        time.sleep(contexto.pausa * rnd.uniform(0.5, 1.5))
+
+
+def _comidas(rnd, proveedores):
+    return [{'guia_comida': f'GC{rnd.randint(10000, 99999)}', 'descripcion': rnd.choice(DESCRIPCIONES),
+             'kilo': round(rnd.uniform(1, 80), 1), 'bultos': rnd.randint(1, 20),
+             'proveedor': rnd.choice(proveedores) if proveedores else ''}
+            for _ in range(rnd.randint(*COMIDAS_POR_CENTRO))]
+
+
+def formulario_nuevo(rnd, maestras, numero, centro, transporte, chofer):
+    """JSON que arma nuevo_viaje.html al guardar"""
+    datos = {
+        'numero_viaje': numero,
+        'centro_costo': str(centro['codigo_costo']),
+        'fecha': datetime.now().strftime('%Y-%m-%d'),
+        'codigo_casino': centro['casino'],
+        'ruta': centro['ruta'],
+        'tipo_camion': transporte.get('tipo_camion') or '',
+        'patente_camion': transporte.get('patente') or '',
+        'patente_semi': '',
+        'numero_rampa': str(rnd.randint(1, 30)),
+        'transporte': transporte.get('transporte') or '',
+        'numero_camion': str(rnd.randint(1, 200)),
+        'termografos_gps': f'T{rnd.randint(1000, 9999)}',
+        'chofer': chofer.get('nombre') or '',
+        'celular': chofer.get('telefono') or '',
+        'rut': chofer.get('rut') or '',
+        'hora_salida': datetime.now().strftime('%Y-%m-%dT%H:%M'),
+        'hora_llegada': '',
+        'numero_certificado_fumigacion': '',
+        'revision_limpieza_camion_acciones': '',
+        'administrativo_responsable': rnd.choice(maestras['administrativos']) if maestras['administrativos'] else '',
+        'comidas': _comidas(rnd, maestras['proveedores'])
+    }
+    datos.update({campo: str(rnd.randint(0, 12)) for campo in CAMPOS_NUMERICOS})
+    datos.update({campo: rnd.choice(('X', '')) for campo in CAMPOS_CHECK})
+    datos.update({campo: '' for campo in CAMPOS_GUIAS + CAMPOS_SELLOS})
+    for campo in CAMPOS_GUIAS[:rnd.randint(1, 6)]:
+        datos[campo] = str(rnd.randint(1_000_000, 9_999_999))
+    datos['sello_salida_1p'] = str(rnd.randint(100_000, 999_999))
+    return datos
+
+
+def formulario_edicion(rnd, viaje, comidas):
+    """JSON que arma editar_viaje.js al actualizar, a partir del viaje cargado (con un par de cambios)"""
+    datos = {campo: viaje.get(campo) or '' for campo in CAMPOS_TEXTO + CAMPOS_CHECK + CAMPOS_GUIAS + CAMPOS_SELLOS}
+    datos.update({campo: viaje.get(campo) or 0 for campo in CAMPOS_NUMERICOS})
+    datos.update({
+        'numero_viaje': viaje['numero_viaje'],
+        'centro_costo': viaje['costo_codigo'],
+        'chofer': viaje.get('conductor') or '',
+        'hora_salida': viaje.get('fecha_hora_salida_dhl') or '',
+        'hora_llegada': viaje.get('fecha_hora_llegada_dhl') or datetime.now().strftime('%Y-%m-%dT%H:%M'),
+        'pallets': int(float(viaje.get('pallets') or 0)) + 1,
+        'comidas': [{clave: c[clave] for clave in ('guia_comida', 'proveedor', 'descripcion', 'kilo', 'bultos')}
+                    for c in comidas]
+    })
+    if datos['comidas']:
+        datos['comidas'][0]['bultos'] = rnd.randint(1, 20)
+    return datos
+
+
+def sesion_nuevo_viaje(nav, rnd, contexto):
+    maestras = contexto.maestras
+    nav.pedir('GET /nuevo-viaje', 'GET', '/nuevo-viaje')
+    nav.pedir('GET /api/obtener-choferes-completo', 'GET', '/api/obtener-choferes-completo')
+    nav.pedir('GET /api/listar-proveedores', 'GET', '/api/listar-proveedores')
+    nav.pedir('GET /api/listar-transportes', 'GET', '/api/listar-transportes')
+    nav.pedir('GET /api/listar-administrativos', 'GET', '/api/listar-administrativos')
+
+    numero = contexto.nuevo_numero()
+    transporte = rnd.choice(maestras['transportes']) if maestras['transportes'] else {}
+    chofer = rnd.choice(maestras['choferes']) if maestras['choferes'] else {}
+    centros = rnd.sample(maestras['centros'], min(len(maestras['centros']), rnd.randint(1, CENTROS_MAX)))
+    anterior = None
+    for centro in centros:
+        pensar(rnd, contexto)
+        existente = nav.json('GET /api/buscar-viaje-numero/<numero_viaje>', 'GET',
+                             f'/api/buscar-viaje-numero/{quote(numero)}')
+        if anterior is not None and not existente.get('success'):
+            raise _PasoFallido(f'buscar-viaje-numero no encontró {numero} recién guardado')
+        if anterior is not None:
+            # La pantalla precarga el centro del registro anterior antes de cambiarlo
+            nav.pedir('GET /api/centro-costo-detalles/<codigo>', 'GET',
+                      f"/api/centro-costo-detalles/{anterior['codigo_costo']}")
+        nav.pedir('GET /api/centro-costo-detalles/<codigo>', 'GET', f"/api/centro-costo-detalles/{centro['codigo_costo']}")
+        if anterior is None:
+            pensar(rnd, contexto)
+            if transporte.get('patente'):
+                nav.pedir('GET /api/obtener-transporte/<patente>', 'GET',
+                          f"/api/obtener-transporte/{quote(transporte['patente'])}")
+            if chofer.get('nombre'):
+                nav.pedir('GET /api/obtener-chofer', 'GET', '/api/obtener-chofer?' + urlencode({'nombre': chofer['nombre']}))
+        pensar(rnd, contexto)
+        nav.pedir('POST /api/guardar-viaje', 'POST', '/api/guardar-viaje',
+                  json_=formulario_nuevo(rnd, maestras, numero, centro, transporte, chofer))
+        contexto.registrar_creado(numero, str(centro['codigo_costo']))
+        anterior = centro
+
+
+def sesion_editar_viaje(nav, rnd, contexto):
+    numero = contexto.viaje_al_azar(rnd)
+    nav.pedir('GET /editar-viaje', 'GET', '/editar-viaje')
+    nav.pedir('GET /api/listar-proveedores', 'GET', '/api/listar-proveedores')
+    nav.pedir('GET /api/listar-transportes', 'GET', '/api/listar-transportes')
+    nav.pedir('GET /api/listar-administrativos', 'GET', '/api/listar-administrativos')
+
+    pensar(rnd, contexto)
+    centros = nav.json('GET /api/buscar-centros-costo/<numero_viaje>', 'GET',
+                       f'/api/buscar-centros-costo/{quote(numero)}')
+    if not centros:
+        raise _PasoFallido(f'buscar-centros-costo sin centros para {numero}')
+    codigo = rnd.choice(centros)['codigo']
+    cargado = nav.json('POST /api/buscar-viaje', 'POST', '/api/buscar-viaje',
+                       json_={'numero_viaje': numero, 'centro_costo': codigo})
+
+    pensar(rnd, contexto)
+    nav.pedir('POST /api/actualizar-viaje', 'POST', '/api/actualizar-viaje',
+              json_=formulario_edicion(rnd, cargado['viaje'], cargado['comidas']))
+
+    pensar(rnd, contexto)
+    if contexto.pdf == 'api':
+        estado, datos = nav.pedir('POST /api/generar-pdf', 'POST', '/api/generar-pdf',
+                                  json_={'numero_viaje': numero}, esperados=(200, 202))
+        if estado == 202:
+            esperar_trabajo(nav, 'POST /api/generar-pdf', json.loads(datos)['estado_url'])
+    else:
+        nav.pedir('GET /generar-pdf', 'GET', '/generar-pdf')
+        estado, datos = nav.pedir('GET /pdf/viaje/<numero_viaje>', 'GET', f'/pdf/viaje/{quote(numero)}',
+                                  esperados=(200, 202))
+        if estado == 202:
+            # Como generar_pdf.html: esperar el trabajo y volver a pedir el PDF (sale de la caché)
+            esperar_trabajo(nav, 'GET /pdf/viaje/<numero_viaje>', json.loads(datos)['estado_url'])
+            nav.pedir('GET /pdf/viaje/<numero_viaje>', 'GET', f'/pdf/viaje/{quote(numero)}')
+
+
+def esperar_trabajo(nav, nombre, estado_url):
+    """Después de un 202, consultar estado_url como el navegador hasta que el trabajo termine"""
+    while True:
+        time.sleep(INTERVALO_TRABAJO)
+        trabajo = nav.json('GET /api/trabajos/<id>', 'GET', estado_url)['trabajo']
+        if trabajo['estado'] not in ('pendiente', 'ejecutando'):
+            break
+    if trabajo['estado'] != 'completado':
+        raise _PasoFallido(f"{nombre}: trabajo {trabajo['estado']}: {trabajo['error']}")
+
+
+ESCENARIOS = {'nuevo_viaje': sesion_nuevo_viaje, 'editar_viaje': sesion_editar_viaje}
+
+
+def cargar_maestras(url, usuario, password):
+    """Maestras que usan los formularios, leídas por la API (sin registrar tiempos)"""
+    nav = Navegador(url, Resultados())
+    try:
+        if not nav.iniciar_sesion(usuario, password, registrar=False):
+            raise SystemExit(f'Login rechazado para {usuario} en {url}')
+        obtener = lambda ruta: nav.json(ruta, 'GET', ruta, registrar=False)
+        maestras = {
+            'centros': obtener('/api/obtener-centros-costo'),
+            'choferes': obtener('/api/obtener-choferes-completo'),
+            'proveedores': [p['nombre'] for p in obtener('/api/listar-proveedores').get('proveedores', [])],
+            'transportes': obtener('/api/listar-transportes').get('transportes', []),
+            'administrativos': obtener('/api/listar-administrativos').get('administrativos', [])
+        }
+    except _PasoFallido as e:
+        raise SystemExit(f'No se pudieron leer las maestras de {url}: {e}')
+    finally:
+        nav.cerrar()
+    if not maestras['centros']:
+        raise SystemExit('La base no tiene centros de costo activos (maestras_casinos): no se pueden crear viajes')
+    return maestras
+
+
+# ========== EJECUCIÓN ==========
+
+def usuario_virtual(indice, url, usuario, password, contexto, resultados, escenarios, inicio, rampa, fin, semilla):
+    rnd = random.Random(semilla + indice)
+    time.sleep(max(0.0, inicio + rampa * indice - time.monotonic()))
+    nav = Navegador(url, resultados)
+    try:
+        try:
+            if not nav.iniciar_sesion(usuario, password):
+                print(f"[Carga] Usuario virtual {indice}: login rechazado")
+                return
+        except _PasoFallido as e:
+            print(f"[Carga] Usuario virtual {indice}: {e}")
+            return
+        while time.monotonic() < fin:
+            nombre = rnd.choices(escenarios, weights=[MEZCLA[e] for e in escenarios])[0]
+            if nombre == 'editar_viaje' and contexto.viaje_al_azar(rnd) is None:
+                nombre = 'nuevo_viaje'
+            comienzo = time.monotonic()
+            ok = True
+            try:
+                ESCENARIOS[nombre](nav, rnd, contexto)
+            except _PasoFallido:
+                ok = False
+            except (ValueError, KeyError, TypeError) as e:
+                # Respuesta 200 con un cuerpo que la pantalla no podría usar
+                print(f"[Carga] Respuesta inesperada en {nombre}: {type(e).__name__}: {e}")
+                ok = False
+            resultados.sesion(nombre, time.monotonic() - comienzo, ok)
+    finally:
+        nav.cerrar()
+
+
+def limpiar(url, usuario, password, creados, pdfs_locales):
+    """Eliminar los viajes creados (y sus PDFs si el servidor es local y los dejó en pdfs/)"""
+    nav = Navegador(url, Resultados())
+    eliminados = 0
+    try:
+        nav.iniciar_sesion(usuario, password, registrar=False)
+        for numero, codigo in creados:
+            try:
+                nav.pedir('eliminar', 'POST', '/api/eliminar-viaje',
+                          json_={'numero_viaje': numero, 'centro_costo': codigo}, registrar=False)
+                eliminados += 1
+            except _PasoFallido as e:
+                print(f"[Carga] No se pudo eliminar {numero}/{codigo}: {e}")
+    finally:
+        nav.cerrar()
+    if pdfs_locales:
+        for numero in {numero for numero, _ in creados}:
+            ruta = os.path.join(config.base_dir, 'pdfs', f'viaje_{numero}_completo.pdf')
+            if os.path.exists(ruta):
+                os.remove(ruta)
+    return eliminados
+
+
+def ejecutar(url, usuarios, duracion, rampa, pausa, escenarios, usuario, password, pdf, semilla, pdfs_locales=False):
+    """Una corrida de `duracion` segundos con `usuarios` usuarios virtuales. Retorna el informe"""
+    maestras = cargar_maestras(url, usuario, password)
+    contexto = Contexto(maestras, pausa, pdf, datetime.now().strftime('%H%M%S'))
+    resultados = Resultados()
+
+    inicio = time.monotonic()
+    fin = inicio + rampa + duracion
+    hilos = [threading.Thread(target=usuario_virtual, name=f'usuario-{i}', daemon=True,
+                              args=(i, url, usuario, password, contexto, resultados, escenarios,
+                                    inicio, rampa / max(1, usuarios), fin, semilla))
+             for i in range(usuarios)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.monotonic() - inicio
+
+    eliminados = limpiar(url, usuario, password, contexto.creados, pdfs_locales)
+    print(f"[Carga] {eliminados} registros de prueba eliminados")
+    return informe(resultados, segundos, usuarios)
+
+
+def informe(resultados, segundos, usuarios):
+    endpoints = {}
+    todos = []
+    for nombre, e in resultados.endpoints.items():
+        tiempos = sorted(e['tiempos'])
+        todos.extend(tiempos)
+        endpoints[nombre] = {
+            'requests': len(tiempos),
+            'errores': e['errores'],
+            'error_pct': round(e['errores'] / len(tiempos) * 100, 2),
+            'p50_ms': round(percentil(tiempos, 0.50), 1),
+            'p95_ms': round(percentil(tiempos, 0.95), 1),
+            'p99_ms': round(percentil(tiempos, 0.99), 1),
+            'max_ms': round(tiempos[-1], 1),
+            'total_s': round(sum(tiempos) / 1000, 2),
+            'kb_promedio': round(e['bytes'] / len(tiempos) / 1024, 1),
+            'estados': {str(k): v for k, v in sorted(e['estados'].items())}
+        }
+    todos.sort()
+    errores = sum(e['errores'] for e in endpoints.values())
+    sesiones = {}
+    for nombre, s in resultados.sesiones.items():
+        tiempos = sorted(s['tiempos'])
+        sesiones[nombre] = {'completas': len(tiempos) - s['fallidas'], 'fallidas': s['fallidas'],
+                            'p50_s': round(percentil(tiempos, 0.50), 2), 'p95_s': round(percentil(tiempos, 0.95), 2)}
+    return {
+        'usuarios': usuarios,
+        'segundos': round(segundos, 1),
+        'requests': len(todos),
+        'requests_por_segundo': round(len(todos) / segundos, 2) if segundos else 0,
+        'errores': errores,
+        'error_pct': round(errores / len(todos) * 100, 2) if todos else 0,
+        'p50_ms': round(percentil(todos, 0.50), 1),
+        'p95_ms': round(percentil(todos, 0.95), 1),
+        'p99_ms': round(percentil(todos, 0.99), 1),
+        'sesiones': sesiones,
+        'endpoints': dict(sorted(endpoints.items(), key=lambda par: par[1]['total_s'], reverse=True))
+    }
+
+
+def imprimir_informe(resultado):
+    print(f"\n{'endpoint':<45} {'reqs':>6} {'err %':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'máx':>8} {'KB':>7}")
+    for nombre, e in resultado['endpoints'].items():
+        print(f"{nombre:<45} {e['requests']:>6} {e['error_pct']:>6.2f} {e['p50_ms']:>8.1f} {e['p95_ms']:>8.1f} "
+              f"{e['p99_ms']:>8.1f} {e['max_ms']:>8.1f} {e['kb_promedio']:>7.1f}")
+    print(f"\n{resultado['requests']} requests en {resultado['segundos']} s ({resultado['requests_por_segundo']} req/s), "
+          f"errores {resultado['errores']} ({resultado['error_pct']}%), "
+          f"p50 {resultado['p50_ms']} ms, p95 {resultado['p95_ms']} ms, p99 {resultado['p99_ms']} ms")
+    for nombre, s in resultado['sesiones'].items():
+        print(f"  {nombre}: {s['completas']} completas, {s['fallidas']} fallidas, "
+              f"duración p50 {s['p50_s']} s, p95 {s['p95_s']} s")
+
+
+# ========== SERVIDOR LOCAL (--iniciar) ==========
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(base, hilos, directorio):
+    """Waitress en un proceso aparte (ARATRACK_THREADS=hilos) sobre `base`. Retorna (proceso, url)"""
+    puerto = _puerto_libre()
+    entorno = dict(os.environ, ARATRACK_THREADS=str(hilos))
+    entorno.pop('ARATRACK_DB_POOL_SIZE', None)  # que el pool acompañe a los hilos (threads + 4)
+    log = open(os.path.join(directorio, f'servidor_{hilos}_hilos.log'), 'w', encoding='utf-8')
+    proceso = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--servir', base, '--puerto', str(puerto)],
+                               stdout=log, stderr=subprocess.STDOUT, env=entorno)
+    log.close()
+    url = f'http://127.0.0.1:{puerto}'
+    limite = time.monotonic() + ESPERA_SERVIDOR
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise SystemExit(f'El servidor terminó al iniciar (ver {log.name})')
+        try:
+            with socket.create_connection(('127.0.0.1', puerto), timeout=1):
+                return proceso, url
+        except OSError:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise SystemExit(f'El servidor no respondió en {ESPERA_SERVIDOR} s (ver {log.name})')
+
+
+def detener_servidor(proceso):
+    proceso.terminate()
+    try:
+        proceso.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+        proceso.wait()
+
+
+def servir(base, puerto):
+    """Proceso hijo de --iniciar: la app sobre `base` con los hilos de ARATRACK_THREADS"""
+    config.db_path = base
+    from waitress import serve
+    from app_web import app
+    print(f"[Carga] Waitress en 127.0.0.1:{puerto} con {config.threads} hilos sobre {base}")
+    serve(app, host='127.0.0.1', port=puerto, threads=config.threads)
+
+
+def recomendar(corridas):
+    """Menor cantidad de hilos sin errores cuyo p95 está dentro de TOLERANCIA_P95 del mejor"""
+    sin_errores = [c for c in corridas if not c['errores']]
+    if not sin_errores:
+        return None
+    mejor = min(c['p95_ms'] for c in sin_errores)
+    return min(c['hilos'] for c in sin_errores if c['p95_ms'] <= mejor * (1 + TOLERANCIA_P95))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prueba de carga con sesiones de nuevo viaje y editar viaje')
+    destino = parser.add_mutually_exclusive_group()
+    destino.add_argument('--url', default='http://localhost:5000', help='Servidor ya levantado')
+    destino.add_argument('--iniciar', action='store_true', help='Levantar Waitress sobre una copia de la base')
+    parser.add_argument('--threads', type=int, nargs='+', default=[config.threads],
+                        help='Con --iniciar: hilos de Waitress a comparar (una corrida por valor)')
+    parser.add_argument('--base', default=config.get_db_path(), help='Con --iniciar: base a copiar')
+    parser.add_argument('--usuarios', type=int, default=10, help='Usuarios virtuales concurrentes')
+    parser.add_argument('--duracion', type=float, default=60, help='Segundos de carga (sin contar la rampa)')
+    parser.add_argument('--rampa', type=float, default=10, help='Segundos en que se van sumando los usuarios')
+    parser.add_argument('--pausa', type=float, default=1.0, help='Pausa media del operador entre pasos (s)')
+    parser.add_argument('--escenarios', nargs='+', choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument('--pdf', choices=['pantalla', 'api'], default='pantalla',
+                        help='PDF como generar_pdf.html (/pdf/viaje) o por POST /api/generar-pdf')
+    parser.add_argument('--usuario', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--directorio', default=DIRECTORIO, help='Copia de la base y logs del servidor')
+    parser.add_argument('--salida', help='Archivo JSON de resultados')
+    parser.add_argument('--servir', help=argparse.SUPPRESS)
+    parser.add_argument('--puerto', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servir:
+        servir(args.servir, args.puerto)
+        sys.exit(0)
+
+    parametros = dict(usuarios=args.usuarios, duracion=args.duracion, rampa=args.rampa, pausa=args.pausa,
+                      escenarios=args.escenarios, usuario=args.usuario, password=args.password, pdf=args.pdf,
+                      semilla=args.semilla)
+    corridas = []
+    if args.iniciar:
+        import backup_manager
+        os.makedirs(args.directorio, exist_ok=True)
+        copia = os.path.join(args.directorio, 'viajes_carga.db')
+        # El -wal de la corrida anterior no corresponde a la copia nueva: SQLite la daría por corrupta
+        for sufijo in ('-wal', '-shm'):
+            if os.path.exists(copia + sufijo):
+                os.remove(copia + sufijo)
+        backup_manager.copiar_base(args.base, copia)
+        print(f"[Carga] Base copiada: {args.base} -> {copia}")
+        for hilos in args.threads:
+            proceso, url = iniciar_servidor(copia, hilos, args.directorio)
+            print(f"\n[Carga] {hilos} hilos: {args.usuarios} usuarios durante {args.duracion:.0f} s en {url}")
+            try:
+                resultado = ejecutar(url, pdfs_locales=True, **parametros)
+            finally:
+                detener_servidor(proceso)
+            resultado['hilos'] = hilos
+            imprimir_informe(resultado)
+            corridas.append(resultado)
+    else:
+        print(f"[Carga] {args.usuarios} usuarios durante {args.duracion:.0f} s en {args.url}")
+        resultado = ejecutar(args.url, **parametros)
+        resultado['hilos'] = None
+        imprimir_informe(resultado)
+        corridas.append(resultado)
+
+    if len(corridas) > 1:
+        print(f"\n{'hilos':>6} {'req/s':>8} {'err %':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for c in corridas:
+            print(f"{c['hilos']:>6} {c['requests_por_segundo']:>8.2f} {c['error_pct']:>6.2f} "
+                  f"{c['p50_ms']:>8.1f} {c['p95_ms']:>8.1f} {c['p99_ms']:>8.1f}")
+        sugerido = recomendar(corridas)
+        if sugerido:
+            print(f"\nARATRACK_THREADS={sugerido}: la menor cantidad sin errores con p95 a menos de "
+                  f"{TOLERANCIA_P95:.0%} del mejor para {args.usuarios} usuarios")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            guardados = {clave: valor for clave, valor in parametros.items() if clave != 'password'}
+            json.dump({'fecha': datetime.now().isoformat(timespec='seconds'), 'parametros': guardados,
+                       'corridas': corridas}, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados: {args.salida}")
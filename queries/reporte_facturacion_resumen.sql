@@ -0,0 +1,20 @@
+-- Reporte Resumen de Facturación por Casino y Día
+-- Totales de activos por fecha y casino leídos desde el rollup diario
+-- (viajes_rollup_diario, mantenido por triggers sobre viajes)
+-- Parámetros: fecha_inicio, fecha_fin
+-- Formato esperado: 'YYYY-MM-DD'
+
+SELECT 
+    fecha,
+    casino,
+    SUM(bitacoras) AS bitacoras,
+    SUM(num_wencos) AS num_wencos,
+    SUM(bin) AS bin,
+    SUM(pallets) AS pallets,
+    SUM(pallets_chep) AS pallets_chep,
+    SUM(pallets_pl_negro_grueso) AS pallets_pl_negro_grueso,
+    SUM(pallets_pl_negro_alternativo) AS pallets_pl_negro_alternativo
+FROM viajes_rollup_diario
+WHERE fecha BETWEEN ? AND ?
+GROUP BY fecha, casino
+ORDER BY fecha, casino
@@ -8,4 +8,5 @@ SELECT
     casino,
     ruta
 FROM maestras_casinos
+WHERE activo = 1
 ORDER BY codigo_costo ASC
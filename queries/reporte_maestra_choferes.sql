@@ -8,4 +8,5 @@ SELECT
     rut,
     celular
 FROM maestras_choferes
+WHERE activo = 1
 ORDER BY nombre ASC
@@ -0,0 +1,180 @@
+"""
+Registro de las queries SQL de reportes (carpeta queries/)
+Cada archivo se lee y se limpia UNA vez; solo se vuelve a leer cuando cambia
+su fecha de modificación. Como el texto SQL es siempre el mismo objeto, el
+caché de sentencias de sqlite3 reutiliza la sentencia preparada.
+
+Metadatos de cada query: descripción y nombres de parámetros (tomados de los
+comentarios del archivo), cantidad de parámetros, columnas de salida (de
+cursor.description) y nombre de archivo por defecto para las descargas.
+"""
+import os
+import re
+import threading
+
+CARPETA_QUERIES = os.path.join(os.path.dirname(__file__), 'queries')
+
+# "-- Parámetros: fecha_inicio, fecha_fin" / "-- Parámetros: fecha (un solo día)"
+_PATRON_PARAMETROS = re.compile(r'^--\s*Par[áa]metros\s*:\s*(.+)$', re.IGNORECASE)
+
+
+def _limpiar_sql(contenido):
+    """Eliminar líneas de comentario (--) y espacios sobrantes"""
+    lineas = [linea for linea in contenido.split('\n') if not linea.strip().startswith('--')]
+    return '\n'.join(lineas).strip()
+
+
+def contar_parametros(sql):
+    """Cantidad de placeholders ? fuera de literales y comentarios"""
+    total = 0
+    i = 0
+    largo = len(sql)
+    while i < largo:
+        c = sql[i]
+        if c in ("'", '"'):
+            # Literal: avanzar hasta la comilla de cierre ('' escapa una comilla)
+            i += 1
+            while i < largo:
+                if sql[i] == c:
+                    if i + 1 < largo and sql[i + 1] == c:
+                        i += 2
+                        continue
+                    break
+                i += 1
+        elif sql.startswith('--', i):
+            fin = sql.find('\n', i)
+            i = largo if fin == -1 else fin
+        elif c == '?':
+            total += 1
+        i += 1
+    return total
+
+
+class ConsultaRegistrada:
+    """Una query de queries/ con su texto limpio y metadatos"""
+
+    def __init__(self, nombre, ruta):
+        self.nombre = nombre
+        self.ruta = ruta
+        self.archivo = os.path.basename(ruta)
+        self.mtime = None
+        self.sql = ''
+        self.descripcion = ''
+        self.parametros = []
+        self.num_parametros = 0
+        self._columnas = None
+        self.cargar()
+
+    @property
+    def nombre_descarga(self):
+        """Nombre base para archivos descargados: viajes_completos -> Viajes_Completos"""
+        return '_'.join(parte.capitalize() for parte in self.nombre.split('_'))
+
+    def cargar(self):
+        """Leer el archivo y recalcular metadatos"""
+        with open(self.ruta, 'r', encoding='utf-8') as f:
+            contenido = f.read()
+        self.mtime = os.path.getmtime(self.ruta)
+
+        comentarios = [linea.strip() for linea in contenido.split('\n') if linea.strip().startswith('--')]
+        self.sql = _limpiar_sql(contenido)
+        self.descripcion = comentarios[0].lstrip('-').strip() if comentarios else self.nombre
+        self.num_parametros = contar_parametros(self.sql)
+
+        nombres = []
+        for linea in comentarios:
+            m = _PATRON_PARAMETROS.match(linea)
+            if m:
+                nombres = [p.strip().split()[0] for p in m.group(1).split(',') if p.strip()]
+                break
+        if len(nombres) != self.num_parametros:
+            if nombres or self.num_parametros:
+                print(f"[Queries] {self.archivo}: los comentarios declaran {len(nombres)} parámetros "
+                      f"y la query usa {self.num_parametros}")
+            nombres = [f'param{i}' for i in range(1, self.num_parametros + 1)]
+        self.parametros = nombres
+        self._columnas = None
+
+    def esta_desactualizada(self):
+        try:
+            return os.path.getmtime(self.ruta) != self.mtime
+        except OSError:
+            return False
+
+    def columnas(self, conn):
+        """Nombres de columnas de salida (se calculan una vez con LIMIT 0)"""
+        if self._columnas is None:
+            cursor = conn.execute(f'SELECT * FROM ({self.sql}) LIMIT 0', [None] * self.num_parametros)
+            self._columnas = [d[0] for d in cursor.description]
+        return self._columnas
+
+    def metadatos(self, conn=None):
+        datos = {
+            'nombre': self.nombre,
+            'archivo': self.archivo,
+            'descripcion': self.descripcion,
+            'parametros': self.parametros,
+            'num_parametros': self.num_parametros,
+            'nombre_descarga': self.nombre_descarga
+        }
+        if conn is not None:
+            datos['columnas'] = self.columnas(conn)
+        return datos
+
+
+class RegistroQueries:
+    """Registro de todas las queries de la carpeta, con recarga por mtime"""
+
+    def __init__(self, carpeta=CARPETA_QUERIES):
+        self.carpeta = carpeta
+        self._lock = threading.Lock()
+        self._consultas = {}
+        self.recargar()
+
+    @staticmethod
+    def nombre_de_archivo(archivo):
+        """reporte_viajes_completos.sql -> viajes_completos"""
+        nombre = os.path.splitext(archivo)[0]
+        return nombre[len('reporte_'):] if nombre.startswith('reporte_') else nombre
+
+    def recargar(self):
+        """Registrar archivos nuevos, releer los modificados y quitar los eliminados"""
+        archivos = {
+            self.nombre_de_archivo(archivo): os.path.join(self.carpeta, archivo)
+            for archivo in sorted(os.listdir(self.carpeta)) if archivo.endswith('.sql')
+        }
+        with self._lock:
+            for nombre in list(self._consultas):
+                if nombre not in archivos:
+                    del self._consultas[nombre]
+            for nombre, ruta in archivos.items():
+                consulta = self._consultas.get(nombre)
+                if consulta is None:
+                    self._consultas[nombre] = ConsultaRegistrada(nombre, ruta)
+                elif consulta.esta_desactualizada():
+                    consulta.cargar()
+                    print(f"[Queries] {consulta.archivo} recargada")
+
+    def obtener(self, nombre):
+        """ConsultaRegistrada por nombre (viajes_completos) o archivo (reporte_viajes_completos.sql)"""
+        if nombre.endswith('.sql'):
+            nombre = self.nombre_de_archivo(nombre)
+        if not self.existe(nombre):
+            # Puede ser un archivo agregado después del arranque
+            self.recargar()
+        with self._lock:
+            consulta = self._consultas.get(nombre)
+            if consulta is None:
+                raise KeyError(nombre)
+            if consulta.esta_desactualizada():
+                consulta.cargar()
+                print(f"[Queries] {consulta.archivo} recargada")
+            return consulta
+
+    def existe(self, nombre):
+        with self._lock:
+            return nombre in self._consultas
+
+    def listar(self):
+        with self._lock:
+            return [self._consultas[nombre] for nombre in sorted(self._consultas)]
@@ -1,65 +1,162 @@
 import sqlite3
+import uuid
+import numpy as np
+import openpyxl
 import pandas as pd
 from datetime import datetime
 from config import config
+import db_pool
+from escritor_db import escritor_db
 
 def obtener_conexion():
-    """Obtiene una conexión a la base de datos configurada"""
-    conn = sqlite3.connect(config.get_db_path())
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Obtiene una conexión del pool compartido (transaccional, filas como sqlite3.Row)"""
+    return db_pool.obtener_conexion(config.get_db_path(), row_factory=sqlite3.Row, isolation_level='')
 
-def cargar_rendiciones_desde_excel(file_path):
+# Columnas obligatorias del Excel de rendiciones
+COLUMNAS_EXCEL = ('NRO_VIAJE', 'PDT', 'RUTA')
+
+# Límite (exclusivo) de INTEGER en SQLite
+LIMITE_INTEGER = 2 ** 63
+
+# Filas del Excel que se validan y pasan a rendiciones_carga juntas (acota la memoria de la carga)
+FILAS_POR_BLOQUE = 5000
+
+# Cargas que quedaron a medias en rendiciones_carga (proceso cortado) se borran pasado este plazo
+EXPIRACION_CARGA = '-1 day'
+
+def _columna_texto(serie):
+    """Columna como texto (igual que str(valor)) con None en las celdas vacías"""
+    return serie.astype(str).astype(object).where(serie.notna(), None)
+
+def _guardar_bloque(cursor, carga, filas):
+    """Bloque validado de (nro_viaje, pdt, ruta) a rendiciones_carga, en un solo executemany"""
+    cursor.executemany('''
+        INSERT INTO rendiciones_carga (carga, nro_viaje, pdt, ruta)
+        VALUES (?, ?, ?, ?)
+    ''', [(carga,) + fila for fila in filas])
+
+def _confirmar_carga(cursor, carga):
     """
-    Carga rendiciones desde un archivo Excel.
-    Retorna: dict con success, registros_cargados, duplicados_omitidos, errores
+    Pasar la carga completa a rendiciones con un INSERT OR IGNORE (en orden de
+    fila: ante un nro_viaje repetido queda el primero) y borrarla de
+    rendiciones_carga junto con las cargas abandonadas. Retorna filas insertadas.
     """
+    cursor.execute('''
+        INSERT OR IGNORE INTO rendiciones (nro_viaje, pdt, ruta)
+        SELECT nro_viaje, pdt, ruta FROM rendiciones_carga
+        WHERE carga = ?
+        ORDER BY id
+    ''', (carga,))
+    insertadas = cursor.rowcount
+    _descartar_carga(cursor, carga)
+    return insertadas
+
+def _descartar_carga(cursor, carga):
+    """Borrar las filas de una carga (fallida o ya confirmada) y las de cargas abandonadas"""
+    cursor.execute('''
+        DELETE FROM rendiciones_carga
+        WHERE carga = ? OR fecha_creacion < datetime('now', ?)
+    ''', (carga, EXPIRACION_CARGA))
+
+def _leer_bloques(archivo, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Recorrer la primera hoja con openpyxl en modo read_only (sin cargar el libro
+    completo). Genera (fila_excel_inicial, DataFrame) por bloque de filas, con
+    todas las columnas como object (cada valor tal como viene de la celda).
+    """
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
     try:
-        # Leer Excel
-        df = pd.read_excel(file_path, engine='openpyxl')
-        
-        conn = obtener_conexion()
-        cursor = conn.cursor()
-        
-        registros_cargados = 0
-        duplicados_omitidos = 0
-        errores = []
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+        columnas = [str(c) if c is not None else f'Unnamed: {i}' for i, c in enumerate(encabezado)]
+        ancho = len(columnas)
         
-        for index, row in df.iterrows():
-            try:
-                nro_viaje = int(row['NRO_VIAJE']) if pd.notna(row['NRO_VIAJE']) else None
-                pdt = str(row['PDT']) if pd.notna(row['PDT']) else None
-                ruta = str(row['RUTA']) if pd.notna(row['RUTA']) else None
-                
-                if nro_viaje is None:
-                    errores.append(f"Fila {index + 2}: NRO_VIAJE vacío")
-                    continue
-                
-                # Intentar insertar (sin rendicion_valor)
-                cursor.execute('''
-                    INSERT INTO rendiciones (nro_viaje, pdt, ruta)
-                    VALUES (?, ?, ?)
-                ''', (nro_viaje, pdt, ruta))
-                
-                registros_cargados += 1
-                
-            except sqlite3.IntegrityError:
-                # Viaje duplicado
-                duplicados_omitidos += 1
-            except Exception as e:
-                errores.append(f"Fila {index + 2}: {str(e)}")
+        bloque = []
+        inicio = 2
+        vacias = 0
+        for fila in filas:
+            # Las filas vacías solo cuentan si después viene otra con datos (igual que pandas)
+            if all(valor is None for valor in fila):
+                vacias += 1
+                continue
+            for _ in range(vacias):
+                bloque.append((None,) * ancho)
+            vacias = 0
+            bloque.append(tuple(fila[:ancho]) + (None,) * (ancho - len(fila)))
+            
+            if len(bloque) >= filas_por_bloque:
+                yield inicio, pd.DataFrame(bloque, columns=columnas, dtype=object)
+                inicio += len(bloque)
+                bloque = []
+        if bloque:
+            yield inicio, pd.DataFrame(bloque, columns=columnas, dtype=object)
+    finally:
+        libro.close()
+
+def _validar_bloque(df, fila_inicial, errores):
+    """Validar un bloque. Retorna las filas válidas como (nro_viaje, pdt, ruta)."""
+    faltantes = [columna for columna in COLUMNAS_EXCEL if columna not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el Excel: {', '.join(faltantes)}")
+    
+    filas_excel = pd.Series(range(fila_inicial, fila_inicial + len(df)), index=df.index)
+    
+    # NRO_VIAJE: vacío o no numérico es error de la fila; decimales se truncan como int()
+    vacios = df['NRO_VIAJE'].isna()
+    for fila in filas_excel[vacios]:
+        errores[fila] = f"Fila {fila}: NRO_VIAJE vacío"
+    numeros = pd.to_numeric(df['NRO_VIAJE'], errors='coerce').astype('float64')
+    validos = numeros.notna() & np.isfinite(numeros) & (numeros.abs() < LIMITE_INTEGER)
+    for fila, valor in zip(filas_excel[~vacios & ~validos], df['NRO_VIAJE'][~vacios & ~validos]):
+        errores[fila] = f"Fila {fila}: NRO_VIAJE no válido ({valor})"
+    
+    nro_viaje = numeros[validos].astype('int64')
+    pdt = _columna_texto(df['PDT'][validos])
+    ruta = _columna_texto(df['RUTA'][validos])
+    
+    return list(zip(nro_viaje.tolist(), pdt.tolist(), ruta.tolist()))
+
+def cargar_rendiciones_desde_excel(archivo):
+    """
+    Carga rendiciones desde un archivo Excel (ruta o archivo abierto, por
+    ejemplo el stream de la subida).
+    Se lee por bloques de FILAS_POR_BLOQUE filas: en cada uno las columnas se
+    validan y convierten completas (sin recorrer fila a fila) y las filas
+    válidas se escriben en rendiciones_carga bajo un id de carga, así la
+    memoria no crece con el archivo. Con el archivo completo leído, una sola
+    escritura pasa la carga a rendiciones (los nro_viaje existentes o repetidos
+    se omiten): si algo falla antes, la carga se descarta y no queda ninguna
+    fila en rendiciones.
+    Retorna: dict con success, registros_cargados, duplicados_omitidos, errores
+    """
+    carga = uuid.uuid4().hex
+    try:
+        errores = {}
+        validos = 0
+        for fila_inicial, df in _leer_bloques(archivo):
+            filas = _validar_bloque(df, fila_inicial, errores)
+            if filas:
+                escritor_db.ejecutar(_guardar_bloque, carga, filas)
+                validos += len(filas)
         
-        conn.commit()
-        conn.close()
+        registros_cargados = escritor_db.ejecutar(_confirmar_carga, carga) if validos else 0
         
         return {
             'success': True,
             'registros_cargados': registros_cargados,
-            'duplicados_omitidos': duplicados_omitidos,
-            'errores': errores
+            # Ya existentes, repetidos en el archivo o cargados por otro usuario mientras tanto
+            'duplicados_omitidos': validos - registros_cargados,
+            'errores': [errores[fila] for fila in sorted(errores)]
         }
         
     except Exception as e:
+        # Nada llegó a rendiciones: descartar lo que quedó en rendiciones_carga
+        try:
+            escritor_db.ejecutar(_descartar_carga, carga)
+        except Exception as e_descarte:
+            print(f"[Rendiciones] No se pudo descartar la carga {carga}: {e_descarte}")
         return {
             'success': False,
             'error': str(e),
@@ -113,6 +210,24 @@ def obtener_rendiciones(filtro='activas'):
     
     return rendiciones
 
+def _actualizar_estado(cursor, nro_viaje, nuevo_estado):
+    """Escritura encolada: cambiar el estado de rendición. Retorna filas actualizadas."""
+    cursor.execute('''
+        UPDATE rendiciones
+        SET estado_rendicion = ?,
+            fecha_modificacion = CURRENT_TIMESTAMP
+        WHERE nro_viaje = ?
+    ''', (nuevo_estado, nro_viaje))
+    return cursor.rowcount
+
+def _eliminar_rendicion(cursor, nro_viaje):
+    """Escritura encolada: borrar una rendición. Retorna filas borradas."""
+    cursor.execute('''
+        DELETE FROM rendiciones
+        WHERE nro_viaje = ?
+    ''', (nro_viaje,))
+    return cursor.rowcount
+
 def actualizar_estado_rendicion(nro_viaje, nuevo_estado):
     """
     Actualiza el estado de rendición de un viaje.
@@ -122,23 +237,9 @@ def actualizar_estado_rendicion(nro_viaje, nuevo_estado):
         if nuevo_estado not in ['SI', 'NO', 'SIN REVISAR']:
             return {'success': False, 'error': 'Estado inválido'}
         
-        conn = obtener_conexion()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE rendiciones
-            SET estado_rendicion = ?,
-                fecha_modificacion = CURRENT_TIMESTAMP
-            WHERE nro_viaje = ?
-        ''', (nuevo_estado, nro_viaje))
-        
-        if cursor.rowcount == 0:
-            conn.close()
+        if escritor_db.ejecutar(_actualizar_estado, nro_viaje, nuevo_estado) == 0:
             return {'success': False, 'error': 'Viaje no encontrado'}
         
-        conn.commit()
-        conn.close()
-        
         return {'success': True, 'message': f'Estado actualizado a {nuevo_estado}'}
         
     except Exception as e:
@@ -149,21 +250,9 @@ def eliminar_rendicion(nro_viaje):
     Elimina una rendición de la base de datos.
     """
     try:
-        conn = obtener_conexion()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM rendiciones
-            WHERE nro_viaje = ?
-        ''', (nro_viaje,))
-        
-        if cursor.rowcount == 0:
-            conn.close()
+        if escritor_db.ejecutar(_eliminar_rendicion, nro_viaje) == 0:
             return {'success': False, 'message': 'Rendición no encontrada'}
         
-        conn.commit()
-        conn.close()
-        
         return {'success': True, 'message': 'Rendición eliminada correctamente'}
         
     except Exception as e:
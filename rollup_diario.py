@@ -0,0 +1,280 @@
+"""
+Rollup diario materializado de viajes
+- viajes_rollup_diario: una fila por (fecha, administrativo_responsable, casino)
+  con conteos de checks, wencos, bin y los cuatro tipos de pallets ya sumados.
+- viajes_rollup_numeros: una fila por (fecha, administrativo_responsable,
+  numero_viaje) con la cantidad de bitácoras. Los viajes distintos no se pueden
+  sumar entre grupos, así que el dashboard los cuenta con COUNT(DISTINCT) sobre
+  esta tabla (del orden de una fila por viaje, no por centro de costo).
+
+Las tablas se mantienen al día con triggers sobre viajes (ver migraciones.py,
+v4 y v8), de modo que guardar_viaje_con_comidas, actualizar_viaje_con_comidas
+y todos los caminos de eliminación las actualizan en la misma transacción que
+la escritura.
+
+Uso:
+    python rollup_diario.py --reconstruir  -> recalcula el rollup desde viajes
+    python rollup_diario.py --verificar    -> compara el rollup con los datos crudos
+"""
+import sys
+from config import config
+from db_pool import obtener_conexion
+
+TABLA_ROLLUP = 'viajes_rollup_diario'
+
+# Columnas de medidas del rollup y su expresión por fila de viajes (sin prefijo)
+MEDIDAS = [
+    ('bitacoras', "1"),
+    ('check_congelado', "CASE WHEN {p}check_congelado = 'X' THEN 1 ELSE 0 END"),
+    ('check_refrigerado', "CASE WHEN {p}check_refrigerado = 'X' THEN 1 ELSE 0 END"),
+    ('check_abarrote', "CASE WHEN {p}check_abarrote = 'X' THEN 1 ELSE 0 END"),
+    ('check_implementos', "CASE WHEN {p}check_implementos = 'X' THEN 1 ELSE 0 END"),
+    ('check_aseo', "CASE WHEN {p}check_aseo = 'X' THEN 1 ELSE 0 END"),
+    ('check_trazabilidad', "CASE WHEN {p}check_trazabilidad = 'X' THEN 1 ELSE 0 END"),
+    ('num_wencos', "CAST(COALESCE({p}num_wencos, '0') AS INTEGER)"),
+    ('bin', "CAST(COALESCE({p}bin, '0') AS INTEGER)"),
+    ('pallets', "CAST(COALESCE({p}pallets, '0') AS INTEGER)"),
+    ('pallets_chep', "CAST(COALESCE({p}pallets_chep, '0') AS INTEGER)"),
+    ('pallets_pl_negro_grueso', "CAST(COALESCE({p}pallets_pl_negro_grueso, '0') AS INTEGER)"),
+    ('pallets_pl_negro_alternativo', "CAST(COALESCE({p}pallets_pl_negro_alternativo, '0') AS INTEGER)"),
+]
+
+COLUMNAS_MEDIDAS = [nombre for nombre, _ in MEDIDAS]
+
+# Columnas de viajes cuyo cambio afecta al rollup
+COLUMNAS_ORIGEN = [
+    'fecha', 'administrativo_responsable', 'casino',
+    'check_congelado', 'check_refrigerado', 'check_abarrote', 'check_implementos',
+    'check_aseo', 'check_trazabilidad', 'num_wencos', 'bin', 'pallets', 'pallets_chep',
+    'pallets_pl_negro_grueso', 'pallets_pl_negro_alternativo'
+]
+
+SQL_CREAR_TABLA = f'''
+    CREATE TABLE IF NOT EXISTS {TABLA_ROLLUP} (
+        fecha TEXT,
+        administrativo_responsable TEXT,
+        casino TEXT,
+        {', '.join(f'{nombre} INTEGER NOT NULL DEFAULT 0' for nombre in COLUMNAS_MEDIDAS)}
+    )
+'''
+
+# Sin UNIQUE: las claves pueden ser NULL y se comparan con IS
+SQL_CREAR_INDICE = f'''
+    CREATE INDEX IF NOT EXISTS idx_rollup_fecha_admin_casino
+    ON {TABLA_ROLLUP}(fecha, administrativo_responsable, casino)
+'''
+
+SQL_AGREGADO_CRUDO = f'''
+    SELECT
+        fecha, administrativo_responsable, casino,
+        {', '.join(f'SUM({expr.format(p="")})' for _, expr in MEDIDAS)}
+    FROM viajes
+    GROUP BY fecha, administrativo_responsable, casino
+'''
+
+SQL_RELLENAR = f'''
+    INSERT INTO {TABLA_ROLLUP} (fecha, administrativo_responsable, casino, {', '.join(COLUMNAS_MEDIDAS)})
+    {SQL_AGREGADO_CRUDO}
+'''
+
+
+def _sql_aplicar(fila, signo):
+    """Sentencias de trigger que suman (signo '+') o restan (signo '-') la fila NEW/OLD"""
+    p = f'{fila}.'
+    clave = (f'fecha IS {p}fecha AND administrativo_responsable IS {p}administrativo_responsable '
+             f'AND casino IS {p}casino')
+    sentencias = []
+    if signo == '+':
+        sentencias.append(
+            f'INSERT INTO {TABLA_ROLLUP} (fecha, administrativo_responsable, casino) '
+            f'SELECT {p}fecha, {p}administrativo_responsable, {p}casino '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {TABLA_ROLLUP} WHERE {clave});'
+        )
+    asignaciones = ', '.join(f'{nombre} = {nombre} {signo} ({expr.format(p=p)})' for nombre, expr in MEDIDAS)
+    sentencias.append(f'UPDATE {TABLA_ROLLUP} SET {asignaciones} WHERE {clave};')
+    if signo == '-':
+        sentencias.append(f'DELETE FROM {TABLA_ROLLUP} WHERE {clave} AND bitacoras <= 0;')
+    return '\n'.join(sentencias)
+
+
+SQL_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_viajes_insert AFTER INSERT ON viajes
+        BEGIN
+        {_sql_aplicar('NEW', '+')}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_viajes_update
+        AFTER UPDATE OF {', '.join(COLUMNAS_ORIGEN)} ON viajes
+        BEGIN
+        {_sql_aplicar('OLD', '-')}
+        {_sql_aplicar('NEW', '+')}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_viajes_delete AFTER DELETE ON viajes
+        BEGIN
+        {_sql_aplicar('OLD', '-')}
+        END''',
+]
+
+# Sentencias para la migración que crea el rollup
+SENTENCIAS_MIGRACION = [SQL_CREAR_TABLA, SQL_CREAR_INDICE] + SQL_TRIGGERS + [SQL_RELLENAR]
+
+
+# ========== VIAJES POR DÍA Y ADMINISTRATIVO ==========
+
+TABLA_NUMEROS = 'viajes_rollup_numeros'
+
+SQL_CREAR_TABLA_NUMEROS = f'''
+    CREATE TABLE IF NOT EXISTS {TABLA_NUMEROS} (
+        fecha TEXT,
+        administrativo_responsable TEXT,
+        numero_viaje TEXT,
+        bitacoras INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+SQL_CREAR_INDICE_NUMEROS = f'''
+    CREATE INDEX IF NOT EXISTS idx_rollup_numeros_fecha_admin
+    ON {TABLA_NUMEROS}(fecha, administrativo_responsable, numero_viaje)
+'''
+
+# Dashboard filtrado por administrativo (igual que idx_viajes_admin_fecha sobre viajes)
+SQL_CREAR_INDICE_ADMIN = f'''
+    CREATE INDEX IF NOT EXISTS idx_rollup_admin_fecha
+    ON {TABLA_ROLLUP}(administrativo_responsable, fecha)
+'''
+
+SQL_CREAR_INDICE_NUMEROS_ADMIN = f'''
+    CREATE INDEX IF NOT EXISTS idx_rollup_numeros_admin_fecha
+    ON {TABLA_NUMEROS}(administrativo_responsable, fecha, numero_viaje)
+'''
+
+SQL_AGREGADO_CRUDO_NUMEROS = '''
+    SELECT fecha, administrativo_responsable, numero_viaje, COUNT(*)
+    FROM viajes
+    GROUP BY fecha, administrativo_responsable, numero_viaje
+'''
+
+SQL_RELLENAR_NUMEROS = f'''
+    INSERT INTO {TABLA_NUMEROS} (fecha, administrativo_responsable, numero_viaje, bitacoras)
+    {SQL_AGREGADO_CRUDO_NUMEROS}
+'''
+
+
+def _sql_aplicar_numero(fila, signo):
+    """Como _sql_aplicar, para la bitácora NEW/OLD en viajes_rollup_numeros"""
+    p = f'{fila}.'
+    clave = (f'fecha IS {p}fecha AND administrativo_responsable IS {p}administrativo_responsable '
+             f'AND numero_viaje IS {p}numero_viaje')
+    sentencias = []
+    if signo == '+':
+        sentencias.append(
+            f'INSERT INTO {TABLA_NUMEROS} (fecha, administrativo_responsable, numero_viaje) '
+            f'SELECT {p}fecha, {p}administrativo_responsable, {p}numero_viaje '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {TABLA_NUMEROS} WHERE {clave});'
+        )
+    sentencias.append(f'UPDATE {TABLA_NUMEROS} SET bitacoras = bitacoras {signo} 1 WHERE {clave};')
+    if signo == '-':
+        sentencias.append(f'DELETE FROM {TABLA_NUMEROS} WHERE {clave} AND bitacoras <= 0;')
+    return '\n'.join(sentencias)
+
+
+SQL_TRIGGERS_NUMEROS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_numeros_insert AFTER INSERT ON viajes
+        BEGIN
+        {_sql_aplicar_numero('NEW', '+')}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_numeros_update
+        AFTER UPDATE OF fecha, administrativo_responsable, numero_viaje ON viajes
+        BEGIN
+        {_sql_aplicar_numero('OLD', '-')}
+        {_sql_aplicar_numero('NEW', '+')}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_rollup_numeros_delete AFTER DELETE ON viajes
+        BEGIN
+        {_sql_aplicar_numero('OLD', '-')}
+        END''',
+]
+
+# Sentencias para la migración que crea la tabla de viajes por día
+SENTENCIAS_MIGRACION_NUMEROS = ([SQL_CREAR_TABLA_NUMEROS, SQL_CREAR_INDICE_NUMEROS, SQL_CREAR_INDICE_NUMEROS_ADMIN,
+                                 SQL_CREAR_INDICE_ADMIN] + SQL_TRIGGERS_NUMEROS + [SQL_RELLENAR_NUMEROS])
+
+# (tabla, sentencia de creación, INSERT de relleno, agregado crudo, columnas) de cada rollup
+TABLAS = [
+    (TABLA_ROLLUP, SQL_CREAR_TABLA, SQL_RELLENAR, SQL_AGREGADO_CRUDO,
+     ['fecha', 'administrativo_responsable', 'casino'] + COLUMNAS_MEDIDAS),
+    (TABLA_NUMEROS, SQL_CREAR_TABLA_NUMEROS, SQL_RELLENAR_NUMEROS, SQL_AGREGADO_CRUDO_NUMEROS,
+     ['fecha', 'administrativo_responsable', 'numero_viaje', 'bitacoras']),
+]
+
+
+def reconstruir_rollup(db_path=None):
+    """Recalcular los rollups desde viajes en una sola transacción. Retorna {tabla: filas generadas}."""
+    conn = obtener_conexion(db_path or config.get_db_path())
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        filas = {}
+        for tabla, crear, rellenar, _, _ in TABLAS:
+            conn.execute(crear)
+            conn.execute(f'DELETE FROM {tabla}')
+            conn.execute(rellenar)
+            filas[tabla] = conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+        conn.execute('COMMIT')
+        return filas
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def verificar_rollup(db_path=None):
+    """
+    Comparar los rollups con el agregado de los datos crudos.
+    Retorna dict con 'ok', 'faltantes' (en crudo pero no en rollup), 'sobrantes' (al revés)
+    y 'duplicados' (claves con más de una fila en el rollup, que EXCEPT no detecta).
+    """
+    faltantes, sobrantes, duplicados = [], [], []
+    conn = obtener_conexion(db_path or config.get_db_path())
+    try:
+        for tabla, _, _, crudo, columnas in TABLAS:
+            lista = ', '.join(columnas)
+            claves = ', '.join(columnas[:3])
+            # EXCEPT compara NULLs como iguales, igual que GROUP BY
+            faltantes += conn.execute(f'{crudo} EXCEPT SELECT {lista} FROM {tabla}').fetchall()
+            sobrantes += conn.execute(f'SELECT {lista} FROM {tabla} EXCEPT {crudo}').fetchall()
+            duplicados += conn.execute(
+                f'SELECT {claves}, COUNT(*) FROM {tabla} GROUP BY {claves} HAVING COUNT(*) > 1'
+            ).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        'ok': not faltantes and not sobrantes and not duplicados,
+        'faltantes': faltantes,
+        'sobrantes': sobrantes,
+        'duplicados': duplicados
+    }
+
+
+if __name__ == '__main__':
+    if '--reconstruir' in sys.argv:
+        print("Reconstruyendo rollup diario...")
+        for tabla, filas in reconstruir_rollup().items():
+            print(f"[OK] {tabla}: {filas} filas")
+
+    if '--verificar' in sys.argv or '--reconstruir' not in sys.argv:
+        print("Verificando rollup contra viajes...")
+        resultado = verificar_rollup()
+        if resultado['ok']:
+            print("[OK] El rollup coincide con los datos crudos")
+        else:
+            print(f"[X] {len(resultado['faltantes'])} grupos faltantes/desactualizados, "
+                  f"{len(resultado['sobrantes'])} sobrantes, {len(resultado['duplicados'])} duplicados")
+            for fila in resultado['faltantes'][:20]:
+                print(f"    crudo:  {fila}")
+            for fila in resultado['sobrantes'][:20]:
+                print(f"    rollup: {fila}")
+            for fila in resultado['duplicados'][:20]:
+                print(f"    duplicado: {fila}")
+            print("Ejecuta: python rollup_diario.py --reconstruir")
+            sys.exit(1)